@@ -3,6 +3,138 @@ from threading import Lock
 from .jm_client_interface import *
 
 
+class JmRetryLoop:
+    """
+    一次 request_with_retry 的重试和域名切换状态，同步和异步版本共用，调用方只负责发请求和等待：
+
+    retry = JmRetryLoop(client, url, kwargs=kwargs)
+    while True:
+        real_url = retry.next_url()  # 所有域名都用完时返回None，调用方返回 retry.fallback(request)
+        try:
+            resp = request(real_url, **kwargs)
+            retry.record_success()
+            return resp
+        except Exception as e:
+            retry.record_failure(e)  # 不重试的异常会直接抛出
+        delay = retry.next_delay()  # 超过总耗时时返回None，同样返回 retry.fallback(request)
+        等待delay秒
+    """
+
+    def __init__(self,
+                 client: 'AbstractJmClient',
+                 url: str,
+                 domain_list: Optional[List[str]] = None,
+                 domain_index=0,
+                 retry_count=0,
+                 cancel_token: Optional[JmCancelToken] = None,
+                 kwargs: Optional[dict] = None,
+                 ):
+        """
+        :param domain_list: 按此顺序使用域名，默认为按健康度排序的 client.domain_list
+        :param kwargs: 请求方法的kwargs，每次请求前由 client.update_request_with_specify_domain 更新
+        """
+        self.client = client
+        self.url = url
+        self.policy = client.retry_policy
+        self.tracker = client.domain_health_tracker()
+        if domain_list is None:
+            domain_list = self.tracker.sort(client.domain_list) if self.tracker is not None else client.domain_list
+        self.domain_list = domain_list
+        self.domain_index = domain_index
+        self.retry_count = retry_count
+        self.cancel_token = cancel_token
+        self.kwargs = kwargs if kwargs is not None else {}
+        self.start_time = time.monotonic()
+        # 当前这次请求
+        self.domain = None
+        self.request_url = None
+        self.request_start = None
+
+    def next_url(self) -> Optional[str]:
+        """
+        检查取消令牌，返回这次请求的完整url，所有域名都用完时返回None
+
+        如果url包含了指定域名（例如图片URL），则不会切换域名
+        """
+        client = self.client
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
+
+        if self.domain_index >= len(self.domain_list):
+            return None
+
+        url = self.url
+        if url.startswith('/'):
+            # path → url
+            self.domain = self.domain_list[self.domain_index]
+            url = client.of_api_url(url, self.domain)
+
+            client.update_request_with_specify_domain(self.kwargs, self.domain)
+
+            jm_log(client.log_topic(), client.decode(url))
+        else:
+            # 图片url
+            from urllib.parse import urlparse
+            self.domain = urlparse(url).hostname
+            client.update_request_with_specify_domain(self.kwargs, None, True)
+
+        if self.domain_index != 0 or self.retry_count != 0:
+            jm_log(f'req.retry',
+                   ', '.join([
+                       f'次数: [{self.retry_count}/{client.retry_times}]',
+                       f'域名: [{self.domain_index} of {self.domain_list}]',
+                       f'路径: [{url}]',
+                       f'参数: [{self.kwargs if "login" not in url else "#login_form#"}]'
+                   ])
+                   )
+
+        self.request_url = url
+        self.request_start = time.monotonic()
+        return url
+
+    def record_success(self):
+        if self.tracker is not None:
+            self.tracker.record_success(self.domain, time.monotonic() - self.request_start)
+
+    def record_failure(self, e: Exception):
+        """
+        记录失败，不需要重试时抛出e
+        """
+        client = self.client
+        should_retry = self.policy.should_retry(e)
+        # 不重试的异常（例如本子不存在、取消下载）与域名无关，不计入失败
+        if self.tracker is not None and should_retry:
+            self.tracker.record_failure(self.domain, client.domain_prober(self.domain))
+
+        if client.retry_times == 0 or not should_retry:
+            raise e
+
+        client.before_retry(e, self.kwargs, self.retry_count, self.request_url)
+
+    def next_delay(self) -> Optional[float]:
+        """
+        决定下一次请求的域名，返回请求前要等待的秒数，超过重试总耗时返回None
+        """
+        if self.retry_count < self.client.retry_times:
+            # 同一个域名重试，等待一段时间
+            self.retry_count += 1
+            delay = self.policy.decide_backoff(self.retry_count)
+        else:
+            # 换下一个域名
+            self.domain_index += 1
+            self.retry_count = 0
+            delay = 0
+
+        if self.policy.is_out_of_time(self.start_time, delay):
+            jm_log('req.retry', f'重试总耗时超过{self.policy.max_total_time}秒，不再重试')
+            return None
+
+        return delay
+
+    def fallback(self, request):
+        return self.client.fallback(request, self.url, self.domain_index, self.retry_count, **self.kwargs)
+
+
 # 抽象基类，实现了域名管理，发请求，重试机制，log，缓存等功能
 class AbstractJmClient(
     JmcomicClient,
@@ -10,11 +142,17 @@ class AbstractJmClient(
 ):
     client_key = '__just_for_placeholder_do_not_use_me__'
     func_to_cache = []
+    # 正在请求中的缓存方法调用，(id(缓存), key) → Future，见 enable_cache
+    CACHE_INFLIGHT: Dict[tuple, Any] = {}
+    CACHE_INFLIGHT_LOCK = Lock()
+    # 发起请求的调用被取消时交给等待者的结果，表示需要重新调用
+    CACHE_INFLIGHT_CANCELLED = object()
 
     def __init__(self,
                  postman: Postman,
                  domain_list: List[str],
                  retry_times=0,
+                 retry_policy: Optional[JmRetryPolicy] = None,
                  ):
         """
         创建JM客户端
@@ -22,23 +160,93 @@ class AbstractJmClient(
         :param postman: 负责实现HTTP请求的对象，持有cookies、headers、proxies等信息
         :param domain_list: 禁漫域名
         :param retry_times: 重试次数
+        :param retry_policy: 重试的等待时间、总耗时、哪些异常不重试，默认为 JmRetryPolicy()
         """
         super().__init__(postman)
         self.retry_times = retry_times
+        self.retry_policy = retry_policy or JmRetryPolicy()
         self.domain_list = domain_list
+        # 取消令牌，由downloader设置，取消后不再发起新的请求和重试
+        self.cancel_token: Optional[JmCancelToken] = None
         self.CLIENT_CACHE = None
         self._username = None  # help for favorite_folder method
         self.enable_cache()
         self.after_init()
 
+        if JmModuleConfig.FLAG_CLIENT_PROBE_DOMAIN:
+            self.domain_list = self.probe_domains()
+
     def after_init(self):
         pass
 
+    def probe_domains(self, domain_list: Optional[List[str]] = None, force=False) -> List[str]:
+        """
+        并行探测域名，把耗时和成败记录到 JmDomainHealthTracker，返回按健康度排序的域名列表
+
+        :param domain_list: 要探测的域名，默认为 self.domain_list
+        :param force: 是否探测已有统计数据的域名
+        """
+        domain_list = list(domain_list if domain_list is not None else self.domain_list)
+        tracker = JmModuleConfig.domain_health_tracker()
+        to_probe = [domain for domain in domain_list if force or not tracker.is_known(domain)]
+
+        def probe(domain):
+            start = time.monotonic()
+            try:
+                self.domain_prober(domain)()
+            except Exception as e:
+                jm_log('domain.probe', f'域名探测失败: {domain}, {e}')
+                tracker.record_failure(domain)
+                return
+            tracker.record_success(domain, time.monotonic() - start)
+
+        from threading import Thread
+        threads = [Thread(target=probe, args=(domain,), daemon=True) for domain in to_probe]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ranked = tracker.sort(domain_list)
+        if len(to_probe) != 0:
+            jm_log('domain.probe', f'域名探测完成，排序结果: {ranked}')
+        return ranked
+
     def get(self, url, **kwargs):
-        return self.request_with_retry(self.postman.get, url, **kwargs)
+        return self.request_with_retry(self.rate_limited(self.postman.get, url), url, **kwargs)
 
     def post(self, url, **kwargs):
-        return self.request_with_retry(self.postman.post, url, **kwargs)
+        return self.request_with_retry(self.rate_limited(self.postman.post, url), url, **kwargs)
+
+    # noinspection PyMethodMayBeStatic
+    def rate_limited(self, request, url):
+        """
+        包装请求方法，使每次请求（包括重试）都经过 JmModuleConfig.REGISTRY_RATE_LIMITER 中的限速器
+
+        以'/'开头的path是接口请求，完整url是图片请求
+        """
+        category = JmRateLimiter.CATEGORY_API if url.startswith('/') else JmRateLimiter.CATEGORY_IMAGE
+
+        def limited_request(real_url, **kwargs):
+            limiters = JmRateLimiter.decide_limiters(category, real_url)
+            if len(limiters) == 0:
+                return request(real_url, **kwargs)
+
+            for limiter in limiters:
+                limiter.before_request()
+
+            resp = request(real_url, **kwargs)
+
+            if kwargs.get('stream', False) or kwargs.get('content_callback', None) is not None:
+                # 流式响应不能读取content（会把数据全部读入内存），按Content-Length计算
+                size = int(resp.headers.get('Content-Length', None) or 0)
+            else:
+                size = len(getattr(resp, 'content', None) or b'')
+            for limiter in limiters:
+                limiter.after_response(size)
+            return resp
+
+        return limited_request
 
     def of_api_url(self, api_path, domain):
         return JmcomicText.format_url(api_path, domain)
@@ -55,12 +263,54 @@ class AbstractJmClient(
 
         return self.get(img_url, callback=callback, headers=JmModuleConfig.new_html_headers())
 
+    def get_jm_image_stream(self, img_url, img_save_path) -> JmStreamImageResp:
+        """
+        流式下载图片到文件
+
+        curl_cffi使用content_callback在请求线程中边收边写（curl_cffi的stream=True会把请求放进一个线程数很少的线程池），
+        其他postman使用stream=True
+        """
+        writer = JmPartFileWriter(img_save_path)
+        request = self.rate_limited(self.postman.get, img_url)
+        use_content_callback = self.is_curl_cffi_postman()
+
+        def stream_request(url, **kwargs):
+            # 每次请求（包括重试）都重新写文件
+            writer.open()
+            if use_content_callback:
+                kwargs['content_callback'] = writer.write
+            else:
+                kwargs['stream'] = True
+            return request(url, **kwargs)
+
+        def callback(resp):
+            """
+            写文件失败或数据为空时，走重试逻辑
+            """
+            resp = JmStreamImageResp(resp, writer)
+            resp.save()
+            return resp
+
+        try:
+            return self.request_with_retry(stream_request, img_url, callback=callback,
+                                           headers=JmModuleConfig.new_html_headers())
+        finally:
+            writer.discard()
+
+    def is_curl_cffi_postman(self) -> bool:
+        root = self.postman.get_root_postman()
+        key = getattr(root, 'session_type', None) or getattr(root, 'postman_key', '')
+        return key.startswith('curl_cffi')
+
     def request_with_retry(self,
                            request,
                            url,
                            domain_index=0,
                            retry_count=0,
                            callback=None,
+                           domain_list=None,
+                           hedge=False,
+                           cancel_token=None,
                            **kwargs,
                            ):
         """
@@ -70,61 +320,130 @@ class AbstractJmClient(
 
         如果需要拿到域名进行回调处理，可以重写 self.update_request_with_specify_domain 方法，例如更新headers
 
+        开启 JmModuleConfig.FLAG_ENABLE_DOMAIN_HEALTH_ROUTING 时，每次请求按域名健康度决定域名顺序，
+        并记录每个域名（包括图片域名）的耗时和成败，见 JmDomainHealthTracker
+
         :param request: 请求方法
         :param url: 图片url / path (/album/xxx)
         :param domain_index: 域名下标
         :param retry_count: 重试次数
         :param callback: 回调，可以接收resp返回新的resp，也可以抛出异常强制重试
+        :param domain_list: 按此顺序使用域名，默认为按健康度排序的 self.domain_list
+        :param hedge: 是否对冲请求，见 self.hedged_request_with_retry
+        :param cancel_token: 取消令牌，默认为 self.cancel_token
         :param kwargs: 请求方法的kwargs
         """
-        if domain_index >= len(self.domain_list):
-            return self.fallback(request, url, domain_index, retry_count, **kwargs)
+        retry = JmRetryLoop(self, url, domain_list, domain_index, retry_count, cancel_token or self.cancel_token, kwargs)
 
-        url_backup = url
+        if hedge and retry.tracker is not None and url.startswith('/') and len(retry.domain_list) >= 2:
+            delay = retry.tracker.latency_percentile(retry.domain_list[0])
+            if delay is not None:
+                return self.hedged_request_with_retry(request, url, delay, retry.domain_list, callback, **kwargs)
 
-        if url.startswith('/'):
-            # path → url
-            domain = self.domain_list[domain_index]
-            url = self.of_api_url(url, domain)
+        while True:
+            real_url = retry.next_url()
+            if real_url is None:
+                return retry.fallback(request)
 
-            self.update_request_with_specify_domain(kwargs, domain)
+            try:
+                resp = request(real_url, **kwargs)
 
-            jm_log(self.log_topic(), self.decode(url))
-        else:
-            # 图片url
-            self.update_request_with_specify_domain(kwargs, None, True)
+                # 回调，可以接收resp返回新的resp，也可以抛出异常强制重试
+                if callback is not None:
+                    resp = callback(resp)
 
-        if domain_index != 0 or retry_count != 0:
-            jm_log(f'req.retry',
-                   ', '.join([
-                       f'次数: [{retry_count}/{self.retry_times}]',
-                       f'域名: [{domain_index} of {self.domain_list}]',
-                       f'路径: [{url}]',
-                       f'参数: [{kwargs if "login" not in url else "#login_form#"}]'
-                   ])
-                   )
+                # 依然是回调，在最后返回之前，还可以判断resp是否重试
+                resp = self.raise_if_resp_should_retry(resp)
 
-        try:
-            resp = request(url, **kwargs)
+                retry.record_success()
+                return resp
+            except Exception as e:
+                retry.record_failure(e)
 
-            # 回调，可以接收resp返回新的resp，也可以抛出异常强制重试
-            if callback is not None:
-                resp = callback(resp)
+            delay = retry.next_delay()
+            if delay is None:
+                return retry.fallback(request)
 
-            # 依然是回调，在最后返回之前，还可以判断resp是否重试
-            resp = self.raise_if_resp_should_retry(resp)
+            if delay > 0:
+                if retry.cancel_token is not None:
+                    retry.cancel_token.sleep(delay)
+                else:
+                    time.sleep(delay)
 
-            return resp
+    def hedged_request_with_retry(self, request, url, delay, domain_list, callback=None, **kwargs):
+        """
+        对冲请求：在当前线程按domain_list的顺序发请求，delay秒后还没返回，
+        再在新线程中从第二个域名开始发一次相同的请求，两个都失败时抛出先发请求的异常。
+        先发请求在delay秒内返回时，不会创建任何线程，见 JmDelayedCall
+
+        每个请求有自己的取消令牌（self.cancel_token 的子令牌），一方成功后取消另一方，落败的请求不会再重试和等待。
+        正在进行中的那次请求不会被中断：对冲请求先成功时，当前线程要等先发请求的这次请求结束，
+        再返回对冲请求的结果（先发请求这次也成功了则返回它自己的结果）
+        """
+        from queue import Queue
+        hedge_results = Queue()
+        primary_token = JmCancelToken(self.cancel_token)
+        hedge_token = JmCancelToken(self.cancel_token)
+        primary_order = list(domain_list)
+        hedge_order = primary_order[1:] + primary_order[:1]
+
+        def copy_kwargs():
+            # 复制kwargs和headers，避免两个请求互相修改
+            req_kwargs = {**kwargs}
+            if req_kwargs.get('headers', None) is not None:
+                req_kwargs['headers'] = dict(req_kwargs['headers'])
+            return req_kwargs
+
+        def run_hedge():
+            jm_log('req.hedge', f'请求超过{delay:.2f}秒未返回，向下一个域名发起对冲请求: {url}')
+            try:
+                resp = self.request_with_retry(request, url, callback=callback, domain_list=hedge_order,
+                                               cancel_token=hedge_token, **copy_kwargs())
+            except Exception as e:
+                hedge_results.put((False, e))
+                return
+
+            hedge_results.put((True, resp))
+            # 先发请求不再重试
+            primary_token.cancel()
+
+        hedge = JmDelayedCall.schedule(delay, run_hedge)
+        try:
+            resp = self.request_with_retry(request, url, callback=callback, domain_list=primary_order,
+                                           cancel_token=primary_token, **copy_kwargs())
         except Exception as e:
-            if self.retry_times == 0:
+            if hedge.cancel():
+                # 对冲请求还没有发出
                 raise e
 
-            self.before_retry(e, kwargs, retry_count, url)
+            ok, value = hedge_results.get()
+            if ok:
+                return value
+            raise e
 
-        if retry_count < self.retry_times:
-            return self.request_with_retry(request, url_backup, domain_index, retry_count + 1, callback, **kwargs)
-        else:
-            return self.request_with_retry(request, url_backup, domain_index + 1, 0, callback, **kwargs)
+        hedge.cancel()
+        hedge_token.cancel()
+        return resp
+
+    # noinspection PyMethodMayBeStatic
+    def domain_health_tracker(self) -> Optional[JmDomainHealthTracker]:
+        if not JmModuleConfig.FLAG_ENABLE_DOMAIN_HEALTH_ROUTING:
+            return None
+        return JmModuleConfig.domain_health_tracker()
+
+    def domain_prober(self, domain):
+        """
+        返回探测域名是否恢复的函数，由 JmDomainHealthTracker 在后台线程中调用，不占用正常请求
+
+        能连上且没有返回5xx就认为域名已恢复
+        """
+
+        def probe():
+            resp = self.postman.get(f'{JmModuleConfig.PROT}{domain}/', timeout=10)
+            if resp.status_code >= 500:
+                ExceptionTool.raises(f'域名探测失败: {domain}, 状态码{resp.status_code}')
+
+        return probe
 
     # noinspection PyMethodMayBeStatic
     def raise_if_resp_should_retry(self, resp):
@@ -179,28 +498,86 @@ class AbstractJmClient(
                 if cache is None:
                     return func(*args, **kwargs)
 
-                key = make_key(args, kwargs, False)
+                if isinstance(cache, JmSqliteCache):
+                    key = cache.make_key(self.client_key, func_name, args, kwargs)
+                else:
+                    key = make_key(args, kwargs, False)
                 sentinel = object()  # unique object used to signal cache misses
 
                 result = cache.get(key, sentinel)
                 if result is not sentinel:
                     return result
 
-                result = func(*args, **kwargs)
-                cache[key] = result
-                return result
+                # single-flight：使用同一缓存的相同调用同时未命中时，只有第一个发请求，其他的等待它的结果
+                return self.call_single_flight(cache, key, func, args, kwargs)
 
             setattr(self, func_name, cache_wrapper)
 
         for func_name in self.func_to_cache:
             wrap_func_with_cache(func_name, f'__{func_name}.cache.dict__')
 
+    @classmethod
+    def call_single_flight(cls, cache, key, func, args, kwargs):
+        """
+        调用func并把结果写入缓存，同一缓存的相同key已经在请求中时，等待那次请求的结果（或异常），不再重复请求
+
+        发起请求的调用被取消（DownloadCancelledException）时，取消不会传给等待者：
+        等待者的下载并没有被取消，它们会重新调用func，其中一个成为新的发起者
+        """
+        from concurrent.futures import Future
+
+        flight_key = (id(cache), key)
+
+        def remove_inflight(f):
+            with cls.CACHE_INFLIGHT_LOCK:
+                if cls.CACHE_INFLIGHT.get(flight_key, None) is f:
+                    cls.CACHE_INFLIGHT.pop(flight_key)
+
+        while True:
+            with cls.CACHE_INFLIGHT_LOCK:
+                future = cls.CACHE_INFLIGHT.get(flight_key, None)
+                is_leader = future is None
+                if is_leader:
+                    future = Future()
+                    cls.CACHE_INFLIGHT[flight_key] = future
+
+            if not is_leader:
+                result = future.result()
+                if result is cls.CACHE_INFLIGHT_CANCELLED:
+                    continue
+                return result
+
+            try:
+                result = func(*args, **kwargs)
+                cache[key] = result
+                future.set_result(result)
+                return result
+            except DownloadCancelledException as e:
+                # 先移除，被唤醒的等待者才能成为新的发起者
+                remove_inflight(future)
+                future.set_result(cls.CACHE_INFLIGHT_CANCELLED)
+                raise e
+            except BaseException as e:
+                future.set_exception(e)
+                raise e
+            finally:
+                remove_inflight(future)
+
     def set_cache_dict(self, cache_dict: Optional[Dict]):
         self.CLIENT_CACHE = cache_dict
 
     def get_cache_dict(self):
         return self.CLIENT_CACHE
 
+    def get_scramble_cache(self):
+        """
+        scramble_id的缓存，使用 JmSqliteCache 时一起持久化，否则为 JmModuleConfig.SCRAMBLE_CACHE
+        """
+        cache = self.CLIENT_CACHE
+        if isinstance(cache, JmSqliteCache):
+            return cache.namespace('scramble')
+        return JmModuleConfig.SCRAMBLE_CACHE
+
     def get_domain_list(self):
         return self.domain_list
 
@@ -292,7 +669,7 @@ class JmHtmlClient(AbstractJmClient):
         jmid = JmcomicText.parse_to_jm_id(jmid)
 
         # 请求
-        resp = self.get_jm_html(f"/{prefix}/{jmid}")
+        resp = self.get_jm_html(f"/{prefix}/{jmid}", hedge=JmModuleConfig.FLAG_HEDGE_DETAIL_REQUEST)
 
         # 用 JmcomicText 解析 html，返回实体类
         if prefix == 'album':
@@ -680,14 +1057,14 @@ class JmApiClient(AbstractJmClient):
 
     def get_scramble_id(self, photo_id, album_id=None):
         """
-        带有缓存的fetch_scramble_id，缓存位于 JmModuleConfig.SCRAMBLE_CACHE
+        带有缓存的fetch_scramble_id，缓存见 get_scramble_cache
         """
-        cache = JmModuleConfig.SCRAMBLE_CACHE
-        if photo_id in cache:
-            return cache[photo_id]
-
-        if album_id is not None and album_id in cache:
-            return cache[album_id]
+        cache = self.get_scramble_cache()
+        scramble_id = cache.get(photo_id, None)
+        if scramble_id is None and album_id is not None:
+            scramble_id = cache.get(album_id, None)
+        if scramble_id is not None:
+            return scramble_id
 
         scramble_id = self.fetch_scramble_id(photo_id)
         cache[photo_id] = scramble_id
@@ -706,7 +1083,8 @@ class JmApiClient(AbstractJmClient):
             url,
             {
                 'id': jmid
-            })
+            }),
+            hedge=JmModuleConfig.FLAG_HEDGE_DETAIL_REQUEST,
         )
 
         if resp.res_data.get('name') is None:
@@ -1039,6 +1417,8 @@ class JmApiClient(AbstractJmClient):
                        f'获取到最新的API域名，替换jmcomic内置域名：(new){new_server_list} ---→ (old){old_server_list}'
                        )
                 # 更新域名
+                if JmModuleConfig.FLAG_CLIENT_PROBE_DOMAIN:
+                    new_server_list = self.probe_domains(new_server_list)
                 if self.domain_list is old_server_list:
                     self.domain_list = new_server_list
                 JmModuleConfig.DOMAIN_API_LIST = new_server_list
@@ -1069,6 +1449,295 @@ class JmApiClient(AbstractJmClient):
         return cookies
 
 
+class AsyncJmApiClient(JmApiClient):
+    """
+    基于asyncio的移动端Client，使用curl_cffi的AsyncSession发请求。
+
+    同步方法（get_album_detail等）与 JmApiClient 完全相同，
+    另外提供 async_xxx 协程方法，在一个线程的事件循环中并发大量请求，配合 AsyncJmDownloader 使用。
+
+    option配置:
+    client:
+      impl: async_api
+
+    注意：异步方法不经过client缓存（client.cache），域名自动更新和获取cookies在创建client时同步完成
+    """
+    client_key = 'async_api'
+
+    def after_init(self):
+        super().after_init()
+        # AsyncSession绑定事件循环，每个事件循环一个
+        self.async_session_dict = {}
+        self.async_session_lock = Lock()
+        # 一个AsyncSession同时进行的最大请求数，超出的请求在curl中排队
+        self.async_max_clients = 10
+
+    def async_session(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        session = self.async_session_dict.get(loop, None)
+        if session is not None:
+            return session
+
+        with self.async_session_lock:
+            session = self.async_session_dict.get(loop, None)
+            if session is None:
+                from curl_cffi.requests import AsyncSession
+                session = AsyncSession(max_clients=self.async_max_clients)
+                self.async_session_dict[loop] = session
+            return session
+
+    async def async_close(self):
+        """
+        关闭当前事件循环的AsyncSession，在事件循环结束前调用
+        """
+        import asyncio
+        session = self.async_session_dict.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    async def async_get(self, url, **kwargs):
+        return await self.async_request_with_retry('GET', url, **kwargs)
+
+    async def async_post(self, url, **kwargs):
+        return await self.async_request_with_retry('POST', url, **kwargs)
+
+    async def async_request(self, method, url, **kwargs):
+        """
+        发出一次请求，合并postman的元数据（headers、cookies、proxies、impersonate），经过限速器
+        """
+        import asyncio
+        category = JmRateLimiter.CATEGORY_API if kwargs.pop('is_api', True) else JmRateLimiter.CATEGORY_IMAGE
+        limiters = JmRateLimiter.decide_limiters(category, url)
+        for limiter in limiters:
+            wait = limiter.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        meta_data = self.get_meta_data()
+        if meta_data.get('headers', None) and kwargs.get('headers', None):
+            kwargs['headers'] = {**meta_data['headers'], **kwargs['headers']}
+        request_kwargs = {**meta_data, **{k: v for k, v in kwargs.items() if v is not None}}
+        if not request_kwargs.get('proxies', None):
+            request_kwargs.pop('proxies', None)
+
+        resp = await self.async_session().request(method, url, **request_kwargs)
+
+        size = len(resp.content or b'')
+        for limiter in limiters:
+            limiter.after_response(size)
+        return resp
+
+    async def async_request_with_retry(self, method, url, callback=None, **kwargs):
+        """
+        request_with_retry 的异步版本，重试和域名切换逻辑与同步版本共用 JmRetryLoop，不支持对冲请求
+
+        重试前的等待可以被取消令牌打断
+        """
+        import asyncio
+        retry = JmRetryLoop(self, url, cancel_token=self.cancel_token, kwargs=kwargs)
+        is_api = url.startswith('/')
+
+        while True:
+            real_url = retry.next_url()
+            if real_url is None:
+                return retry.fallback(None)
+
+            try:
+                resp = await self.async_request(method, real_url, is_api=is_api, **kwargs)
+                if callback is not None:
+                    resp = callback(resp)
+                resp = self.raise_if_resp_should_retry(resp)
+
+                retry.record_success()
+                return resp
+            except Exception as e:
+                retry.record_failure(e)
+
+            delay = retry.next_delay()
+            if delay is None:
+                return retry.fallback(None)
+
+            if delay > 0:
+                if retry.cancel_token is not None:
+                    await retry.cancel_token.async_sleep(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+    async def async_req_api(self, url, get=True, require_success=True, **kwargs) -> JmApiResp:
+        ts = self.decide_headers_and_ts(kwargs, url)
+
+        if get:
+            resp = await self.async_get(url, **kwargs)
+        else:
+            resp = await self.async_post(url, **kwargs)
+
+        resp = JmApiResp(resp, ts)
+
+        if require_success:
+            self.require_resp_success(resp, url)
+
+        return resp
+
+    async def async_fetch_detail_entity(self, jmid, clazz):
+        jmid = JmcomicText.parse_to_jm_id(jmid)
+        url = self.API_ALBUM if issubclass(clazz, JmAlbumDetail) else self.API_CHAPTER
+        resp = await self.async_req_api(self.append_params_to_url(url, {'id': jmid}))
+
+        if resp.res_data.get('name') is None:
+            ExceptionTool.raise_missing(resp, jmid)
+
+        return JmApiAdaptTool.parse_entity(resp.res_data, clazz)
+
+    async def async_get_album_detail(self, album_id) -> JmAlbumDetail:
+        return await self.async_fetch_detail_entity(album_id, JmModuleConfig.album_class())
+
+    async def async_get_photo_detail(self,
+                                     photo_id,
+                                     fetch_album=True,
+                                     fetch_scramble_id=True,
+                                     ) -> JmPhotoDetail:
+        import asyncio
+        photo: JmPhotoDetail = await self.async_fetch_detail_entity(photo_id, JmModuleConfig.photo_class())
+
+        # 本子和scramble_id并发获取
+        album, scramble_id = await asyncio.gather(
+            self.async_get_album_detail(photo.album_id) if fetch_album else asyncio.sleep(0),
+            self.async_get_scramble_id(photo.photo_id, photo.album_id) if fetch_scramble_id else asyncio.sleep(0),
+        )
+        if fetch_album:
+            photo.from_album = album
+        if fetch_scramble_id:
+            photo.scramble_id = scramble_id
+
+        return photo
+
+    async def async_get_scramble_id(self, photo_id, album_id=None):
+        """
+        get_scramble_id 的异步版本，同样使用 get_scramble_cache
+        """
+        cache = self.get_scramble_cache()
+
+        def lookup():
+            cached = cache.get(photo_id, None)
+            if cached is None and album_id is not None:
+                cached = cache.get(album_id, None)
+            return cached
+
+        def store():
+            cache[photo_id] = scramble_id
+            if album_id is not None:
+                cache[album_id] = scramble_id
+
+        scramble_id = await self.async_cache_io(lookup)
+        if scramble_id is not None:
+            return scramble_id
+
+        resp = await self.async_req_api(
+            self.API_SCRAMBLE,
+            params={
+                'id': JmcomicText.parse_to_jm_id(photo_id),
+                'mode': 'vertical',
+                'page': '0',
+                'app_img_shunt': '1',
+                'express': 'off',
+                'v': time_stamp(),
+            },
+            require_success=False,
+        )
+
+        scramble_id = PatternTool.match_or_default(resp.text,
+                                                   JmcomicText.pattern_html_album_scramble_id,
+                                                   None,
+                                                   )
+        if scramble_id is None:
+            jm_log('api.scramble', f'未匹配到scramble_id，响应文本：{resp.text}')
+            scramble_id = str(JmMagicConstants.SCRAMBLE_220980)
+
+        await self.async_cache_io(store)
+        return scramble_id
+
+    async def async_cache_io(self, func):
+        """
+        读写缓存，JmSqliteCache 的读写在线程池中执行，不阻塞事件循环；内存缓存直接读写
+
+        （asyncio.to_thread 需要python3.9，这里用等价的 run_in_executor）
+        """
+        if not isinstance(self.CLIENT_CACHE, JmSqliteCache):
+            return func()
+
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, func)
+
+    async def async_check_photo(self, photo: JmPhotoDetail):
+        """
+        check_photo 的异步版本
+        """
+        if photo.from_album is None:
+            photo.from_album = await self.async_get_album_detail(photo.album_id)
+
+        if photo.page_arr is None or photo.data_original_domain is None:
+            new = await self.async_get_photo_detail(photo.photo_id, False)
+            new.from_album = photo.from_album
+            photo.__dict__.update(new.__dict__)
+
+    async def async_search(self,
+                           search_query: str,
+                           page: int = 1,
+                           main_tag: int = 0,
+                           order_by: str = JmMagicConstants.ORDER_BY_LATEST,
+                           time: str = JmMagicConstants.TIME_ALL,
+                           ) -> JmSearchPage:
+        params = {
+            'main_tag': main_tag,
+            'search_query': search_query,
+            'page': page,
+            'o': order_by,
+            't': time,
+        }
+
+        resp = await self.async_req_api(self.append_params_to_url(self.API_SEARCH, params))
+
+        data = resp.model_data
+        if data.get('redirect_aid', None) is not None:
+            return JmSearchPage.wrap_single_album(await self.async_get_album_detail(data.redirect_aid))
+
+        return JmPageTool.parse_api_to_search_page(data)
+
+    async def async_get_jm_image(self, img_url) -> JmImageResp:
+
+        def callback(resp):
+            resp = JmImageResp(resp)
+            resp.require_success()
+            return resp
+
+        return await self.async_get(img_url, callback=callback, headers=JmModuleConfig.new_html_headers())
+
+    async def async_download_by_image_detail(self,
+                                             image: JmImageDetail,
+                                             img_save_path,
+                                             decode_image=True,
+                                             encode_params: Optional[Dict[str, dict]] = None,
+                                             process_pool=None,
+                                             ):
+        """
+        异步请求图片，解密和保存在线程池中执行，不阻塞事件循环
+        """
+        import asyncio
+        resp = await self.async_get_jm_image(image.download_url)
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            self.save_image_resp,
+            decode_image,
+            img_save_path,
+            image.download_url,
+            resp,
+            int(image.scramble_id),
+            encode_params,
+            process_pool,
+        )
+
+
 class PhotoConcurrentFetcherProxy(JmcomicClient):
     """
     为了解决 JmApiClient.get_photo_detail 方法的排队调用问题，
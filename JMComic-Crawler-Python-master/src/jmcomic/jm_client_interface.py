@@ -60,26 +60,78 @@ class JmImageResp(JmResp):
                     scramble_id,
                     decode_image=True,
                     img_url=None,
+                    encode_params: Optional[Dict[str, dict]] = None,
+                    process_pool=None,
                     ):
+        """
+        保存图片，需要时解密和转换格式
+
+        :param encode_params: 重新编码图片时的参数，见 JmImageTool.parse_encode_params
+        :param process_pool: 解密图片的进程池，None表示在当前线程解密
+        """
         img_url = img_url or self.url
         index = img_url.find("?")
         if index != -1:
             img_url = img_url[0:index]
 
+        need_convert = suffix_not_equal(img_url, path)
+
         if decode_image is False or scramble_id is None:
             # 不解密图片，直接保存文件
             JmImageTool.save_resp_img(
                 self,
                 path,
-                need_convert=suffix_not_equal(img_url, path),
+                need_convert=need_convert,
+                encode_params=JmImageTool.decide_encode_params(path, encode_params),
             )
+            return
+
+        num = JmImageTool.get_num_by_url(scramble_id, img_url)
+        if num == 0 and not need_convert:
+            # 图片没有被分割，也不需要转换格式，直接写入原始数据，不经过PIL解码和重新编码
+            JmImageTool.save_directly(self, path)
         else:
             # 解密图片并保存文件
-            JmImageTool.decode_and_save(
-                JmImageTool.get_num_by_url(scramble_id, img_url),
-                JmImageTool.open_image(self.content),
-                path,
-            )
+            JmImageTool.decode_resp_and_save(num, self.content, path, encode_params, process_pool)
+
+
+class JmStreamImageResp(JmImageResp):
+    """
+    流式下载的图片响应，数据分块写入 JmPartFileWriter（保存路径.part），成功后原子地重命名为保存路径，
+    不在内存中保留完整数据
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, resp, writer: 'JmPartFileWriter'):
+        super().__init__(resp)
+        self.writer = writer
+
+    @property
+    def is_success(self) -> bool:
+        return self.http_code == 200 and self.writer.size != 0
+
+    def error_msg(self):
+        msg = f'禁漫图片获取失败: [{self.url}]'
+        if self.http_code != 200:
+            msg += f'，http状态码={self.http_code}'
+        if self.writer.size == 0:
+            msg += f'，响应数据为空'
+        return msg
+
+    def save(self):
+        """
+        写完数据并重命名，失败时抛出异常（会走重试逻辑）
+        """
+        try:
+            if self.http_code == 200 and self.writer.size == 0:
+                # stream=True的响应，数据还没有读取
+                for chunk in self.resp.iter_content(chunk_size=self.chunk_size):
+                    self.writer.write(chunk)
+            self.writer.close()
+            self.require_success()
+            self.writer.commit()
+        finally:
+            self.resp.close()
 
 
 class JmJsonResp(JmResp):
@@ -240,6 +292,8 @@ class JmImageClient:
                        img_save_path: str,
                        scramble_id: Optional[int] = None,
                        decode_image=True,
+                       encode_params: Optional[Dict[str, dict]] = None,
+                       process_pool=None,
                        ):
         """
         下载JM的图片
@@ -247,28 +301,58 @@ class JmImageClient:
         :param img_save_path: 图片保存位置
         :param scramble_id: 图片所在photo的scramble_id
         :param decode_image: 要保存的是解密后的图还是原图
+        :param encode_params: 重新编码图片时的参数，见 JmImageTool.parse_encode_params
+        :param process_pool: 解密图片的进程池，None表示在当前线程解密
         """
+        if JmModuleConfig.FLAG_STREAM_IMAGE_DOWNLOAD and \
+                self.is_image_save_directly(img_url, img_save_path, scramble_id, decode_image):
+            # 不需要解密和转换格式，流式写入文件
+            self.get_jm_image_stream(img_url, img_save_path)
+            return
+
         # 请求图片
         resp = self.get_jm_image(img_url)
 
         resp.require_success()
 
-        return self.save_image_resp(decode_image, img_save_path, img_url, resp, scramble_id)
+        return self.save_image_resp(decode_image, img_save_path, img_url, resp, scramble_id, encode_params, process_pool)
+
+    # noinspection PyMethodMayBeStatic
+    def is_image_save_directly(self, img_url, img_save_path, scramble_id, decode_image) -> bool:
+        """
+        图片是否不需要解密和转换格式，可以直接保存原始数据（与 JmImageResp.transfer_to 的判断相同）
+        """
+        img_url = img_url.split('?', 1)[0]
+        if suffix_not_equal(img_url, img_save_path):
+            return False
+
+        if decode_image is False or scramble_id is None:
+            return True
+
+        return JmImageTool.get_num_by_url(scramble_id, img_url) == 0
+
+    def get_jm_image_stream(self, img_url, img_save_path) -> JmStreamImageResp:
+        raise NotImplementedError
 
     # noinspection PyMethodMayBeStatic
-    def save_image_resp(self, decode_image, img_save_path, img_url, resp, scramble_id):
-        resp.transfer_to(img_save_path, scramble_id, decode_image, img_url)
+    def save_image_resp(self, decode_image, img_save_path, img_url, resp, scramble_id,
+                        encode_params=None, process_pool=None):
+        resp.transfer_to(img_save_path, scramble_id, decode_image, img_url, encode_params, process_pool)
 
     def download_by_image_detail(self,
                                  image: JmImageDetail,
                                  img_save_path,
                                  decode_image=True,
+                                 encode_params: Optional[Dict[str, dict]] = None,
+                                 process_pool=None,
                                  ):
         return self.download_image(
             image.download_url,
             img_save_path,
             int(image.scramble_id),
             decode_image=decode_image,
+            encode_params=encode_params,
+            process_pool=process_pool,
         )
 
     def get_jm_image(self, img_url) -> JmImageResp:
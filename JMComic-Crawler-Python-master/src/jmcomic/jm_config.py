@@ -1,3 +1,5 @@
+from threading import Lock
+
 from common import time_stamp, field_cache, ProxyBuilder
 
 
@@ -197,6 +199,11 @@ class JmModuleConfig:
     # value: 函数，参数只有异常对象，无需返回值
     # 这个异常类（或者这个异常的子类）的实例将要被raise前，你的listener方法会被调用
     REGISTRY_EXCEPTION_LISTENER = {}
+    # 限速器注册表，进程内所有Client共享
+    # key: 'api'（接口请求）、'image'（图片请求）或者域名
+    # value: JmRateLimiter
+    # 一个请求会同时受到所属类别和所请求域名的限速器的限制
+    REGISTRY_RATE_LIMITER = {}
 
     # 执行log的函数
     EXECUTOR_LOG = default_jm_logging
@@ -214,6 +221,19 @@ class JmModuleConfig:
     FLAG_DECODE_URL_WHEN_LOGGING = True
     # 当内置的版本号落后时，使用最新的禁漫app版本号
     FLAG_USE_VERSION_NEWER_IF_BEHIND = True
+    # 根据域名健康度（延迟、错误率、熔断状态）调整请求域名的顺序，见 JmDomainHealthTracker
+    FLAG_ENABLE_DOMAIN_HEALTH_ROUTING = True
+    # 进程内共享的域名健康度统计，首次使用时创建
+    DOMAIN_HEALTH_TRACKER = None
+    DOMAIN_HEALTH_TRACKER_LOCK = Lock()
+    # 创建client时并行探测所有域名，按延迟排序domain_list（已有统计数据的域名不再探测）
+    FLAG_CLIENT_PROBE_DOMAIN = False
+    # 图片不需要解密和转换格式时，流式写入文件，不在内存中保留完整的图片数据
+    FLAG_STREAM_IMAGE_DOWNLOAD = True
+    # 配置相同（postman类型、代理、impersonate）的Client共用同一个HTTP会话，复用连接；cookies仍是每个Client独立的，见 JmSessionPool
+    FLAG_SHARE_POSTMAN_SESSION = True
+    # 本子/章节详情请求超过首个域名的p95耗时还没返回时，向第二个域名再发一次相同请求，取先返回的结果
+    FLAG_HEDGE_DETAIL_REQUEST = False
 
     # 关联dir_rule的自定义字段与对应的处理函数
     # 例如:
@@ -412,10 +432,14 @@ class JmModuleConfig:
         'dir_rule': {'rule': 'Bd_Pname', 'base_dir': None},
         'download': {
             'cache': True,
-            'image': {'decode': True, 'suffix': None},
+            'journal': {'enable': False, 'verify': 'size', 'dir': None},  # see JmDownloadJournal
+            'image': {'decode': True, 'suffix': None, 'encode': None},
             'threading': {
                 'image': 30,
                 'photo': None,
+                'decode': None,  # see JmPipelineDownloader
+                'queue': 100,
+                'decode_process': 0,  # see JmDownloader.decide_decode_process_pool
             },
         },
         'client': {
@@ -431,6 +455,15 @@ class JmModuleConfig:
             },
             'impl': None,
             'retry_times': 5,
+            'retry': {  # see JmRetryPolicy
+                'backoff': 0.2,
+                'factor': 2,
+                'max_backoff': 5,
+                'jitter': 0.5,
+                'max_total_time': None,
+                'no_retry': ['MissingAlbumPhotoException'],
+            },
+            'rate_limit': None,  # see JmRateLimiter
         },
         'plugins': {
             # 如果插件抛出参数校验异常，只log。（全局配置，可以被插件的局部配置覆盖）
@@ -479,6 +512,9 @@ class JmModuleConfig:
         if dt['photo'] is None:
             import os
             dt['photo'] = os.cpu_count()
+        if dt['decode'] is None:
+            import os
+            dt['decode'] = os.cpu_count()
 
         return option_dict
 
@@ -500,6 +536,37 @@ class JmModuleConfig:
     def register_exception_listener(cls, etype, listener):
         cls.REGISTRY_EXCEPTION_LISTENER[etype] = listener
 
+    @classmethod
+    def domain_health_tracker(cls):
+        """
+        进程内共享的域名健康度统计
+        """
+        if cls.DOMAIN_HEALTH_TRACKER is not None:
+            return cls.DOMAIN_HEALTH_TRACKER
+
+        # 加锁创建，否则并发首次调用时会各自创建一个，先创建的连同已记录的统计被丢弃
+        with cls.DOMAIN_HEALTH_TRACKER_LOCK:
+            if cls.DOMAIN_HEALTH_TRACKER is None:
+                from .jm_toolkit import JmDomainHealthTracker
+                cls.DOMAIN_HEALTH_TRACKER = JmDomainHealthTracker()
+            return cls.DOMAIN_HEALTH_TRACKER
+
+    @classmethod
+    def register_rate_limiter(cls, key: str, rps=None, bps=None):
+        """
+        注册或更新限速器，已存在同名限速器时只更新速率，正在等待的请求继续使用同一个限速器
+
+        :param key: 'api'、'image'或者域名
+        :param rps: 每秒请求数，None表示不限制
+        :param bps: 每秒字节数，None表示不限制
+        """
+        from .jm_toolkit import JmRateLimiter
+        limiter = cls.REGISTRY_RATE_LIMITER.get(key, None)
+        if limiter is None:
+            limiter = cls.REGISTRY_RATE_LIMITER.setdefault(key, JmRateLimiter())
+        limiter.set_rate(rps, bps)
+        return limiter
+
 
 jm_log = JmModuleConfig.jm_log
 disable_jm_log = JmModuleConfig.disable_jm_log
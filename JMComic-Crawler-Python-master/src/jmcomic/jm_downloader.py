@@ -10,17 +10,7 @@ def catch_exception(func):
         try:
             return func(self, *args, **kwargs)
         except Exception as e:
-            detail: JmBaseEntity = args[0]
-            if detail.is_image():
-                detail: JmImageDetail
-                jm_log('image.failed', f'图片下载失败: [{detail.download_url}], 异常: [{e}]')
-                self.download_failed_image.append((detail, e))
-
-            elif detail.is_photo():
-                detail: JmPhotoDetail
-                jm_log('photo.failed', f'章节下载失败: [{detail.id}], 异常: [{e}]')
-                self.download_failed_photo.append((detail, e))
-
+            self.record_failure(args[0], e)
             raise e
 
     return wrapper
@@ -73,19 +63,33 @@ class JmDownloader(DownloadCallback):
     JmDownloader = JmOption + 调度逻辑
     """
 
-    def __init__(self, option: JmOption) -> None:
+    def __init__(self, option: JmOption, cancel_token: Optional[JmCancelToken] = None) -> None:
         self.option = option
         self.client = option.build_jm_client()
+        # 重新编码图片的参数
+        self.encode_params = JmImageTool.parse_encode_params(option.download.image.get('encode', None))
+        # 解密图片的进程池，见 decide_decode_process_pool
+        self.decode_process_pool = None
+        self.decode_process_pool_lock = Lock()
+        # 取消/暂停令牌，同时交给client，在请求重试之间检查
+        self.cancel_token = cancel_token
+        self.client.cancel_token = cancel_token
         # 下载成功的记录dict
         self.download_success_dict: Dict[JmAlbumDetail, Dict[JmPhotoDetail, List[Tuple[str, JmImageDetail]]]] = {}
         # 下载失败的记录list
         self.download_failed_image: List[Tuple[JmImageDetail, BaseException]] = []
         self.download_failed_photo: List[Tuple[JmPhotoDetail, BaseException]] = []
+        # 每个本子的下载日志，见 JmDownloadJournal
+        self.journals: Dict[str, JmDownloadJournal] = {}
+        self.journal_lock = Lock()
 
     def download_album(self, album_id):
-        album = self.client.get_album_detail(album_id)
-        self.download_by_album_detail(album)
-        return album
+        try:
+            album = self.client.get_album_detail(album_id)
+            self.download_by_album_detail(album)
+            return album
+        finally:
+            self.shutdown_decode_process_pool()
 
     def download_by_album_detail(self, album: JmAlbumDetail):
         self.before_album(album)
@@ -96,15 +100,21 @@ class JmDownloader(DownloadCallback):
             apply=self.download_by_photo_detail,
             count_batch=self.option.decide_photo_batch_count(album)
         )
+        # 取消后各线程提前结束了，不算下载完成
+        self.raise_if_cancelled()
         self.after_album(album)
 
     def download_photo(self, photo_id):
-        photo = self.client.get_photo_detail(photo_id)
-        self.download_by_photo_detail(photo)
-        return photo
+        try:
+            photo = self.client.get_photo_detail(photo_id)
+            self.download_by_photo_detail(photo)
+            return photo
+        finally:
+            self.shutdown_decode_process_pool()
 
     @catch_exception
     def download_by_photo_detail(self, photo: JmPhotoDetail):
+        self.wait_if_paused()
         self.client.check_photo(photo)
 
         self.before_photo(photo)
@@ -115,10 +125,12 @@ class JmDownloader(DownloadCallback):
             apply=self.download_by_image_detail,
             count_batch=self.option.decide_image_batch_count(photo)
         )
+        self.raise_if_cancelled()
         self.after_photo(photo)
 
     @catch_exception
     def download_by_image_detail(self, image: JmImageDetail):
+        self.wait_if_paused()
         img_save_path = self.option.decide_image_filepath(image)
 
         image.save_path = img_save_path
@@ -134,17 +146,104 @@ class JmDownloader(DownloadCallback):
         decode_image = self.option.decide_download_image_decode(image)
 
         # skip download
-        if use_cache is True and image.exists:
+        if self.is_image_cached(image, use_cache):
             return
 
+        self.journal_image(image, JmDownloadJournal.STATUS_STARTED)
         self.client.download_by_image_detail(
             image,
             img_save_path,
             decode_image=decode_image,
+            encode_params=self.encode_params,
+            process_pool=self.decide_decode_process_pool(),
         )
+        self.journal_image(image, JmDownloadJournal.STATUS_DONE)
 
         self.after_image(image, img_save_path)
 
+    def decide_decode_process_pool(self):
+        """
+        解密图片使用的进程池，download.threading.decode_process 为0时返回None，表示在下载线程中解密。
+        进程池属于当前downloader，第一次使用时创建，在 download_album/download_photo 结束时关闭。
+
+        子进程优先用forkserver方式启动：在下载线程中直接fork（Linux默认）时，
+        其他线程持有的锁会被复制到子进程中且永远不会释放，子进程可能卡死
+        """
+        workers = self.option.download.threading.get('decode_process', 0) or 0
+        if workers == 0:
+            return None
+
+        with self.decode_process_pool_lock:
+            if self.decode_process_pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                context = multiprocessing.get_context(
+                    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else None
+                )
+                self.decode_process_pool = ProcessPoolExecutor(workers, mp_context=context)
+            return self.decode_process_pool
+
+    def shutdown_decode_process_pool(self):
+        with self.decode_process_pool_lock:
+            pool, self.decode_process_pool = self.decode_process_pool, None
+
+        if pool is not None:
+            pool.shutdown()
+
+    def is_image_cached(self, image: JmImageDetail, use_cache: bool) -> bool:
+        """
+        是否使用已存在的图片，跳过下载。
+        开启 download.journal 时，只有下载日志中已完成、且文件与记录一致的图片才会跳过
+        """
+        if use_cache is not True or not image.exists:
+            return False
+
+        journal = self.get_journal(image)
+        if journal is None:
+            return True
+
+        return journal.verify(image.save_path, image.download_url, self.option.download.journal.verify)
+
+    def get_journal(self, image: JmImageDetail) -> Optional[JmDownloadJournal]:
+        if not self.option.download.journal.enable:
+            return None
+
+        album_id = image.from_photo.album_id
+        with self.journal_lock:
+            journal = self.journals.get(album_id, None)
+            if journal is None:
+                journal = JmDownloadJournal(self.option.decide_journal_filepath(album_id))
+                self.journals[album_id] = journal
+            return journal
+
+    def journal_image(self, image: JmImageDetail, status: str):
+        journal = self.get_journal(image)
+        if journal is None:
+            return
+
+        if status == JmDownloadJournal.STATUS_STARTED:
+            journal.start(image.save_path, image.download_url)
+        else:
+            journal.done(image.save_path, image.download_url)
+
+    def record_failure(self, detail: JmBaseEntity, e: Exception):
+        """
+        记录下载失败的章节/图片
+        """
+        if isinstance(e, DownloadCancelledException):
+            # 取消不算下载失败
+            return
+
+        if detail.is_image():
+            detail: JmImageDetail
+            jm_log('image.failed', f'图片下载失败: [{detail.download_url}], 异常: [{e}]')
+            self.download_failed_image.append((detail, e))
+
+        elif detail.is_photo():
+            detail: JmPhotoDetail
+            jm_log('photo.failed', f'章节下载失败: [{detail.id}], 异常: [{e}]')
+            self.download_failed_photo.append((detail, e))
+
     def execute_on_condition(self,
                              iter_objs: DetailEntity,
                              apply: Callable,
@@ -159,6 +258,8 @@ class JmDownloader(DownloadCallback):
         if count_real == 0:
             return
 
+        apply = self.ignore_cancelled(apply)
+
         if count_batch >= count_real:
             # 一个图/章节 对应 一个线程
             multi_thread_launcher(
@@ -173,6 +274,21 @@ class JmDownloader(DownloadCallback):
                 max_workers=count_batch,
             )
 
+    # noinspection PyMethodMayBeStatic
+    def ignore_cancelled(self, apply: Callable) -> Callable:
+        """
+        包装交给线程执行的函数：下载被取消时直接结束线程，不让线程打印异常堆栈，
+        取消由调度的一方在线程结束后通过 raise_if_cancelled 抛出
+        """
+
+        def wrapper(*args, **kwargs):
+            try:
+                return apply(*args, **kwargs)
+            except DownloadCancelledException:
+                return None
+
+        return wrapper
+
     # noinspection PyMethodMayBeStatic
     def do_filter(self, detail: DetailEntity):
         """
@@ -186,6 +302,17 @@ class JmDownloader(DownloadCallback):
         """
         return detail
 
+    def wait_if_paused(self):
+        """
+        暂停时阻塞直到恢复，已取消时抛出 DownloadCancelledException
+        """
+        if self.cancel_token is not None:
+            self.cancel_token.wait_if_paused()
+
+    def raise_if_cancelled(self):
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
+
     @property
     def all_success(self) -> bool:
         """
@@ -292,6 +419,7 @@ class JmDownloader(DownloadCallback):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown_decode_process_pool()
         if exc_type is not None:
             jm_log('dler.exception',
                    f'{self.__class__.__name__} Exit with exception: {exc_type, str(exc_val)}'
@@ -305,6 +433,367 @@ class JmDownloader(DownloadCallback):
         JmModuleConfig.CLASS_DOWNLOADER = cls
 
 
+class AsyncJmDownloader(JmDownloader):
+    """
+    基于asyncio的下载器，需要配合 AsyncJmApiClient 使用（option配置 client.impl: async_api）
+
+    所有请求都在一个线程的事件循环中并发，不再为每个章节/图片创建线程，
+    并发数仍由 download.threading.photo / download.threading.image 决定，可以设置到上千；
+    图片的解密和保存在默认线程池中执行，不阻塞事件循环。
+
+    回调（before_xxx/after_xxx）和插件在事件循环线程中调用，与 JmDownloader 相同
+    """
+
+    def __init__(self, option: JmOption, cancel_token: Optional[JmCancelToken] = None) -> None:
+        super().__init__(option, cancel_token)
+        ExceptionTool.require_true(
+            isinstance(self.client, AsyncJmApiClient),
+            f'{self.__class__.__name__}需要使用异步client，请配置 client.impl: {AsyncJmApiClient.client_key}'
+        )
+        self.client: AsyncJmApiClient
+        self.client.async_max_clients = max(self.client.async_max_clients, self.option.download.threading.image)
+
+    def download_album(self, album_id):
+        import asyncio
+        return asyncio.run(self.run_and_close(self.download_album_async(album_id)))
+
+    def download_photo(self, photo_id):
+        import asyncio
+        return asyncio.run(self.run_and_close(self.download_photo_async(photo_id)))
+
+    async def run_and_close(self, coroutine):
+        try:
+            return await coroutine
+        finally:
+            await self.client.async_close()
+            self.shutdown_decode_process_pool()
+
+    async def download_album_async(self, album_id):
+        album = await self.client.async_get_album_detail(album_id)
+        await self.download_by_album_detail_async(album)
+        return album
+
+    async def download_photo_async(self, photo_id):
+        photo = await self.client.async_get_photo_detail(photo_id)
+        await self.download_by_photo_detail_async(photo)
+        return photo
+
+    async def download_by_album_detail_async(self, album: JmAlbumDetail):
+        self.before_album(album)
+        if album.skip:
+            return
+        await self.execute_on_condition_async(
+            iter_objs=album,
+            apply=self.download_by_photo_detail_async,
+            count_batch=self.option.decide_photo_batch_count(album)
+        )
+        self.raise_if_cancelled()
+        self.after_album(album)
+
+    async def download_by_photo_detail_async(self, photo: JmPhotoDetail):
+        try:
+            await self.wait_if_paused_async()
+            await self.client.async_check_photo(photo)
+
+            self.before_photo(photo)
+            if photo.skip:
+                return
+            await self.execute_on_condition_async(
+                iter_objs=photo,
+                apply=self.download_by_image_detail_async,
+                count_batch=self.option.decide_image_batch_count(photo)
+            )
+            self.raise_if_cancelled()
+            self.after_photo(photo)
+        except Exception as e:
+            self.record_failure(photo, e)
+            raise e
+
+    async def download_by_image_detail_async(self, image: JmImageDetail):
+        try:
+            await self.wait_if_paused_async()
+            img_save_path = self.option.decide_image_filepath(image)
+
+            image.save_path = img_save_path
+            image.exists = file_exists(img_save_path)
+
+            self.before_image(image, img_save_path)
+
+            if image.skip:
+                return
+
+            use_cache = self.option.decide_download_cache(image)
+            decode_image = self.option.decide_download_image_decode(image)
+
+            if self.is_image_cached(image, use_cache):
+                return
+
+            self.journal_image(image, JmDownloadJournal.STATUS_STARTED)
+            await self.client.async_download_by_image_detail(
+                image,
+                img_save_path,
+                decode_image=decode_image,
+                encode_params=self.encode_params,
+                process_pool=self.decide_decode_process_pool(),
+            )
+            self.journal_image(image, JmDownloadJournal.STATUS_DONE)
+
+            self.after_image(image, img_save_path)
+        except Exception as e:
+            self.record_failure(image, e)
+            raise e
+
+    async def execute_on_condition_async(self,
+                                         iter_objs: DetailEntity,
+                                         apply: Callable,
+                                         count_batch: int,
+                                         ):
+        """
+        并发执行，同时最多count_batch个，单个失败不影响其他（与多线程版本相同）
+        """
+        import asyncio
+        iter_objs = self.do_filter(iter_objs)
+        if len(iter_objs) == 0:
+            return
+
+        semaphore = asyncio.Semaphore(max(count_batch, 1))
+
+        async def run(obj):
+            async with semaphore:
+                return await apply(obj)
+
+        results = await asyncio.gather(*[run(obj) for obj in iter_objs], return_exceptions=True)
+
+        for result in results:
+            if isinstance(result, DownloadCancelledException):
+                raise result
+
+    async def wait_if_paused_async(self):
+        """
+        wait_if_paused 的异步版本，暂停时不阻塞事件循环
+        """
+        import asyncio
+        token = self.cancel_token
+        if token is None:
+            return
+
+        while token.is_paused and not token.is_cancelled:
+            await asyncio.sleep(0.2)
+        token.raise_if_cancelled()
+
+
+class JmPipelineDownloader(JmDownloader):
+    """
+    流水线下载器：用固定数量的线程分三步下载，取代 本子→章节→图片 的嵌套线程池
+
+    1. 章节线程（download.threading.photo 个）：获取章节详情，把图片放进图片队列
+    2. 网络线程（download.threading.image 个）：从图片队列取图片，请求图片数据，放进解密队列
+    3. 解密线程（download.threading.decode 个）：解密并保存图片
+
+    两个队列最多各排队 download.threading.queue 张图片，满了之后上一步会等待，
+    所以总并发数是固定的，不会随章节数成倍增长，也不会在章节末尾出现空闲线程。
+
+    与 JmDownloader 相同，不需要解密和转换格式的图片（见 JmModuleConfig.FLAG_STREAM_IMAGE_DOWNLOAD）
+    在网络线程中流式写入文件，不经过解密线程；其他图片才会把数据交给解密线程。
+
+    使用方式：download_album(123, downloader=JmPipelineDownloader)
+    """
+
+    def download_by_album_detail(self, album: JmAlbumDetail):
+        self.before_album(album)
+        if album.skip:
+            return
+        self.run_pipeline(self.do_filter(album))
+        self.raise_if_cancelled()
+        self.after_album(album)
+
+    def download_by_photo_detail(self, photo: JmPhotoDetail):
+        self.run_pipeline([photo])
+        self.raise_if_cancelled()
+
+    def run_pipeline(self, photos):
+        if len(photos) == 0:
+            return
+
+        from queue import Queue
+        from threading import Semaphore
+        from concurrent.futures import ThreadPoolExecutor
+
+        threading_conf = self.option.download.threading
+        queue_size = threading_conf.queue or 100
+        image_queue = Queue(maxsize=queue_size)
+        # 限制已下载、等待解密的图片数，避免解密跟不上时图片数据堆积在内存中
+        decode_slots = Semaphore(queue_size)
+        photo_state = self.PhotoState(self)
+
+        with ThreadPoolExecutor(threading_conf.decode or os.cpu_count(), thread_name_prefix='jm-decode') as decode_pool:
+            network_count = max(threading_conf.image, 1)
+            network_threads = [
+                Thread(target=self.network_worker,
+                       args=(image_queue, decode_pool, decode_slots, photo_state),
+                       name=f'jm-network-{i}',
+                       daemon=True)
+                for i in range(network_count)
+            ]
+            for t in network_threads:
+                t.start()
+
+            thread_pool_executor(
+                iter_objs=photos,
+                apply_each_obj_func=self.ignore_cancelled(
+                    lambda photo: self.produce_images(photo, image_queue, photo_state)),
+                max_workers=max(min(threading_conf.photo, len(photos)), 1),
+            )
+
+            # 生产完毕，通知网络线程退出
+            for _ in network_threads:
+                image_queue.put(None)
+            for t in network_threads:
+                t.join()
+
+    @catch_exception
+    def produce_images(self, photo: JmPhotoDetail, image_queue, photo_state: 'JmPipelineDownloader.PhotoState'):
+        self.wait_if_paused()
+        self.client.check_photo(photo)
+
+        self.before_photo(photo)
+        if photo.skip:
+            return
+
+        images = self.do_filter(photo)
+        photo_state.start(photo, len(images))
+        for image in images:
+            if self.cancel_token is not None and self.cancel_token.is_cancelled:
+                break
+            image_queue.put(image)
+        photo_state.produced(photo)
+
+    def network_worker(self, image_queue, decode_pool, decode_slots, photo_state: 'JmPipelineDownloader.PhotoState'):
+        while True:
+            image: Optional[JmImageDetail] = image_queue.get()
+            if image is None:
+                return
+
+            try:
+                task = self.fetch_image(image)
+            except Exception as e:
+                self.record_failure(image, e)
+                photo_state.done(image.from_photo, False)
+                continue
+
+            if task is None:
+                # 跳过的图片
+                photo_state.done(image.from_photo, True)
+                continue
+
+            resp, img_save_path, _ = task
+            if resp is None:
+                # 已经流式写入文件，不需要解密
+                self.finish_image(image, img_save_path, photo_state)
+                continue
+
+            decode_slots.acquire()
+            decode_pool.submit(self.decode_worker, image, task, decode_slots, photo_state)
+
+    def fetch_image(self, image: JmImageDetail):
+        """
+        网络阶段：与 download_by_image_detail 相同的判断逻辑，请求图片数据
+
+        :returns: 交给解密阶段的参数 (resp, 保存路径, 是否解密)，None表示跳过这张图片，
+                  resp为None表示图片已经流式写入文件
+        """
+        self.wait_if_paused()
+        img_save_path = self.option.decide_image_filepath(image)
+
+        image.save_path = img_save_path
+        image.exists = file_exists(img_save_path)
+
+        self.before_image(image, img_save_path)
+
+        if image.skip:
+            return None
+
+        use_cache = self.option.decide_download_cache(image)
+        decode_image = self.option.decide_download_image_decode(image)
+
+        if self.is_image_cached(image, use_cache):
+            return None
+
+        self.journal_image(image, JmDownloadJournal.STATUS_STARTED)
+        img_url, scramble_id = image.download_url, int(image.scramble_id)
+        if JmModuleConfig.FLAG_STREAM_IMAGE_DOWNLOAD and \
+                self.client.is_image_save_directly(img_url, img_save_path, scramble_id, decode_image):
+            self.client.get_jm_image_stream(img_url, img_save_path)
+            return None, img_save_path, decode_image
+
+        resp = self.client.get_jm_image(img_url)
+        resp.require_success()
+        return resp, img_save_path, decode_image
+
+    def decode_worker(self, image: JmImageDetail, task, decode_slots, photo_state: 'JmPipelineDownloader.PhotoState'):
+        resp, img_save_path, decode_image = task
+        try:
+            self.client.save_image_resp(decode_image, img_save_path, image.download_url, resp, int(image.scramble_id),
+                                        self.encode_params, self.decide_decode_process_pool())
+        except Exception as e:
+            self.record_failure(image, e)
+            photo_state.done(image.from_photo, False)
+            return
+        finally:
+            decode_slots.release()
+
+        self.finish_image(image, img_save_path, photo_state)
+
+    def finish_image(self, image: JmImageDetail, img_save_path, photo_state: 'JmPipelineDownloader.PhotoState'):
+        """
+        图片已保存：写下载日志，调用 after_image
+        """
+        try:
+            self.journal_image(image, JmDownloadJournal.STATUS_DONE)
+            self.after_image(image, img_save_path)
+            photo_state.done(image.from_photo, True)
+        except Exception as e:
+            self.record_failure(image, e)
+            photo_state.done(image.from_photo, False)
+
+    class PhotoState:
+        """
+        记录每个章节还有多少张图片没处理完，全部处理完（无论成败，与 JmDownloader 相同）时调用 after_photo
+        """
+
+        def __init__(self, downloader: 'JmPipelineDownloader'):
+            self.downloader = downloader
+            self.lock = Lock()
+            # photo → [剩余图片数, 是否已全部放入队列]
+            self.state: Dict[JmPhotoDetail, list] = {}
+
+        def start(self, photo, count):
+            with self.lock:
+                self.state[photo] = [count, False]
+
+        def produced(self, photo):
+            with self.lock:
+                self.state[photo][1] = True
+            self.check_finished(photo)
+
+        def done(self, photo, success):
+            with self.lock:
+                self.state[photo][0] -= 1
+            self.check_finished(photo)
+
+        def check_finished(self, photo):
+            with self.lock:
+                remaining, produced = self.state.get(photo, (1, False))
+                if remaining > 0 or not produced:
+                    return
+                self.state.pop(photo)
+
+            cancel_token = self.downloader.cancel_token
+            if cancel_token is not None and cancel_token.is_cancelled:
+                return
+            self.downloader.after_photo(photo)
+
+
 class DoNotDownloadImage(JmDownloader):
     """
     不会下载任何图片的Downloader，用作测试
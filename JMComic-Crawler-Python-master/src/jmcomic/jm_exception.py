@@ -66,6 +66,11 @@ class PartialDownloadFailedException(JmcomicException):
     def downloader(self):
         return self.from_context(ExceptionTool.CONTEXT_KEY_DOWNLOADER)
 
+
+class DownloadCancelledException(JmcomicException):
+    description = '下载被取消异常'
+
+
 class ExceptionTool:
     """
     抛异常的工具
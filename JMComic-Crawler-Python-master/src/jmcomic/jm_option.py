@@ -1,26 +1,77 @@
 from .jm_client_impl import *
 
+from weakref import WeakKeyDictionary
+
 
 class CacheRegistry:
-    REGISTRY = {}
+    # option/client → 缓存，弱引用option/client，它们被回收后缓存也随之释放
+    REGISTRY = WeakKeyDictionary()
+    # SQLite缓存文件路径 → JmSqliteCache
+    SQLITE_REGISTRY = {}
+    # level_option_lru / level_client_lru 不指定条数时的最大条数
+    DEFAULT_LRU_MAX_SIZE = 5000
 
     @classmethod
-    def level_option(cls, option, _client):
-        registry = cls.REGISTRY
-        registry.setdefault(option, {})
-        return registry[option]
+    def level_option(cls, option, _client, max_size=None, ttl=None):
+        return cls.get_or_create_cache(option, max_size, ttl)
+
+    @classmethod
+    def level_client(cls, _option, client, max_size=None, ttl=None):
+        return cls.get_or_create_cache(client, max_size, ttl)
+
+    @classmethod
+    def level_option_lru(cls, option, client, max_size=None, ttl=None):
+        """
+        限制条数的 level_option，可以写成字符串 level_option_lru:5000
+        """
+        return cls.level_option(option, client, max_size or cls.DEFAULT_LRU_MAX_SIZE, ttl)
 
     @classmethod
-    def level_client(cls, _option, client):
+    def level_client_lru(cls, option, client, max_size=None, ttl=None):
+        """
+        限制条数的 level_client，可以写成字符串 level_client_lru:5000
+        """
+        return cls.level_client(option, client, max_size or cls.DEFAULT_LRU_MAX_SIZE, ttl)
+
+    @classmethod
+    def get_or_create_cache(cls, owner, max_size=None, ttl=None):
+        """
+        max_size和ttl都不配置时缓存为dict，不淘汰；否则为 JmLruCache。同一owner的缓存以第一次创建时的参数为准
+
+        :param owner: option或client
+        :param max_size: 最多缓存多少条，超过时删除最久没有访问的条目
+        :param ttl: 过期时间（秒）
+        """
         registry = cls.REGISTRY
-        registry.setdefault(client, {})
-        return registry[client]
+        cache = registry.get(owner, None)
+        if cache is None:
+            cache = {} if max_size is None and ttl is None else JmLruCache(max_size, ttl)
+            registry[owner] = cache
+        return cache
+
+    @classmethod
+    def level_sqlite(cls, option, _client, path=None, max_size=100000, ttl=None):
+        """
+        持久化到SQLite文件，多次运行之间共享，使用同一文件的client共用一个 JmSqliteCache（参数以第一次创建时为准）
+
+        :param path: 缓存文件路径，默认为 {base_dir}/.cache/client_cache.sqlite3
+        :param max_size: 最多缓存多少条，超过时删除最久没有访问的条目，None表示不限制
+        :param ttl: 各类型的过期时间（秒），例如 {album: 3600}，见 JmSqliteCache.DEFAULT_TTL
+        """
+        if path is None:
+            path = os.path.join(option.dir_rule.base_dir, '.cache', 'client_cache.sqlite3')
+        path = JmcomicText.parse_to_abspath(path)
+
+        registry = cls.SQLITE_REGISTRY
+        if path not in registry:
+            registry[path] = JmSqliteCache(path, max_size, ttl)
+        return registry[path]
 
     @classmethod
     def enable_client_cache_on_condition(cls,
                                          option: 'JmOption',
                                          client: JmcomicClient,
-                                         cache: Union[None, bool, str, Callable],
+                                         cache: Union[None, bool, str, dict, Callable],
                                          ):
         """
         cache parameter
@@ -34,6 +85,12 @@ class CacheRegistry:
 
         if str:
           (invoke corresponding Cache class method)
+          level_option_lru:5000 (the number after ':' is passed as max_size)
+
+        if dict:
+          {level: level_option, max_size: 5000, ttl: 3600}
+          {level: level_sqlite, path: ..., max_size: ...}
+          (invoke the method named by level, other items are passed as kwargs)
 
         :param option: JmOption
         :param client: JmcomicClient
@@ -49,9 +106,21 @@ class CacheRegistry:
                 cache = cls.level_option
 
         elif isinstance(cache, str):
-            func = getattr(cls, cache, None)
-            ExceptionTool.require_true(func is not None, f'未实现的cache配置名: {cache}')
-            cache = func
+            level, _, max_size = cache.partition(':')
+            func = getattr(cls, level, None)
+            ExceptionTool.require_true(func is not None, f'未实现的cache配置名: {level}')
+            if max_size == '':
+                cache = func
+            else:
+                ExceptionTool.require_true(max_size.isdigit(), f'cache配置的最大条数不是整数: {cache}')
+                cache = lambda op, cl: func(op, cl, max_size=int(max_size))
+
+        elif isinstance(cache, (dict, AdvancedDict)):
+            kwargs = dict(cache.src_dict if isinstance(cache, AdvancedDict) else cache)
+            level = kwargs.pop('level', None)
+            func = getattr(cls, level, None) if isinstance(level, str) else None
+            ExceptionTool.require_true(func is not None, f'未实现的cache配置名: {level}')
+            cache = lambda op, cl: func(op, cl, **kwargs)
 
         cache: Callable
         client.set_cache_dict(cache(option, client))
@@ -260,6 +329,10 @@ class JmOption:
     def decide_download_cache(self, _image: JmImageDetail) -> bool:
         return self.download.cache
 
+    def decide_journal_filepath(self, album_id) -> str:
+        journal_dir = self.download.journal.get('dir', None) or os.path.join(self.dir_rule.base_dir, '.journal')
+        return os.path.join(journal_dir, f'{album_id}.jsonl')
+
     def decide_download_image_decode(self, image: JmImageDetail) -> bool:
         # .gif file needn't be decoded
         if image.is_gif:
@@ -375,6 +448,9 @@ class JmOption:
 
         retry_times: int = self.client.retry_times  # 重试次数
 
+        # 限速配置，注册到全局，所有Client共享
+        JmRateLimiter.apply_config(self.client.src_dict.get('rate_limit', None))
+
         cache: str = cache if cache is not None else self.client.cache  # 启用缓存
 
         impl: str = impl or self.client.impl  # client_key
@@ -411,8 +487,8 @@ class JmOption:
         if len(kwargs) != 0:
             meta_data.update(kwargs)
 
-        # postman
-        postman = Postmans.create(data=postman_conf)
+        # postman，配置相同的Client共用HTTP会话
+        postman = JmSessionPool.create_postman(postman_conf)
 
         # client
         clazz = JmModuleConfig.client_impl_class(impl)
@@ -423,6 +499,7 @@ class JmOption:
             postman=postman,
             domain_list=decide_domain_list(),
             retry_times=retry_times,
+            retry_policy=JmRetryPolicy.from_config(self.client.src_dict.get('retry', None)),
         )
 
         # enable cache
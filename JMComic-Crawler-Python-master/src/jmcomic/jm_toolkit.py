@@ -1,3 +1,7 @@
+import heapq
+import itertools
+from threading import Condition
+
 from PIL import Image
 
 from .jm_exception import *
@@ -723,14 +727,76 @@ class JmApiAdaptTool:
                 break
 
         fields['sort'] = sort
-        import random
-        fields['data_original_domain'] = random.choice(JmModuleConfig.DOMAIN_IMAGE_LIST)
+        if JmModuleConfig.FLAG_ENABLE_DOMAIN_HEALTH_ROUTING:
+            fields['data_original_domain'] = JmModuleConfig.domain_health_tracker().choose(JmModuleConfig.DOMAIN_IMAGE_LIST)
+        else:
+            import random
+            fields['data_original_domain'] = random.choice(JmModuleConfig.DOMAIN_IMAGE_LIST)
 
 
 class JmImageTool:
 
     @classmethod
-    def save_resp_img(cls, resp: Any, filepath: str, need_convert=True):
+    def parse_encode_params(cls, encode_params: Optional[Dict[str, dict]]) -> Dict[str, dict]:
+        """
+        解析重新编码图片（解密、转换格式）时的参数，对应option的 download.image.encode，例如
+        {'png': {'compress_level': 1}, 'webp': {'quality': 90, 'method': 4}, 'jpg': {'quality': 95, 'optimize': False}}
+
+        :returns: 格式（jpeg/png/webp...） → 传给 PIL.Image.save 的参数
+        """
+        params = {}
+        for fmt, kwargs in (encode_params or {}).items():
+            params[cls.normalize_format(fmt)] = dict(kwargs or {})
+        return params
+
+    @classmethod
+    def normalize_format(cls, fmt: str) -> str:
+        fmt = fmt.lower().lstrip('.')
+        return 'jpeg' if fmt == 'jpg' else fmt
+
+    @classmethod
+    def decide_encode_params(cls, filepath: str, encode_params: Optional[Dict[str, dict]]) -> dict:
+        """
+        :param filepath: 图片保存路径，按后缀决定格式
+        :param encode_params: parse_encode_params 的返回值
+        """
+        return (encode_params or {}).get(cls.normalize_format(of_file_suffix(filepath)), {})
+
+    @classmethod
+    def decode_bytes_and_save(cls, num: int, data: bytes, decoded_save_path: str, encode_params=None) -> None:
+        """
+        从图片的原始数据解密并保存，可在子进程中执行
+
+        :param encode_params: 编码参数，见 save_image
+        """
+        cls.decode_and_save(num, cls.open_image(data), decoded_save_path, encode_params)
+
+    @classmethod
+    def decode_resp_and_save(cls,
+                             num: int,
+                             data: bytes,
+                             decoded_save_path: str,
+                             encode_params: Optional[Dict[str, dict]] = None,
+                             process_pool=None,
+                             ) -> None:
+        """
+        解密并保存图片
+
+        解密（PIL解码、切片拼接、重新编码）是CPU密集的，多个下载线程在同一进程中解密会被GIL串行化，
+        传入进程池时交给进程池执行，当前线程等待结果（等待时不占用GIL）。
+        注意：子进程中使用的是jmcomic原本的解密逻辑，在主进程中对 JmImageTool 的修改不会生效
+
+        :param encode_params: parse_encode_params 的返回值
+        :param process_pool: 进程池（ProcessPoolExecutor），None表示在当前线程解密
+        """
+        params = cls.decide_encode_params(decoded_save_path, encode_params)
+        if process_pool is None:
+            cls.decode_bytes_and_save(num, data, decoded_save_path, params)
+        else:
+            process_pool.submit(JmImageTool.decode_bytes_and_save, num, data, decoded_save_path, params).result()
+
+    @classmethod
+    def save_resp_img(cls, resp: Any, filepath: str, need_convert=True, encode_params: Optional[dict] = None):
         """
         接收HTTP响应对象，将其保存到图片文件.
         如果需要改变图片的文件格式，比如 .jpg → .png，则需要指定参数 neet_convert=True.
@@ -739,80 +805,118 @@ class JmImageTool:
         :param resp: JmImageResp
         :param filepath: 图片文件路径
         :param need_convert: 是否转换图片
+        :param encode_params: 编码参数，见 save_image
         """
         if need_convert is False:
             cls.save_directly(resp, filepath)
         else:
-            cls.save_image(cls.open_image(resp.content), filepath)
+            cls.save_image(cls.open_image(resp.content), filepath, encode_params)
 
     @classmethod
-    def save_image(cls, image: Image, filepath: str):
+    def save_image(cls, image: Image, filepath: str, encode_params: Optional[dict] = None):
         """
         保存图片
 
         :param image: PIL.Image对象
         :param filepath: 保存文件路径
+        :param encode_params: 传给 PIL.Image.save 的编码参数，默认使用PIL的默认参数
         """
-        image.save(filepath)
+        encode_params = encode_params or {}
+
+        # 先写入.part文件，PIL无法从.part后缀推断格式，需要指定
+        writer = JmPartFileWriter(filepath)
+        try:
+            image.save(writer.part_path, format=cls.decide_image_format(filepath), **encode_params)
+            writer.commit()
+        finally:
+            writer.discard()
+
+    @classmethod
+    def decide_image_format(cls, filepath: str) -> Optional[str]:
+        return Image.registered_extensions().get(os.path.splitext(filepath)[1].lower(), None)
 
     @classmethod
     def save_directly(cls, resp, filepath):
-        from common import save_resp_content
-        save_resp_content(resp, filepath)
+        writer = JmPartFileWriter(filepath)
+        try:
+            writer.open()
+            writer.write(resp.content)
+            writer.commit()
+        finally:
+            writer.discard()
+
+    @classmethod
+    def is_image_complete(cls, filepath: str) -> bool:
+        """
+        图片文件能否完整解码，用于检查没有下载记录的已存在图片（被截断的图片解码时会报错）
+        """
+        try:
+            with Image.open(filepath) as image:
+                image.load()
+            return True
+        except Exception:
+            return False
 
     @classmethod
     def decode_and_save(cls,
                         num: int,
                         img_src: Image,
-                        decoded_save_path: str
+                        decoded_save_path: str,
+                        encode_params: Optional[dict] = None,
                         ) -> None:
         """
         解密图片并保存
         :param num: 分割数，可以用 cls.calculate_segmentation_num 计算
         :param img_src: 原始图片
         :param decoded_save_path: 解密图片的保存路径
+        :param encode_params: 编码参数，见 save_image
         """
 
         # 无需解密，直接保存
         if num == 0:
-            cls.save_image(img_src, decoded_save_path)
+            cls.save_image(img_src, decoded_save_path, encode_params)
             return
 
-        import math
-        w, h = img_src.size
+        # 保存到新的解密文件
+        cls.save_image(cls.decode_image(num, img_src), decoded_save_path, encode_params)
+
+    @classmethod
+    def decode_segments(cls, h: int, num: int) -> List[Tuple[int, int]]:
+        """
+        解密时的分段，按解密后图片从上到下的顺序返回每一段在原图中的 (起始行, 行数)
 
-        # 创建新的解密图片
-        img_decode = Image.new("RGB", (w, h))
+        原图被横向切成num段并倒序排列，除法的余数over行并入最底下一段（解密后的第一段）
+        """
+        move = h // num
         over = h % num
+        segments = []
         for i in range(num):
-            move = math.floor(h / num)
             y_src = h - (move * (i + 1)) - over
-            y_dst = move * i
+            segments.append((y_src, move + over) if i == 0 else (y_src, move))
+        return segments
 
-            if i == 0:
-                move += over
-            else:
-                y_dst += over
+    @classmethod
+    def decode_image(cls, num: int, img_src: Image) -> Image:
+        """
+        解密图片：按 decode_segments 把原图的每一段复制到新图片中。
 
+        新图片不做初始化（每一行都会被覆盖），crop和paste都在Pillow内部按行复制，
+        比先tobytes再按行重排字节更快：Pillow内部RGB每个像素占4字节，tobytes/frombytes需要逐像素转换，
+        见 usage/benchmark_decode_image.py
+        """
+        w, h = img_src.size
+        img_decode = Image.new("RGB", (w, h), None)
+        y_dst = 0
+        for y_src, move in cls.decode_segments(h, num):
             img_decode.paste(
                 img_src.crop((
                     0, y_src,
                     w, y_src + move
                 )),
-                (
-                    0, y_dst,
-                    w, y_dst + move
-                )
+                (0, y_dst)
             )
-
-            # save every step result
-            # cls.save_image(img_decode, change_file_name(
-            #     decoded_save_path,
-            #     f'{of_file_name(decoded_save_path, trim_suffix=True)}_{i}{of_file_suffix(decoded_save_path)}'
-            # ))
-
-        # 保存到新的解密文件
-        cls.save_image(img_decode, decoded_save_path)
+            y_dst += move
+        return img_decode
 
     @classmethod
     def open_image(cls, fp: Union[str, bytes]):
@@ -937,3 +1041,1173 @@ class JmCryptoTool:
 
         from hashlib import md5
         return md5(key.encode("utf-8")).hexdigest()
+
+
+class JmCancelToken:
+    """
+    下载的取消/暂停令牌，用于在下载过程中从其他线程取消或暂停下载
+
+    使用方式:
+    token = JmCancelToken()
+    downloader = JmDownloader(option, cancel_token=token)
+    # 在其他线程中
+    token.pause() / token.resume() / token.cancel()
+
+    - 下载器在每个章节、每张图片开始前检查令牌，暂停时会阻塞在这里，直到恢复或取消
+    - 客户端在每次请求（包括重试）前检查令牌，取消后抛出 DownloadCancelledException
+    - 已经发出的请求不会被打断，会等它完成或超时
+
+    传入parent时，parent被取消会同时取消这个令牌（反之不会），用于只取消一部分请求，例如对冲请求中落败的一方
+    """
+
+    def __init__(self, parent: Optional['JmCancelToken'] = None):
+        from threading import Event
+        from weakref import WeakSet
+        self._cancelled = Event()
+        self._running = Event()
+        self._running.set()
+        self._children = WeakSet()
+        # 取消时调用的函数，用于唤醒等待中的协程，见 async_sleep
+        self._listeners = set()
+
+        if parent is not None:
+            parent._children.add(self)
+            if parent.is_cancelled:
+                self.cancel()
+
+    def cancel(self):
+        self._cancelled.set()
+        # 唤醒暂停中的线程，让它们退出
+        self._running.set()
+        for child in list(self._children):
+            child.cancel()
+        for listener in list(self._listeners):
+            listener()
+
+    def pause(self):
+        if not self._cancelled.is_set():
+            self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def is_paused(self) -> bool:
+        return not self._running.is_set()
+
+    def raise_if_cancelled(self):
+        if self._cancelled.is_set():
+            ExceptionTool.raises('下载已取消', etype=DownloadCancelledException)
+
+    def wait_if_paused(self):
+        """
+        暂停时阻塞直到恢复，之后检查是否已取消
+        """
+        self._running.wait()
+        self.raise_if_cancelled()
+
+    def sleep(self, seconds: float):
+        """
+        等待seconds秒，期间被取消会立即抛出 DownloadCancelledException
+        """
+        self._cancelled.wait(seconds)
+        self.raise_if_cancelled()
+
+    async def async_sleep(self, seconds: float):
+        """
+        sleep 的协程版本，期间被取消（可以在其他线程中取消）会立即抛出 DownloadCancelledException
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+
+        self._listeners.add(wake)
+        try:
+            if not self.is_cancelled:
+                await asyncio.wait([woken], timeout=seconds)
+        finally:
+            self._listeners.discard(wake)
+            woken.cancel()
+
+        self.raise_if_cancelled()
+
+
+class JmDelayedCall:
+    """
+    延迟调用：delay秒后在新线程中调用func，到期前可以取消，用于对冲请求
+
+    所有延迟调用共用一个计时线程，到期时才为func创建线程，到期前被取消的调用不会创建线程
+    """
+    condition = Condition()
+    heap: List[tuple] = []
+    counter = itertools.count()
+    timer_thread = None
+
+    def __init__(self, delay: float, func: Callable):
+        self.deadline = time.monotonic() + delay
+        self.func = func
+        self.cancelled = False
+        self.started = False
+
+    @classmethod
+    def schedule(cls, delay: float, func: Callable) -> 'JmDelayedCall':
+        call = cls(delay, func)
+        with cls.condition:
+            heapq.heappush(cls.heap, (call.deadline, next(cls.counter), call))
+            if cls.timer_thread is None:
+                cls.timer_thread = Thread(target=cls.run_timer, daemon=True)
+                cls.timer_thread.start()
+            cls.condition.notify()
+        return call
+
+    def cancel(self) -> bool:
+        """
+        :return: 是否取消成功，func已经开始执行时返回False
+        """
+        with self.condition:
+            if self.started:
+                return False
+            self.cancelled = True
+            return True
+
+    @classmethod
+    def run_timer(cls):
+        while True:
+            with cls.condition:
+                while True:
+                    while len(cls.heap) != 0 and cls.heap[0][2].cancelled:
+                        heapq.heappop(cls.heap)
+
+                    if len(cls.heap) == 0:
+                        cls.condition.wait()
+                        continue
+
+                    wait = cls.heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        break
+                    cls.condition.wait(wait)
+
+                call = heapq.heappop(cls.heap)[2]
+                call.started = True
+
+            Thread(target=call.func, daemon=True).start()
+
+
+class JmTokenBucket:
+    """
+    令牌桶，每秒产生rate个令牌，最多存capacity个（允许的突发量）
+
+    允许透支：取走的令牌数可以超过桶中现有的令牌，之后的使用方需要等到还清才能继续，
+    用于按响应大小限速这种事先不知道用量的场景
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        from threading import Lock
+        self.lock = Lock()
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def set_rate(self, rate: float, capacity: Optional[float] = None):
+        with self.lock:
+            self._refill()
+            self.rate = rate
+            self.capacity = capacity or rate
+            self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def consume(self, amount: float = 1) -> float:
+        """
+        取走amount个令牌，返回需要等待的秒数（等到这些令牌产生出来）
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def debt_seconds(self) -> float:
+        """
+        还清透支需要等待的秒数
+        """
+        with self.lock:
+            self._refill()
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self, amount: float = 1):
+        wait = self.consume(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class JmRateLimiter:
+    """
+    请求限速器，同时限制每秒请求数（rps）和每秒字节数（bps）
+
+    限速器注册在 JmModuleConfig.REGISTRY_RATE_LIMITER 中，进程内所有Client共享，
+    AbstractJmClient.get/post 发出的每个请求（包括重试）都会经过限速器。
+
+    可以通过option配置:
+    client:
+      rate_limit:
+        api: {rps: 5}                   # 接口请求
+        image: {rps: 20, bps: 5242880}  # 图片请求，每秒20张、5MB
+        cdn-msp.jmapiproxy3.cc: {rps: 10}  # 指定域名
+
+    也可以通过代码配置:
+    JmModuleConfig.register_rate_limiter('image', rps=20, bps=5 * 1024 * 1024)
+    """
+
+    CATEGORY_API = 'api'
+    CATEGORY_IMAGE = 'image'
+
+    def __init__(self, rps: Optional[float] = None, bps: Optional[float] = None):
+        self.request_bucket: Optional[JmTokenBucket] = None
+        self.byte_bucket: Optional[JmTokenBucket] = None
+        self.set_rate(rps, bps)
+
+    def set_rate(self, rps: Optional[float], bps: Optional[float]):
+        self.request_bucket = self._update_bucket(self.request_bucket, rps)
+        self.byte_bucket = self._update_bucket(self.byte_bucket, bps)
+
+    @staticmethod
+    def _update_bucket(bucket: Optional[JmTokenBucket], rate) -> Optional[JmTokenBucket]:
+        if not rate:
+            return None
+        rate = float(rate)
+        if bucket is None:
+            return JmTokenBucket(rate)
+        bucket.set_rate(rate)
+        return bucket
+
+    def before_request(self):
+        """
+        请求前调用，等待到允许发出请求
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def reserve(self) -> float:
+        """
+        预定一次请求，返回发出请求前需要等待的秒数，由调用方自行等待（例如asyncio.sleep）
+        """
+        wait = 0
+        request_bucket, byte_bucket = self.request_bucket, self.byte_bucket
+        if request_bucket is not None:
+            wait = request_bucket.consume(1)
+        if byte_bucket is not None:
+            # 响应大小事先未知，先等前面的请求把流量透支还清
+            wait = max(wait, byte_bucket.debt_seconds())
+        return wait
+
+    def after_response(self, size: int):
+        """
+        拿到响应后调用，按响应大小扣除流量
+        """
+        byte_bucket = self.byte_bucket
+        if byte_bucket is not None and size:
+            byte_bucket.consume(size)
+
+    @classmethod
+    def apply_config(cls, rate_limit: Optional[dict]):
+        """
+        把option中的 client.rate_limit 配置注册到 JmModuleConfig
+        """
+        if not rate_limit:
+            return
+
+        for key, conf in rate_limit.items():
+            conf = conf or {}
+            JmModuleConfig.register_rate_limiter(key, conf.get('rps', None), conf.get('bps', None))
+
+    @classmethod
+    def decide_limiters(cls, category: str, url: str) -> List['JmRateLimiter']:
+        """
+        找出一个请求适用的限速器：所属类别（api/image）的，和所请求域名的
+        """
+        registry = JmModuleConfig.REGISTRY_RATE_LIMITER
+        if not registry:
+            return []
+
+        from urllib.parse import urlparse
+        limiters = []
+        for key in (category, urlparse(url).hostname):
+            limiter = registry.get(key, None)
+            if limiter is not None:
+                limiters.append(limiter)
+        return limiters
+
+
+class JmRetryPolicy:
+    """
+    请求重试策略
+
+    - 每个域名最多请求 retry_times + 1 次，全部失败后换下一个域名，换域名时不等待
+    - 同一个域名的两次请求之间等待 backoff * factor ^ (n - 1) 秒（n为第几次重试），不超过max_backoff，
+      再乘以 [1 - jitter, 1 + jitter] 之间的随机数，避免多个线程同时重试
+    - 从第一次请求开始，总耗时会超过max_total_time时不再重试，None表示不限制
+    - no_retry中的异常（及其子类）直接上抛，不重试，例如本子不存在时重试也没有意义
+
+    可以通过option配置:
+    client:
+      retry:
+        backoff: 0.2
+        factor: 2
+        max_backoff: 5
+        jitter: 0.5
+        max_total_time: null
+        no_retry:
+          - MissingAlbumPhotoException
+    """
+
+    def __init__(self,
+                 backoff: float = 0.2,
+                 factor: float = 2,
+                 max_backoff: float = 5,
+                 jitter: float = 0.5,
+                 max_total_time: Optional[float] = None,
+                 no_retry=(MissingAlbumPhotoException,),
+                 ):
+        self.backoff = backoff
+        self.factor = factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.max_total_time = max_total_time
+        # 取消下载总是不重试
+        self.no_retry: Tuple[Type[BaseException], ...] = (
+            DownloadCancelledException,
+            *(self.resolve_exception_type(etype) for etype in (no_retry or [])),
+        )
+
+    @classmethod
+    def from_config(cls, conf: Optional[dict]) -> 'JmRetryPolicy':
+        """
+        根据option的 client.retry 配置创建重试策略，未配置的项使用默认值
+        """
+        return cls(**(conf or {}))
+
+    @staticmethod
+    def resolve_exception_type(etype) -> Type[BaseException]:
+        """
+        option配置中的异常是字符串，先找jmcomic的异常类，再找python内置异常
+        """
+        if isinstance(etype, type):
+            return etype
+
+        import builtins
+        import sys
+        for module in (sys.modules[JmcomicException.__module__], builtins):
+            clazz = getattr(module, etype, None)
+            if isinstance(clazz, type) and issubclass(clazz, BaseException):
+                return clazz
+
+        ExceptionTool.raises(f'重试策略配置了不存在的异常类型: {etype}')
+
+    def should_retry(self, e: BaseException) -> bool:
+        return not isinstance(e, self.no_retry)
+
+    def decide_backoff(self, retry_count: int) -> float:
+        """
+        第retry_count次重试前需要等待的秒数
+        """
+        if not self.backoff:
+            return 0
+
+        import random
+        delay = min(self.max_backoff, self.backoff * self.factor ** (retry_count - 1))
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(0.0, delay)
+
+    def is_out_of_time(self, start_time: float, delay: float) -> bool:
+        """
+        等待delay秒后再重试，是否会超过总耗时限制
+        """
+        if self.max_total_time is None:
+            return False
+        return time.monotonic() - start_time + delay > self.max_total_time
+
+
+class JmDomainHealth:
+    """
+    单个域名的健康度
+
+    state:
+    - closed: 正常，参与排序
+    - open: 熔断，排到最后，由后台线程探测恢复
+    - half_open: 熔断中，后台探测正在进行
+    """
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half_open'
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self.state = self.STATE_CLOSED
+        # 成功请求耗时的指数加权移动平均，单位秒，None表示还没有成功过
+        self.latency: Optional[float] = None
+        # 失败率的指数加权移动平均，0~1
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        # 最近若干次成功请求的耗时，用于计算分位数
+        from collections import deque
+        self.samples = deque(maxlen=100)
+
+    def to_dict(self):
+        return {
+            'domain': self.domain,
+            'state': self.state,
+            'latency': self.latency,
+            'error_rate': self.error_rate,
+            'consecutive_failures': self.consecutive_failures,
+        }
+
+
+class JmDomainHealthTracker:
+    """
+    域名健康度统计，进程内所有Client共享，见 JmModuleConfig.domain_health_tracker()
+
+    - 每次请求后记录耗时和成败，更新延迟和失败率的指数加权移动平均（EWMA）
+    - 连续失败failure_threshold次后熔断（open），熔断的域名排到最后，
+      由后台线程每隔一段时间探测一次，探测成功后恢复（closed），不占用正常请求
+    - sort() 返回按健康度排序的域名列表：正常的域名按 延迟 * (1 + error_penalty * 失败率) 从小到大，
+      没有延迟数据的域名使用已知延迟的平均值，分数相同时保持原顺序；熔断的域名排在最后
+    """
+
+    def __init__(self,
+                 alpha: float = 0.3,
+                 failure_threshold: int = 3,
+                 probe_interval: float = 30,
+                 max_probe_interval: float = 600,
+                 error_penalty: float = 4,
+                 ):
+        from threading import Lock
+        self.lock = Lock()
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.error_penalty = error_penalty
+        self.health_dict: Dict[str, JmDomainHealth] = {}
+
+    def get(self, domain: str) -> JmDomainHealth:
+        health = self.health_dict.get(domain, None)
+        if health is None:
+            health = self.health_dict.setdefault(domain, JmDomainHealth(domain))
+        return health
+
+    def _ewma(self, old: Optional[float], value: float) -> float:
+        if old is None:
+            return value
+        return self.alpha * value + (1 - self.alpha) * old
+
+    def record_success(self, domain: str, latency: float):
+        with self.lock:
+            health = self.get(domain)
+            health.latency = self._ewma(health.latency, latency)
+            health.samples.append(latency)
+            health.error_rate = self._ewma(health.error_rate, 0.0)
+            health.consecutive_failures = 0
+            if health.state != health.STATE_CLOSED:
+                jm_log('domain.health', f'域名恢复: {domain}')
+            health.state = health.STATE_CLOSED
+
+    def record_failure(self, domain: str, probe: Optional[Callable[[], None]] = None):
+        """
+        记录一次失败，达到阈值时熔断
+
+        :param probe: 探测域名是否恢复的函数，抛异常表示未恢复。熔断时用它启动后台探测
+        """
+        with self.lock:
+            health = self.get(domain)
+            health.error_rate = self._ewma(health.error_rate, 1.0)
+            health.consecutive_failures += 1
+            if health.state != health.STATE_CLOSED or health.consecutive_failures < self.failure_threshold:
+                return
+
+            health.state = health.STATE_OPEN
+            health.opened_at = time.monotonic()
+
+        jm_log('domain.health', f'域名连续失败{health.consecutive_failures}次，暂停使用: {domain}')
+        if probe is not None:
+            from threading import Thread
+            Thread(target=self._probe_until_recovered, args=(domain, probe), daemon=True).start()
+
+    def _probe_until_recovered(self, domain: str, probe: Callable[[], None]):
+        interval = self.probe_interval
+        while True:
+            time.sleep(interval)
+
+            with self.lock:
+                health = self.get(domain)
+                if health.state != health.STATE_OPEN:
+                    return
+                health.state = health.STATE_HALF_OPEN
+
+            start = time.monotonic()
+            try:
+                probe()
+            except Exception as e:
+                jm_log('domain.health', f'域名探测失败: {domain}, {e}')
+                with self.lock:
+                    health.state = health.STATE_OPEN
+                    health.opened_at = time.monotonic()
+                interval = min(interval * 2, self.max_probe_interval)
+                continue
+
+            self.record_success(domain, time.monotonic() - start)
+            return
+
+    def sort(self, domain_list: List[str]) -> List[str]:
+        """
+        按健康度对域名排序，不会去掉任何域名
+        """
+        with self.lock:
+            healths = [self.get(domain) for domain in domain_list]
+
+        known = [h.latency for h in healths if h.latency is not None]
+        default_latency = sum(known) / len(known) if known else 1
+
+        def score(pair):
+            index, health = pair
+            if health.state != health.STATE_CLOSED:
+                return 1, health.opened_at, index
+
+            latency = health.latency if health.latency is not None else default_latency
+            return 0, latency * (1 + self.error_penalty * health.error_rate), index
+
+        return [health.domain for _, health in sorted(enumerate(healths), key=score)]
+
+    def choose(self, domain_list: List[str]) -> str:
+        """
+        从多个等价的域名中选一个（例如图片域名）：在正常的域名中随机选，延迟越低的被选中的概率越大
+        """
+        import random
+        with self.lock:
+            healths = [self.get(domain) for domain in domain_list]
+
+        candidates = [h for h in healths if h.state == h.STATE_CLOSED] or healths
+        known = [h.latency for h in candidates if h.latency is not None]
+        default_latency = sum(known) / len(known) if known else 1
+        weights = [1 / max(h.latency if h.latency is not None else default_latency, 0.001) for h in candidates]
+        return random.choices(candidates, weights)[0].domain
+
+    def latency_percentile(self, domain: str, q: float = 0.95, min_samples: int = 5) -> Optional[float]:
+        """
+        域名最近成功请求耗时的分位数，样本不足min_samples个时返回None
+        """
+        with self.lock:
+            samples = sorted(self.get(domain).samples)
+
+        if len(samples) < min_samples:
+            return None
+        return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+    def is_known(self, domain: str) -> bool:
+        """
+        是否已有该域名的统计数据（成功或失败过）
+        """
+        with self.lock:
+            health = self.health_dict.get(domain, None)
+        return health is not None and (health.latency is not None or health.error_rate > 0)
+
+    def snapshot(self) -> List[dict]:
+        with self.lock:
+            return [health.to_dict() for health in self.health_dict.values()]
+
+
+class JmSessionPool:
+    """
+    进程内共享的HTTP会话池，见 JmModuleConfig.FLAG_SHARE_POSTMAN_SESSION
+
+    会话按 (postman类型, proxies, impersonate) 区分，配置相同的Client共用一个会话，
+    从而复用TCP连接和TLS会话。curl_cffi的会话在每个线程使用各自的curl句柄，可以跨线程共享。
+
+    共享的会话不保存任何cookies，cookies由每个 JmPooledPostman 各自保存，每次请求时传给会话，
+    所以一个Client收到的cookies（例如登录后的AVS）不会被其他Client发送
+    """
+
+    # postman类型 → 对应的会话类型
+    SESSION_TYPE = {
+        'curl_cffi': 'curl_cffi_session',
+        'curl_cffi_session': 'curl_cffi_session',
+        'requests': 'requests-session',
+        'requests-session': 'requests-session',
+    }
+
+    lock = Lock()
+    session_dict: Dict[tuple, Any] = {}
+
+    @classmethod
+    def freeze(cls, value):
+        if isinstance(value, dict):
+            return tuple(sorted((str(k), cls.freeze(v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple, set)):
+            return tuple(cls.freeze(v) for v in value)
+        return value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+
+    @classmethod
+    def get_session(cls, session_type: str, meta_data: dict):
+        key = (
+            session_type,
+            cls.freeze(meta_data.get('proxies', None)),
+            cls.freeze(meta_data.get('impersonate', None)),
+        )
+
+        with cls.lock:
+            session = cls.session_dict.get(key, None)
+            if session is None:
+                jm_log('postman.pool', f'创建共享会话: {session_type}')
+                session = cls.new_session(session_type, meta_data)
+                cls.session_dict[key] = session
+            return session
+
+    @classmethod
+    def new_session(cls, session_type: str, meta_data: dict):
+        if session_type == 'requests-session':
+            import requests
+            from http.cookiejar import DefaultCookiePolicy
+            session = requests.Session()
+            # 拒绝保存任何cookies
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            return session
+
+        from curl_cffi import requests
+        kwargs = {k: meta_data[k] for k in ('impersonate', 'proxies') if meta_data.get(k, None) is not None}
+        return requests.Session(discard_cookies=True, **kwargs)
+
+    @classmethod
+    def create_postman(cls, postman_conf: dict):
+        """
+        根据option中的postman配置创建postman，类型可共享时返回 JmPooledPostman，否则与 Postmans.create 相同
+        """
+        from common import Postmans
+        postman_type = postman_conf.get('type', 'requests')
+        session_type = cls.SESSION_TYPE.get(postman_type, None)
+        if not JmModuleConfig.FLAG_SHARE_POSTMAN_SESSION or session_type is None:
+            return Postmans.create(data=postman_conf)
+
+        # 复用 Postmans 的配置解析（代理字符串、key别名等）
+        builder = Postmans.PostmanDslBuilder()
+        if 'metadata' in postman_conf:
+            postman_conf.setdefault('meta_data', postman_conf['metadata'])
+        builder.proxy_handler(postman_conf)
+        meta_data = postman_conf.setdefault('meta_data', {})
+        if session_type == 'requests-session':
+            meta_data.pop('impersonate', None)
+
+        # 原本就是会话类型的postman，保留服务器返回的cookies
+        return JmPooledPostman(meta_data, session_type, keep_cookies=postman_type == session_type)
+
+    @classmethod
+    def clear(cls):
+        if cls.lock is None:
+            return
+
+        with cls.lock:
+            sessions = list(cls.session_dict.values())
+            cls.session_dict.clear()
+
+        for session in sessions:
+            try:
+                session.close()
+            except Exception as e:
+                jm_log('postman.pool.error', f'关闭会话失败: {e}')
+
+
+class JmPooledPostman(AbstractPostman):
+    """
+    使用 JmSessionPool 中共享会话的postman，meta_data（headers、cookies等）仍是每个postman独立的，每次请求时传给会话
+
+    :param keep_cookies: 是否把服务器返回的cookies保存到自己的meta_data中（与会话类型的postman相同），
+                         False时与无状态的postman相同，只发送配置的cookies
+    """
+    postman_key = 'jm_pooled_session'
+
+    def __init__(self, kwargs: dict, session_type='curl_cffi_session', keep_cookies=False) -> None:
+        super().__init__(kwargs)
+        self.session_type = session_type
+        self.keep_cookies = keep_cookies
+        self.session = JmSessionPool.get_session(session_type, kwargs)
+
+    def get(self, url, **kwargs):
+        return self.save_resp_cookies(super().get(url, **kwargs))
+
+    def post(self, url, **kwargs):
+        return self.save_resp_cookies(super().post(url, **kwargs))
+
+    def save_resp_cookies(self, resp):
+        if self.keep_cookies and len(resp.cookies) != 0:
+            # 替换而不是修改原dict，其他线程可能正在用它发请求
+            self.meta_data['cookies'] = {**(self.meta_data.get('cookies', None) or {}), **dict(resp.cookies.items())}
+        return resp
+
+    def __get__(self):
+        return self.session.get
+
+    def __post__(self):
+        return self.session.post
+
+    def copy(self):
+        return self.__class__(self.meta_data.copy(), self.session_type, self.keep_cookies)
+
+
+class JmPartFileWriter:
+    """
+    先写入 path.part，完成后通过 os.replace 原子地重命名为 path，
+    写到一半的进程崩溃或下载失败只会留下 .part 文件，不会出现不完整的目标文件
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.part_path = path + '.part'
+        self.file = None
+        self.size = 0
+
+    def open(self):
+        """
+        开始（重新）写入，清空之前写入的数据
+        """
+        self.close()
+        of_dir_path(self.path, mkdir=True)
+        self.file = open(self.part_path, 'wb')
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def commit(self):
+        self.close()
+        os.replace(self.part_path, self.path)
+
+    def discard(self):
+        """
+        删除未提交的 .part 文件，已提交时无操作
+        """
+        self.close()
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+
+class JmDownloadJournal:
+    """
+    一个本子的下载日志，jsonl格式，每行是一张图片的一条记录：
+    {"path": 保存路径, "url": 图片url, "status": "started"/"done", "size": 文件大小, "md5": 文件md5}
+
+    下载前写入 started，保存完成后写入 done（同一路径以最后一条为准）。
+    重新下载时，只有 done 且文件与记录一致的图片才会跳过，其他图片（未完成、文件被截断或修改）会重新下载。
+    """
+    STATUS_STARTED = 'started'
+    STATUS_DONE = 'done'
+
+    def __init__(self, filepath: str):
+        from threading import Lock
+        self.filepath = filepath
+        self.lock = Lock()
+        self.records: Dict[str, dict] = {}
+        self.load()
+
+    def load(self):
+        if not file_exists(self.filepath):
+            return
+
+        import json
+        line_count = 0
+        with open(self.filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                line_count += 1
+                try:
+                    record = json.loads(line)
+                    self.records[record['path']] = record
+                except (ValueError, KeyError, TypeError):
+                    # 进程崩溃时写了一半的行
+                    continue
+
+        if line_count != len(self.records):
+            self.compact()
+
+    def compact(self):
+        """
+        只保留每张图片的最后一条记录，同时去掉写了一半的行
+        """
+        import json
+        writer = JmPartFileWriter(self.filepath)
+        try:
+            writer.open()
+            for record in self.records.values():
+                writer.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            writer.commit()
+        finally:
+            writer.discard()
+
+    def append(self, record: dict):
+        import json
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            of_dir_path(self.filepath, mkdir=True)
+            with open(self.filepath, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self.records[record['path']] = record
+
+    def start(self, path: str, url: str):
+        self.append({'path': path, 'url': url, 'status': self.STATUS_STARTED})
+
+    def done(self, path: str, url: str):
+        self.append({
+            'path': path,
+            'url': url,
+            'status': self.STATUS_DONE,
+            'size': os.path.getsize(path),
+            'md5': self.checksum(path),
+        })
+
+    def verify(self, path: str, url: str, verify: str = 'size') -> bool:
+        """
+        已存在的图片能否直接使用（不重新下载）
+
+        :param path: 图片路径
+        :param url: 图片url，没有记录的图片检查通过后会补上记录
+        :param verify: size 比较文件大小，checksum 比较文件大小和md5
+        """
+        if not file_exists(path):
+            return False
+
+        record = self.records.get(path, None)
+
+        if record is None:
+            # 开启日志前下载的图片，解码检查是否完整
+            if not JmImageTool.is_image_complete(path):
+                return False
+            self.done(path, url)
+            return True
+
+        if record['status'] != self.STATUS_DONE or os.path.getsize(path) != record['size']:
+            return False
+
+        if verify == 'checksum':
+            return self.checksum(path) == record['md5']
+
+        return True
+
+    @classmethod
+    def checksum(cls, path: str) -> str:
+        import hashlib
+        hash_md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hash_md5.update(chunk)
+        return hash_md5.hexdigest()
+
+
+class JmLruCache:
+    """
+    有容量和过期时间上限的内存缓存，用法同dict，通过 client.cache 配置，见 CacheRegistry.level_option
+
+    :param max_size: 最多缓存多少条，超过时删除最久没有被访问的条目（LRU），None表示不限制
+    :param ttl: 过期时间（秒），None表示不过期
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None):
+        from collections import OrderedDict
+        from threading import Lock
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = Lock()
+        # key → (写入时间, value)，最久没有被访问的在最前面
+        self.data: OrderedDict = OrderedDict()
+        self.metrics = {'hit': 0, 'miss': 0, 'expired': 0, 'set': 0, 'evicted': 0}
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key, None)
+            if item is None:
+                self.metrics['miss'] += 1
+                return default
+
+            created, value = item
+            if self.is_expired(created, time.monotonic()):
+                del self.data[key]
+                self.metrics['expired'] += 1
+                self.metrics['miss'] += 1
+                return default
+
+            self.data.move_to_end(key)
+            self.metrics['hit'] += 1
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            now = time.monotonic()
+            self.data[key] = (now, value)
+            self.data.move_to_end(key)
+            self.metrics['set'] += 1
+
+            # 顺便清理最前面已过期的条目，只配置ttl时也不会无限增长
+            while len(self.data) != 0 and self.is_expired(next(iter(self.data.values()))[0], now):
+                self.data.popitem(last=False)
+                self.metrics['expired'] += 1
+
+            if self.max_size is not None:
+                while len(self.data) > self.max_size:
+                    self.data.popitem(last=False)
+                    self.metrics['evicted'] += 1
+
+    def is_expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def __getitem__(self, key):
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        with self.lock:
+            stats: dict = dict(self.metrics)
+            stats['size'] = len(self.data)
+
+        total = stats['hit'] + stats['miss']
+        stats['hit_rate'] = stats['hit'] / total if total != 0 else 0.0
+        return stats
+
+
+class JmSqliteCache:
+    """
+    持久化到SQLite文件的client缓存，进程退出后仍然有效，通过 client.cache 配置，见 CacheRegistry.level_sqlite
+
+    - 缓存client的 func_to_cache（本子/章节详情、搜索结果）和scramble_id，值使用pickle序列化
+    - 按类型设置过期时间（秒），None表示不过期，见 DEFAULT_TTL
+    - 条目数超过 max_size 时，删除最久没有被访问的条目（LRU）
+      条目数在内存中计数，每 COUNT_SYNC_INTERVAL 次写入才用 COUNT(*) 校准一次（其他进程也可能写入同一文件）
+      命中时的访问时间先记在内存中，攒够 ACCESS_FLUSH_SIZE 条、淘汰前或close时再批量写入
+    - stats() 返回命中、未命中、过期、淘汰等统计
+
+    注意：缓存文件中保存的是pickle数据，不要使用来源不可信的缓存文件
+    """
+    DEFAULT_TTL = {
+        'album': 24 * 3600,  # 本子会更新章节
+        'photo': 7 * 24 * 3600,
+        'search': 3600,
+        'scramble': None,
+        'other': 24 * 3600,
+    }
+    COUNT_SYNC_INTERVAL = 1000
+    ACCESS_FLUSH_SIZE = 100
+
+    def __init__(self, path: str, max_size: Optional[int] = 100000, ttl: Optional[Dict[str, Optional[int]]] = None):
+        import sqlite3
+        from threading import Lock
+        self.path = path
+        self.max_size = max_size
+        self.ttl = {**self.DEFAULT_TTL, **(ttl or {})}
+        self.lock = Lock()
+        self.metrics = {'hit': 0, 'miss': 0, 'expired': 0, 'set': 0, 'evicted': 0}
+
+        of_dir_path(path, mkdir=True)
+        # 自动提交，多个线程共用一个连接（由self.lock保护），多个进程之间由SQLite的文件锁保护
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                          'key TEXT PRIMARY KEY, kind TEXT NOT NULL, value BLOB NOT NULL, '
+                          'created REAL NOT NULL, accessed REAL NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+
+        # 内存中的条目数和待写入的访问时间，由self.lock保护
+        self.size = self.conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        self.set_since_sync = 0
+        self.pending_access: Dict[str, float] = {}
+
+    @classmethod
+    def make_key(cls, client_key: str, func_name: str, args: tuple, kwargs: dict) -> str:
+        """
+        多次运行之间不变的缓存key（内存缓存的key使用hash，每次运行都不同）
+
+        key包含client_key，html和api的client返回的实体字段不完全相同，共用一个缓存文件时不能混用
+        """
+        import json
+
+        def stable(v):
+            return v.__name__ if isinstance(v, type) else v
+
+        return json.dumps([client_key, func_name, [stable(v) for v in args], {k: stable(v) for k, v in sorted(kwargs.items())}],
+                          ensure_ascii=False,
+                          default=repr,
+                          )
+
+    @classmethod
+    def kind_of(cls, value) -> str:
+        if isinstance(value, JmAlbumDetail):
+            return 'album'
+        if isinstance(value, JmPhotoDetail):
+            return 'photo'
+        if isinstance(value, JmSearchPage):
+            return 'search'
+        return 'other'
+
+    def get(self, key: str, default=None):
+        import pickle
+        now = time.time()
+
+        with self.lock:
+            row = self.conn.execute('SELECT kind, value, created FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.metrics['miss'] += 1
+                return default
+
+            kind, value, created = row
+            ttl = self.ttl.get(kind, None)
+            if ttl is not None and now - created > ttl:
+                self.delete_row(key)
+                self.metrics['expired'] += 1
+                self.metrics['miss'] += 1
+                return default
+
+            try:
+                value = pickle.loads(value)
+            except Exception as e:
+                # 例如jmcomic升级后实体类发生了变化
+                jm_log('cache.sqlite', f'缓存数据无法反序列化，已删除: [{key}], 异常: [{e}]')
+                self.delete_row(key)
+                self.metrics['miss'] += 1
+                return default
+
+            self.pending_access[key] = now
+            if len(self.pending_access) >= self.ACCESS_FLUSH_SIZE:
+                self.flush_access()
+            self.metrics['hit'] += 1
+            return value
+
+    def delete_row(self, key: str):
+        self.pending_access.pop(key, None)
+        if self.conn.execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount != 0:
+            self.size -= 1
+
+    def flush_access(self):
+        if len(self.pending_access) == 0:
+            return
+
+        self.conn.executemany('UPDATE cache SET accessed = ? WHERE key = ?',
+                              [(accessed, key) for key, accessed in self.pending_access.items()])
+        self.pending_access.clear()
+
+    def set(self, key: str, value, kind: Optional[str] = None):
+        import pickle
+        try:
+            data = pickle.dumps(value)
+        except Exception as e:
+            jm_log('cache.sqlite', f'数据无法序列化，不缓存: [{key}], 异常: [{e}]')
+            return
+
+        kind = kind or self.kind_of(value)
+        now = time.time()
+        with self.lock:
+            # 没有插入说明key已存在，改为更新，这样不用COUNT(*)也能知道条目数是否增加
+            row = (key, kind, data, now, now)
+            if self.conn.execute('INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?, ?)', row).rowcount != 0:
+                self.size += 1
+            else:
+                self.conn.execute('UPDATE cache SET kind = ?, value = ?, created = ?, accessed = ? WHERE key = ?',
+                                  row[1:] + row[:1])
+            self.pending_access.pop(key, None)
+            self.metrics['set'] += 1
+
+            self.set_since_sync += 1
+            if self.set_since_sync >= self.COUNT_SYNC_INTERVAL:
+                self.set_since_sync = 0
+                self.size = self.conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+            self.evict_if_full()
+
+    def evict_if_full(self):
+        if self.max_size is None or self.size <= self.max_size:
+            return
+
+        # 先写入访问时间，按最新的访问时间淘汰
+        self.flush_access()
+        evict = self.size - self.max_size
+        evicted = self.conn.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                                    (evict,)).rowcount
+        self.size -= evicted
+        self.metrics['evicted'] += evicted
+
+    def __getitem__(self, key):
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def namespace(self, kind: str) -> 'JmSqliteCache.Namespace':
+        return self.Namespace(self, kind)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM cache')
+            self.pending_access.clear()
+            self.size = 0
+
+    def close(self):
+        with self.lock:
+            self.flush_access()
+            self.conn.close()
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        with self.lock:
+            stats: dict = dict(self.metrics)
+            stats['size'] = self.conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+        total = stats['hit'] + stats['miss']
+        stats['hit_rate'] = stats['hit'] / total if total != 0 else 0.0
+        return stats
+
+    class Namespace:
+        """
+        以固定的kind读写缓存，key会加上kind前缀，用法同dict，例如 scramble_id 的缓存
+        """
+
+        def __init__(self, cache: 'JmSqliteCache', kind: str):
+            self.cache = cache
+            self.kind = kind
+
+        def get(self, key, default=None):
+            return self.cache.get(f'{self.kind}:{key}', default)
+
+        def __setitem__(self, key, value):
+            self.cache.set(f'{self.kind}:{key}', value, self.kind)
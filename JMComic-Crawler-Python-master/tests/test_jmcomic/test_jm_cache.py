@@ -0,0 +1,365 @@
+from test_jmcomic import *
+
+
+class Test_SqliteCache(unittest.TestCase):
+    """
+    SQLite缓存，只读写临时目录，不需要网络
+    """
+
+    def setUp(self) -> None:
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cache.sqlite3')
+
+    def tearDown(self) -> None:
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def new_cache(self, **kwargs) -> JmSqliteCache:
+        cache = JmSqliteCache(self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_pickle_round_trip(self):
+        album = JmAlbumDetail('123', '0', '0', [], *['0'] * 10)
+        cache = self.new_cache()
+        key = JmSqliteCache.make_key('html', 'get_album_detail', ('123',), {})
+        cache[key] = album
+
+        # 重新打开文件（相当于下次运行）仍能读到，类型和字段不变
+        restored = self.new_cache()[key]
+        self.assertIsInstance(restored, JmAlbumDetail)
+        self.assertEqual(restored.album_id, '123')
+        self.assertEqual(JmSqliteCache.kind_of(restored), 'album')
+
+    def test_make_key_is_stable(self):
+        key = JmSqliteCache.make_key('api', 'search', ('abc', 1), {'main_tag': 0, 'category': JmMagicConstants})
+        self.assertEqual(key, JmSqliteCache.make_key('api', 'search', ('abc', 1), {'category': JmMagicConstants, 'main_tag': 0}))
+        self.assertIn('JmMagicConstants', key)
+        self.assertNotEqual(key, JmSqliteCache.make_key('api', 'search', ('abc', 2), {'main_tag': 0, 'category': JmMagicConstants}))
+        # html和api的client不共用缓存条目
+        self.assertNotEqual(key, JmSqliteCache.make_key('html', 'search', ('abc', 1), {'main_tag': 0, 'category': JmMagicConstants}))
+
+    def test_ttl_expiry(self):
+        cache = self.new_cache(ttl={'other': 0.05, 'scramble': None})
+        cache['a'] = 'value'
+        cache.namespace('scramble')['1'] = 220980
+        self.assertEqual(cache.get('a'), 'value')
+
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'))
+        with self.assertRaises(KeyError):
+            _ = cache['a']
+        # 不过期的类型
+        self.assertEqual(cache.namespace('scramble').get('1'), 220980)
+
+        stats = cache.stats()
+        self.assertEqual(stats['expired'], 1)
+        # 过期的条目被删除
+        self.assertEqual(stats['size'], 1)
+
+    def test_evict_least_recently_accessed(self):
+        cache = self.new_cache(max_size=3)
+        for key in ('a', 'b', 'c'):
+            cache[key] = key
+            time.sleep(0.01)
+
+        # 访问a之后，最久没有被访问的是b
+        self.assertEqual(cache.get('a'), 'a')
+        time.sleep(0.01)
+        cache['d'] = 'd'
+
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual([cache.get(k) for k in ('a', 'c', 'd')], ['a', 'c', 'd'])
+        self.assertEqual(cache.stats()['evicted'], 1)
+
+    def test_size_counted_in_memory(self):
+        cache = self.new_cache(max_size=3)
+        cache['a'] = 1
+        # 覆盖已有的key不增加条目数
+        cache['a'] = 2
+        cache['b'] = 1
+        self.assertEqual(cache.size, 2)
+        self.assertEqual(cache.get('a'), 2)
+
+        cache['c'] = 1
+        cache['d'] = 1
+        self.assertEqual(cache.size, 3)
+        self.assertEqual(len(cache), 3)
+
+        # 重新打开时从文件中读取条目数
+        self.assertEqual(self.new_cache().size, 3)
+
+    def test_access_time_written_in_batch(self):
+        cache = self.new_cache()
+        cache['a'] = 'a'
+
+        def accessed():
+            with cache.lock:
+                return cache.conn.execute('SELECT accessed FROM cache WHERE key = ?', ('a',)).fetchone()[0]
+
+        before = accessed()
+        time.sleep(0.01)
+        self.assertEqual(cache.get('a'), 'a')
+        # 命中时只记在内存中
+        self.assertEqual(accessed(), before)
+
+        with cache.lock:
+            cache.flush_access()
+        self.assertGreater(accessed(), before)
+
+    def test_unreadable_value_is_dropped(self):
+        cache = self.new_cache()
+        with cache.lock:
+            cache.conn.execute('INSERT INTO cache VALUES (?, ?, ?, ?, ?)', ('broken', 'other', b'not pickle', time.time(), time.time()))
+
+        self.assertIsNone(cache.get('broken'))
+        self.assertEqual(len(cache), 0)
+
+    def test_unpicklable_value_is_not_cached(self):
+        cache = self.new_cache()
+        cache['lock'] = Lock()
+        self.assertEqual(len(cache), 0)
+
+
+class Test_LruCache(unittest.TestCase):
+    """
+    内存缓存的容量、过期时间和释放，不需要网络
+    """
+
+    def test_size_bound(self):
+        cache = JmLruCache(max_size=3)
+        for key in 'abc':
+            cache[key] = key
+
+        # 访问a之后，最久没有被访问的是b
+        self.assertEqual(cache['a'], 'a')
+        cache['d'] = 'd'
+
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual([cache[k] for k in 'acd'], list('acd'))
+        self.assertEqual(cache.stats()['evicted'], 1)
+
+    def test_ttl(self):
+        cache = JmLruCache(ttl=0.05)
+        cache['a'] = 1
+        self.assertEqual(cache['a'], 1)
+
+        time.sleep(0.1)
+        with self.assertRaises(KeyError):
+            _ = cache['a']
+        self.assertEqual(len(cache), 0)
+
+    def test_ttl_only_cache_does_not_grow(self):
+        cache = JmLruCache(ttl=0.05)
+        for i in range(10):
+            cache[i] = i
+        time.sleep(0.1)
+
+        # 写入时顺便清理已过期的条目
+        cache['new'] = 'new'
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats()['expired'], 10)
+
+    def test_stats(self):
+        cache = JmLruCache(max_size=10)
+        cache['a'] = 1
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertEqual((stats['hit'], stats['miss'], stats['set'], stats['size']), (1, 1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_config_creates_lru_cache(self):
+        option = JmOption.default()
+        client = JmHtmlClient(JmModuleConfig.new_postman(), ['a.example.com'])
+
+        CacheRegistry.enable_client_cache_on_condition(option, client, {'level': 'level_option', 'max_size': 2, 'ttl': 60})
+        cache = client.get_cache_dict()
+        self.assertIsInstance(cache, JmLruCache)
+        self.assertEqual((cache.max_size, cache.ttl), (2, 60))
+
+        # 同一option的client共用缓存；不配置容量和过期时间时为dict
+        other = JmHtmlClient(JmModuleConfig.new_postman(), ['a.example.com'])
+        CacheRegistry.enable_client_cache_on_condition(option, other, True)
+        self.assertIs(other.get_cache_dict(), cache)
+        self.assertIsInstance(CacheRegistry.level_option(JmOption.default(), None), dict)
+
+    def test_config_string_with_max_size(self):
+        import gc
+        # 回收这里创建的option和client，不影响其他测试统计注册表的条目数
+        self.addCleanup(gc.collect)
+        client = JmHtmlClient(JmModuleConfig.new_postman(), ['a.example.com'])
+
+        CacheRegistry.enable_client_cache_on_condition(JmOption.default(), client, 'level_option_lru:3')
+        cache = client.get_cache_dict()
+        self.assertIsInstance(cache, JmLruCache)
+        self.assertEqual((cache.max_size, cache.ttl), (3, None))
+
+        CacheRegistry.enable_client_cache_on_condition(JmOption.default(), client, 'level_client_lru')
+        self.assertEqual(client.get_cache_dict().max_size, CacheRegistry.DEFAULT_LRU_MAX_SIZE)
+
+        for bad in ('level_option_lru:many', 'level_nothing:10'):
+            with self.assertRaises(JmcomicException):
+                CacheRegistry.enable_client_cache_on_condition(JmOption.default(), client, bad)
+
+    def test_release_with_owner(self):
+        import gc
+        import weakref
+
+        option = JmOption.default()
+        cache = CacheRegistry.level_option(option, None, max_size=10)
+        cache['a'] = 1
+        self.assertIs(CacheRegistry.level_option(option, None), cache)
+
+        cache_ref = weakref.ref(cache)
+        count = len(CacheRegistry.REGISTRY)
+        del option, cache
+        gc.collect()
+
+        # option被回收后，注册表中的缓存也被释放
+        self.assertIsNone(cache_ref())
+        self.assertEqual(len(CacheRegistry.REGISTRY), count - 1)
+
+
+class Test_SingleFlight(unittest.TestCase):
+    """
+    相同的缓存调用同时未命中时只请求一次，不需要网络
+    """
+
+    THREAD_COUNT = 8
+
+    def new_client(self, detail):
+        """
+        fetch_detail_entity（被缓存的方法）等到所有线程都发起调用之后才返回，调用次数记录在 Client.calls
+        """
+        arrived = []
+
+        class Client(JmHtmlClient):
+            calls = 0
+
+            def fetch_detail_entity(self, jmid, prefix):
+                Client.calls += 1
+                deadline = time.monotonic() + 2
+                while len(arrived) < Test_SingleFlight.THREAD_COUNT and time.monotonic() < deadline:
+                    time.sleep(0.005)
+                # 让其他线程进入等待
+                time.sleep(0.1)
+                return detail(jmid)
+
+        client = Client(JmModuleConfig.new_postman(), ['a.example.com'])
+        client.set_cache_dict({})
+        return client, arrived
+
+    def run_concurrently(self, client, arrived):
+        results = [None] * self.THREAD_COUNT
+
+        def call(i):
+            arrived.append(i)
+            try:
+                results[i] = client.fetch_detail_entity('123', 'album')
+            except Exception as e:
+                results[i] = e
+
+        threads = [Thread(target=call, args=(i,)) for i in range(self.THREAD_COUNT)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_coalesce_concurrent_calls(self):
+        client, arrived = self.new_client(lambda album_id: object())
+        results = self.run_concurrently(client, arrived)
+
+        self.assertEqual(type(client).calls, 1)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual(len(AbstractJmClient.CACHE_INFLIGHT), 0)
+
+        # 之后的调用命中缓存
+        self.assertIs(client.fetch_detail_entity('123', 'album'), results[0])
+        self.assertEqual(type(client).calls, 1)
+
+    def test_exception_propagates_to_all_waiters(self):
+        def fail(album_id):
+            raise MissingAlbumPhotoException(f'本子不存在: {album_id}', {})
+
+        client, arrived = self.new_client(fail)
+        results = self.run_concurrently(client, arrived)
+
+        self.assertEqual(type(client).calls, 1)
+        self.assertTrue(all(isinstance(r, MissingAlbumPhotoException) for r in results))
+        self.assertEqual(len(AbstractJmClient.CACHE_INFLIGHT), 0)
+
+        # 异常不缓存，再次调用会重新请求
+        with self.assertRaises(MissingAlbumPhotoException):
+            client.fetch_detail_entity('123', 'album')
+        self.assertEqual(type(client).calls, 2)
+
+    def test_different_keys_are_not_coalesced(self):
+        calls = []
+
+        def func(album_id):
+            calls.append(album_id)
+            return album_id
+
+        cache = {}
+        self.assertEqual(AbstractJmClient.call_single_flight(cache, '1', func, ('1',), {}), '1')
+        self.assertEqual(AbstractJmClient.call_single_flight(cache, '2', func, ('2',), {}), '2')
+        # 不同的缓存对象，相同的key也是两次调用
+        self.assertEqual(AbstractJmClient.call_single_flight({}, '1', func, ('1',), {}), '1')
+        self.assertEqual(calls, ['1', '2', '1'])
+        self.assertEqual(cache, {'1': '1', '2': '2'})
+
+    def test_cancelled_leader_does_not_cancel_followers(self):
+        from threading import Event
+        cache = {}
+        leader_started, follower_waiting = Event(), Event()
+        calls = []
+
+        class Client(JmHtmlClient):
+
+            def fetch_detail_entity(self, jmid, prefix):
+                calls.append(self.cancel_token)
+                if self.cancel_token is token1:
+                    leader_started.set()
+                    follower_waiting.wait(2)
+                    # 让等待者进入等待
+                    time.sleep(0.1)
+                self.cancel_token.raise_if_cancelled()
+                return f'{prefix}-{jmid}'
+
+        token1, token2 = JmCancelToken(), JmCancelToken()
+        client1 = Client(JmModuleConfig.new_postman(), ['a.example.com'])
+        client2 = Client(JmModuleConfig.new_postman(), ['a.example.com'])
+        for client, token in ((client1, token1), (client2, token2)):
+            client.cancel_token = token
+            client.set_cache_dict(cache)
+
+        results = {}
+
+        def call(name, client):
+            try:
+                results[name] = client.fetch_detail_entity('123', 'album')
+            except Exception as e:
+                results[name] = e
+
+        t1 = Thread(target=call, args=('t1', client1))
+        t1.start()
+        self.assertTrue(leader_started.wait(2))
+        # 只取消t1
+        token1.cancel()
+        t2 = Thread(target=call, args=('t2', client2))
+        t2.start()
+        follower_waiting.set()
+        t1.join()
+        t2.join()
+
+        self.assertIsInstance(results['t1'], DownloadCancelledException)
+        # t2没有被取消，自己重新请求
+        self.assertEqual(results['t2'], 'album-123')
+        self.assertEqual(calls, [token1, token2])
+        self.assertEqual(list(cache.values()), ['album-123'])
+        self.assertEqual(len(AbstractJmClient.CACHE_INFLIGHT), 0)
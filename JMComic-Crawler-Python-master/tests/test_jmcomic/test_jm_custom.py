@@ -108,3 +108,31 @@ class Test_Custom(JmTestConfigurable):
             self.option.new_jm_client(domain_list=[], impl=MyClient.client_key).get_domain_list(),
             msg='继承client，不配置域名',
         )
+
+    def test_decode_image(self):
+        from PIL import Image
+
+        def decode_by_crop_paste(num, img_src):
+            # 逐段计算坐标的原实现
+            w, h = img_src.size
+            img_decode = Image.new("RGB", (w, h))
+            over = h % num
+            for i in range(num):
+                move = h // num
+                y_src = h - (move * (i + 1)) - over
+                y_dst = move * i
+                if i == 0:
+                    move += over
+                else:
+                    y_dst += over
+                img_decode.paste(img_src.crop((0, y_src, w, y_src + move)), (0, y_dst, w, y_dst + move))
+            return img_decode
+
+        for mode in ['RGB', 'RGBA', 'L', 'P']:
+            img = Image.effect_noise((31, 97), 64).convert(mode)
+            for num in [2, 3, 10, 20, 200]:
+                self.assertEqual(
+                    decode_by_crop_paste(num, img).tobytes(),
+                    JmImageTool.decode_image(num, img).tobytes(),
+                    msg=f'mode={mode}, num={num}',
+                )
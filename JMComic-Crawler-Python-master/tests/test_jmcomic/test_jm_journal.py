@@ -0,0 +1,201 @@
+from test_jmcomic import *
+
+
+class Test_Journal(unittest.TestCase):
+    """
+    下载日志，只读写临时目录，不需要网络
+    """
+
+    def setUp(self) -> None:
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.tmp_dir, 'journal.jsonl')
+
+    def tearDown(self) -> None:
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def write_image(self, name, data=b'image-data'):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def read_lines(self):
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_append_and_reload(self):
+        path = self.write_image('00001.jpg')
+        journal = JmDownloadJournal(self.journal_path)
+        journal.start(path, 'url1')
+        journal.done(path, 'url1')
+
+        # 每条记录一行，同一路径以最后一条为准
+        self.assertEqual(len(self.read_lines()), 2)
+        record = JmDownloadJournal(self.journal_path).records[path]
+        self.assertEqual(record['status'], JmDownloadJournal.STATUS_DONE)
+        self.assertEqual(record['size'], len(b'image-data'))
+        self.assertEqual(record['md5'], JmDownloadJournal.checksum(path))
+
+    def test_compact_on_load(self):
+        path1 = self.write_image('00001.jpg')
+        path2 = self.write_image('00002.jpg')
+        journal = JmDownloadJournal(self.journal_path)
+        journal.start(path1, 'url1')
+        journal.done(path1, 'url1')
+        journal.start(path2, 'url2')
+        # 进程崩溃时写了一半的行
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write('{"path": "000')
+
+        journal = JmDownloadJournal(self.journal_path)
+        self.assertEqual(set(journal.records), {path1, path2})
+        self.assertEqual(journal.records[path1]['status'], JmDownloadJournal.STATUS_DONE)
+        self.assertEqual(journal.records[path2]['status'], JmDownloadJournal.STATUS_STARTED)
+
+        # 压缩后每张图片只剩一行，没有残留的 .part 文件
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 2)
+        self.assertFalse(file_exists(self.journal_path + '.part'))
+
+    def test_verify(self):
+        path = self.write_image('00001.jpg')
+        journal = JmDownloadJournal(self.journal_path)
+
+        journal.start(path, 'url1')
+        # 未完成的图片需要重新下载
+        self.assertFalse(journal.verify(path, 'url1'))
+
+        journal.done(path, 'url1')
+        self.assertTrue(journal.verify(path, 'url1'))
+        self.assertTrue(journal.verify(path, 'url1', 'checksum'))
+
+        # 大小不变、内容被修改，只有checksum能发现
+        self.write_image('00001.jpg', b'image-dat!')
+        self.assertTrue(journal.verify(path, 'url1'))
+        self.assertFalse(journal.verify(path, 'url1', 'checksum'))
+
+        # 文件被截断
+        self.write_image('00001.jpg', b'image')
+        self.assertFalse(journal.verify(path, 'url1'))
+
+    def test_verify_missing_file(self):
+        path = self.write_image('00001.jpg')
+        journal = JmDownloadJournal(self.journal_path)
+        journal.done(path, 'url1')
+
+        os.remove(path)
+        self.assertFalse(journal.verify(path, 'url1'))
+        self.assertFalse(journal.verify(os.path.join(self.tmp_dir, 'never.jpg'), 'url2'))
+
+    def test_verify_without_record(self):
+        # 开启日志前下载的图片：能完整解码的补上记录，被截断的重新下载
+        data = self.new_png()
+        complete = self.write_image('00001.png', data)
+        truncated = self.write_image('00002.png', data[:len(data) // 2])
+
+        journal = JmDownloadJournal(self.journal_path)
+        self.assertTrue(journal.verify(complete, 'url1'))
+        self.assertEqual(journal.records[complete]['status'], JmDownloadJournal.STATUS_DONE)
+        self.assertFalse(journal.verify(truncated, 'url2'))
+        self.assertNotIn(truncated, journal.records)
+
+    @staticmethod
+    def new_png() -> bytes:
+        from io import BytesIO
+        from PIL import Image
+        buffer = BytesIO()
+        # 随机像素，压缩后的数据足够长，截断后无法解码
+        Image.frombytes('RGB', (64, 64), os.urandom(64 * 64 * 3)).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+
+class Test_PartFile(unittest.TestCase):
+    """
+    流式下载先写 .part 文件，失败时删除，替换postman，不需要网络
+    """
+
+    def setUp(self) -> None:
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, '00001.webp')
+        self.routing_backup = JmModuleConfig.FLAG_ENABLE_DOMAIN_HEALTH_ROUTING
+        JmModuleConfig.FLAG_ENABLE_DOMAIN_HEALTH_ROUTING = False
+
+    def tearDown(self) -> None:
+        import shutil
+        JmModuleConfig.FLAG_ENABLE_DOMAIN_HEALTH_ROUTING = self.routing_backup
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_writer_commit_and_discard(self):
+        writer = JmPartFileWriter(self.path)
+        writer.open()
+        writer.write(b'data')
+        writer.discard()
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+        writer.open()
+        writer.write(b'data')
+        writer.commit()
+        writer.discard()
+        self.assertEqual(os.listdir(self.tmp_dir), ['00001.webp'])
+
+    def new_client(self, chunks_list):
+        """
+        :param chunks_list: 每次请求返回的数据块，数据块为异常时在读到它时抛出
+        """
+        requests = []
+
+        class Resp:
+            status_code = 200
+            url = 'https://cdn.example.com/00001.webp'
+            headers = {}
+
+            def __init__(self, chunks):
+                self.chunks = chunks
+
+            def iter_content(self, **_kwargs):
+                for chunk in self.chunks:
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    yield chunk
+
+            def close(self):
+                pass
+
+        class Postman(AbstractPostman):
+            def __get__(self):
+                def get(url, **kwargs):
+                    requests.append(url)
+                    return Resp(chunks_list[len(requests) - 1])
+
+                return get
+
+        client = JmHtmlClient(Postman({}), ['a.example.com'], 1, JmRetryPolicy(backoff=0))
+        return client, requests
+
+    def test_stream_failure_leaves_no_file(self):
+        client, requests = self.new_client([
+            [b'half', IOError('connection reset')],
+            [b'half', IOError('connection reset')],
+        ])
+
+        with self.assertRaises(RequestRetryAllFailException):
+            client.get_jm_image_stream('https://cdn.example.com/00001.webp', self.path)
+
+        self.assertEqual(len(requests), 2)
+        # 既没有不完整的目标文件，也没有残留的 .part 文件
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_stream_retry_rewrites_file(self):
+        client, _ = self.new_client([
+            [b'half', IOError('connection reset')],
+            [b'full-', b'image'],
+        ])
+
+        client.get_jm_image_stream('https://cdn.example.com/00001.webp', self.path)
+
+        self.assertEqual(os.listdir(self.tmp_dir), ['00001.webp'])
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'full-image')
@@ -0,0 +1,425 @@
+from test_jmcomic import *
+
+
+class Test_RateLimit(unittest.TestCase):
+    """
+    令牌桶和限速器，不需要网络
+    """
+
+    def test_consume_within_capacity(self):
+        bucket = JmTokenBucket(rate=10, capacity=5)
+        for _ in range(5):
+            self.assertEqual(bucket.consume(1), 0)
+
+        # 桶空了，再取1个需要等1/rate秒
+        self.assertAlmostEqual(bucket.consume(1), 0.1, delta=0.02)
+
+    def test_acquire_waits_for_tokens(self):
+        bucket = JmTokenBucket(rate=20, capacity=1)
+        bucket.acquire()
+
+        begin = time.monotonic()
+        bucket.acquire()
+        bucket.acquire()
+        cost = time.monotonic() - begin
+
+        # 两个令牌，每个1/20秒
+        self.assertGreaterEqual(cost, 0.09)
+        self.assertLess(cost, 0.5)
+
+    def test_debt_after_oversized_charge(self):
+        bucket = JmTokenBucket(rate=1000, capacity=100)
+
+        # 一次取走超过容量的令牌，透支900，需要0.9秒还清
+        wait = bucket.consume(1000)
+        self.assertAlmostEqual(wait, 0.9, delta=0.02)
+        self.assertAlmostEqual(bucket.debt_seconds(), 0.9, delta=0.02)
+
+        time.sleep(0.2)
+        self.assertAlmostEqual(bucket.debt_seconds(), 0.7, delta=0.05)
+
+        # 还清前，下一次请求也要等到还清
+        self.assertAlmostEqual(bucket.consume(0), 0.7, delta=0.05)
+
+    def test_refill_never_exceeds_capacity(self):
+        bucket = JmTokenBucket(rate=1000, capacity=10)
+        time.sleep(0.05)
+        self.assertEqual(bucket.consume(10), 0)
+        self.assertGreater(bucket.consume(1), 0)
+
+    def test_limiter_waits_for_byte_debt(self):
+        limiter = JmRateLimiter(bps=1000)
+        self.assertEqual(limiter.reserve(), 0)
+
+        # 响应大小超过了每秒流量，下一个请求要等透支还清
+        limiter.after_response(3000)
+        self.assertAlmostEqual(limiter.reserve(), 2, delta=0.05)
+
+    def test_limiter_without_rate_never_waits(self):
+        limiter = JmRateLimiter()
+        self.assertIsNone(limiter.request_bucket)
+        self.assertIsNone(limiter.byte_bucket)
+        limiter.after_response(10 ** 9)
+        self.assertEqual(limiter.reserve(), 0)
+
+    def test_decide_limiters_by_category_and_domain(self):
+        registry = JmModuleConfig.REGISTRY_RATE_LIMITER
+        backup = dict(registry)
+        registry.clear()
+        try:
+            image = JmModuleConfig.register_rate_limiter('image', rps=5)
+            domain = JmModuleConfig.register_rate_limiter('cdn.example.com', rps=1)
+            # 重复注册只更新速率，仍是同一个限速器
+            self.assertIs(JmModuleConfig.register_rate_limiter('image', rps=10), image)
+            self.assertEqual(image.request_bucket.rate, 10)
+
+            self.assertEqual(JmRateLimiter.decide_limiters('image', 'https://cdn.example.com/a.webp'), [image, domain])
+            self.assertEqual(JmRateLimiter.decide_limiters('image', 'https://other.com/a.webp'), [image])
+            self.assertEqual(JmRateLimiter.decide_limiters('api', 'https://other.com/album'), [])
+        finally:
+            registry.clear()
+            registry.update(backup)
+
+
+class Test_RetryPolicy(unittest.TestCase):
+    """
+    重试策略，用不发请求的request函数测试 request_with_retry，不需要网络
+    """
+
+    def setUp(self) -> None:
+        self.routing_backup = JmModuleConfig.FLAG_ENABLE_DOMAIN_HEALTH_ROUTING
+        JmModuleConfig.FLAG_ENABLE_DOMAIN_HEALTH_ROUTING = False
+
+    def tearDown(self) -> None:
+        JmModuleConfig.FLAG_ENABLE_DOMAIN_HEALTH_ROUTING = self.routing_backup
+
+    def test_backoff_without_jitter(self):
+        policy = JmRetryPolicy(backoff=0.1, factor=2, max_backoff=0.5, jitter=0)
+        self.assertEqual([policy.decide_backoff(n) for n in range(1, 6)], [0.1, 0.2, 0.4, 0.5, 0.5])
+        self.assertEqual(JmRetryPolicy(backoff=0).decide_backoff(3), 0)
+
+    def test_backoff_jitter_bounds(self):
+        policy = JmRetryPolicy(backoff=1, factor=2, max_backoff=3, jitter=0.5)
+        for retry_count, base in ((1, 1), (2, 2), (5, 3)):
+            delays = [policy.decide_backoff(retry_count) for _ in range(200)]
+            self.assertTrue(all(base * 0.5 <= d <= base * 1.5 for d in delays), (retry_count, min(delays), max(delays)))
+            # 确实加了随机数
+            self.assertGreater(len(set(delays)), 1)
+
+    def test_no_retry_exceptions(self):
+        policy = JmRetryPolicy.from_config({'no_retry': ['MissingAlbumPhotoException', 'KeyError']})
+        self.assertFalse(policy.should_retry(MissingAlbumPhotoException('', {})))
+        self.assertFalse(policy.should_retry(KeyError()))
+        # 取消下载总是不重试
+        self.assertFalse(policy.should_retry(DownloadCancelledException('', {})))
+        self.assertTrue(policy.should_retry(RequestRetryAllFailException('', {})))
+        self.assertTrue(policy.should_retry(IOError()))
+
+        with self.assertRaises(JmcomicException):
+            JmRetryPolicy(no_retry=['NoSuchException'])
+
+    def test_is_out_of_time(self):
+        start = time.monotonic()
+        self.assertFalse(JmRetryPolicy().is_out_of_time(start - 1000, 1000))
+        policy = JmRetryPolicy(max_total_time=1)
+        self.assertFalse(policy.is_out_of_time(start, 0.5))
+        self.assertTrue(policy.is_out_of_time(start, 2))
+
+    def new_client(self, retry_times, policy):
+        # postman只用来提供headers，请求由测试传入的request函数完成
+        return JmHtmlClient(JmModuleConfig.new_postman(), ['a.example.com', 'b.example.com'], retry_times, policy)
+
+    def test_retry_then_switch_domain(self):
+        client = self.new_client(2, JmRetryPolicy(backoff=0))
+        urls = []
+
+        def request(url, **_kwargs):
+            urls.append(url)
+            if 'b.example.com' in url:
+                return 'ok'
+            raise IOError('connection reset')
+
+        self.assertEqual(client.request_with_retry(request, '/album/1'), 'ok')
+        # 每个域名最多请求 retry_times + 1 次
+        self.assertEqual([url.split('/')[2] for url in urls], ['a.example.com'] * 3 + ['b.example.com'])
+
+    def test_all_domains_fail(self):
+        client = self.new_client(1, JmRetryPolicy(backoff=0))
+        count = [0]
+
+        def request(_url, **_kwargs):
+            count[0] += 1
+            raise IOError('connection reset')
+
+        with self.assertRaises(RequestRetryAllFailException):
+            client.request_with_retry(request, '/album/1')
+        self.assertEqual(count[0], 4)
+
+    def test_non_retryable_exception_raised_at_once(self):
+        client = self.new_client(3, JmRetryPolicy(backoff=0))
+        count = [0]
+
+        def request(_url, **_kwargs):
+            count[0] += 1
+            ExceptionTool.raises('本子不存在', etype=MissingAlbumPhotoException)
+
+        with self.assertRaises(MissingAlbumPhotoException):
+            client.request_with_retry(request, '/album/1')
+        self.assertEqual(count[0], 1)
+
+    def test_stop_retry_when_out_of_time(self):
+        client = self.new_client(10, JmRetryPolicy(backoff=0.05, jitter=0, factor=1, max_total_time=0.12))
+        count = [0]
+
+        def request(_url, **_kwargs):
+            count[0] += 1
+            raise IOError('connection reset')
+
+        with self.assertRaises(RequestRetryAllFailException):
+            client.request_with_retry(request, '/album/1')
+        self.assertLessEqual(count[0], 3)
+
+    def test_hedge_not_started_when_primary_is_fast(self):
+        from threading import current_thread
+        client = self.new_client(0, JmRetryPolicy(backoff=0))
+        calls = []
+
+        def request(url, **_kwargs):
+            calls.append((url.split('/')[2], current_thread()))
+            return 'ok'
+
+        self.assertEqual(client.hedged_request_with_retry(request, '/album/1', 0.2, client.domain_list), 'ok')
+        time.sleep(0.3)
+        # 先发请求在当前线程执行，没有发出对冲请求
+        self.assertEqual(calls, [('a.example.com', current_thread())])
+
+    def test_hedge_result_used_when_primary_fails(self):
+        client = self.new_client(1, JmRetryPolicy(backoff=0))
+        domains = []
+
+        def request(url, **_kwargs):
+            domain = url.split('/')[2]
+            domains.append(domain)
+            if domain == 'a.example.com':
+                time.sleep(0.2)
+                raise IOError('timeout')
+            return domain
+
+        self.assertEqual(client.hedged_request_with_retry(request, '/album/1', 0.05, client.domain_list), 'b.example.com')
+        # 对冲请求成功后，先发请求不再换域名重试
+        self.assertEqual(sorted(domains), ['a.example.com', 'b.example.com'])
+
+    def test_primary_error_raised_when_both_fail(self):
+        client = self.new_client(0, JmRetryPolicy(backoff=0))
+
+        def request(url, **_kwargs):
+            domain = url.split('/')[2]
+            time.sleep(0.1 if domain == 'a.example.com' else 0)
+            ExceptionTool.raises(domain, etype=MissingAlbumPhotoException)
+
+        with self.assertRaises(MissingAlbumPhotoException) as ctx:
+            client.hedged_request_with_retry(request, '/album/1', 0.02, client.domain_list)
+        self.assertIn('a.example.com', str(ctx.exception))
+
+    @staticmethod
+    def cancel_later(token, delay):
+        from threading import Timer
+        Timer(delay, token.cancel).start()
+
+    def test_async_sleep_ends_on_cancel(self):
+        import asyncio
+        token = JmCancelToken()
+        self.cancel_later(token, 0.05)
+
+        begin = time.monotonic()
+        with self.assertRaises(DownloadCancelledException):
+            asyncio.run(token.async_sleep(5))
+        self.assertLess(time.monotonic() - begin, 1)
+
+        # 没有取消时睡满
+        begin = time.monotonic()
+        asyncio.run(JmCancelToken().async_sleep(0.05))
+        self.assertGreaterEqual(time.monotonic() - begin, 0.04)
+
+    def test_async_backoff_ends_on_cancel(self):
+        import asyncio
+        class OfflineClient(AsyncJmApiClient):
+            def after_init(self):
+                # JmApiClient在这里请求域名和cookies
+                pass
+
+        client = OfflineClient(JmModuleConfig.new_postman(), ['a.example.com'], 3, JmRetryPolicy(backoff=5, jitter=0))
+        client.cancel_token = JmCancelToken()
+        count = [0]
+
+        async def async_request(*_args, **_kwargs):
+            count[0] += 1
+            raise IOError('connection reset')
+
+        client.async_request = async_request
+        self.cancel_later(client.cancel_token, 0.05)
+
+        begin = time.monotonic()
+        with self.assertRaises(DownloadCancelledException):
+            asyncio.run(client.async_request_with_retry('GET', '/album/1'))
+        self.assertLess(time.monotonic() - begin, 1)
+        self.assertEqual(count[0], 1)
+
+
+class Test_DomainHealth(unittest.TestCase):
+    """
+    域名健康度统计和熔断，不需要网络
+    """
+
+    @staticmethod
+    def wait_state(health, state, timeout=2):
+        deadline = time.monotonic() + timeout
+        while health.state != state and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return health.state
+
+    def test_open_after_consecutive_failures(self):
+        tracker = JmDomainHealthTracker(failure_threshold=3)
+        tracker.record_failure('a')
+        tracker.record_failure('a')
+        self.assertEqual(tracker.get('a').state, JmDomainHealth.STATE_CLOSED)
+
+        # 成功一次后重新计数
+        tracker.record_success('a', 0.1)
+        tracker.record_failure('a')
+        tracker.record_failure('a')
+        self.assertEqual(tracker.get('a').state, JmDomainHealth.STATE_CLOSED)
+
+        tracker.record_failure('a')
+        self.assertEqual(tracker.get('a').state, JmDomainHealth.STATE_OPEN)
+
+    def test_half_open_then_close(self):
+        from threading import Event
+        tracker = JmDomainHealthTracker(failure_threshold=1, probe_interval=0.01)
+        probing, release = Event(), Event()
+
+        def probe():
+            probing.set()
+            release.wait(2)
+
+        tracker.record_failure('a', probe)
+        health = tracker.get('a')
+        self.assertEqual(health.state, JmDomainHealth.STATE_OPEN)
+
+        # 探测进行中
+        self.assertTrue(probing.wait(2))
+        self.assertEqual(health.state, JmDomainHealth.STATE_HALF_OPEN)
+
+        # 探测成功，恢复
+        release.set()
+        self.assertEqual(self.wait_state(health, JmDomainHealth.STATE_CLOSED), JmDomainHealth.STATE_CLOSED)
+        self.assertEqual(health.consecutive_failures, 0)
+
+    def test_failed_probe_reopens(self):
+        tracker = JmDomainHealthTracker(failure_threshold=1, probe_interval=0.01, max_probe_interval=0.02)
+        probe_count = [0]
+
+        def probe():
+            probe_count[0] += 1
+            if probe_count[0] < 3:
+                raise IOError('still down')
+
+        tracker.record_failure('a', probe)
+        health = tracker.get('a')
+        self.assertEqual(self.wait_state(health, JmDomainHealth.STATE_CLOSED), JmDomainHealth.STATE_CLOSED)
+        # 前两次探测失败后回到open，第三次成功
+        self.assertEqual(probe_count[0], 3)
+
+    def test_sort_by_latency_and_error_rate(self):
+        tracker = JmDomainHealthTracker(error_penalty=4)
+        tracker.record_success('slow', 0.5)
+        tracker.record_success('fast', 0.1)
+        tracker.record_success('flaky', 0.1)
+        tracker.record_failure('flaky')
+
+        # flaky: 0.1 * (1 + 4 * 0.3) = 0.22；没有数据的unknown使用已知延迟的平均值
+        self.assertEqual(tracker.sort(['slow', 'unknown', 'flaky', 'fast']), ['fast', 'flaky', 'unknown', 'slow'])
+
+    def test_sort_open_domains_last(self):
+        tracker = JmDomainHealthTracker(failure_threshold=1, probe_interval=60)
+        tracker.record_success('a', 0.01)
+        tracker.record_success('b', 0.5)
+        tracker.record_failure('a')
+        tracker.record_failure('c')
+
+        # 熔断的域名按熔断时间排在最后，没有任何域名被去掉；d的延迟按 (0.01 + 0.5) / 2 计算，排在b前面
+        self.assertEqual(tracker.sort(['a', 'b', 'c', 'd']), ['d', 'b', 'a', 'c'])
+
+    def test_sort_keeps_order_without_data(self):
+        tracker = JmDomainHealthTracker()
+        self.assertEqual(tracker.sort(['c', 'a', 'b']), ['c', 'a', 'b'])
+
+    def test_latency_percentile(self):
+        tracker = JmDomainHealthTracker()
+        for i in range(4):
+            tracker.record_success('a', i)
+        self.assertIsNone(tracker.latency_percentile('a'))
+
+        for i in range(4, 20):
+            tracker.record_success('a', i)
+        self.assertEqual(tracker.latency_percentile('a', 0.5), 10)
+        self.assertEqual(tracker.latency_percentile('a', 0.95), 19)
+
+    def test_shared_tracker_created_once(self):
+        from concurrent.futures import ThreadPoolExecutor
+        backup = JmModuleConfig.DOMAIN_HEALTH_TRACKER
+        JmModuleConfig.DOMAIN_HEALTH_TRACKER = None
+        try:
+            with ThreadPoolExecutor(16) as executor:
+                trackers = list(executor.map(lambda _: JmModuleConfig.domain_health_tracker(), range(64)))
+            self.assertEqual(len({id(t) for t in trackers}), 1)
+        finally:
+            JmModuleConfig.DOMAIN_HEALTH_TRACKER = backup
+
+
+class Test_SessionPool(unittest.TestCase):
+    """
+    共享会话的cookies隔离，替换会话的get方法，不需要网络
+    """
+
+    def setUp(self) -> None:
+        self.share_backup = JmModuleConfig.FLAG_SHARE_POSTMAN_SESSION
+        JmModuleConfig.FLAG_SHARE_POSTMAN_SESSION = True
+        JmSessionPool.clear()
+
+    def tearDown(self) -> None:
+        JmSessionPool.clear()
+        JmModuleConfig.FLAG_SHARE_POSTMAN_SESSION = self.share_backup
+
+    @staticmethod
+    def new_postman(cookies=None):
+        return JmSessionPool.create_postman({'type': 'curl_cffi_session', 'meta_data': {'cookies': cookies}})
+
+    def test_same_config_shares_session(self):
+        a, b = self.new_postman(), self.new_postman()
+        self.assertIsInstance(a, JmPooledPostman)
+        self.assertIs(a.session, b.session)
+        self.assertIsNot(a.meta_data, b.meta_data)
+
+    def test_cookies_are_not_shared(self):
+        a, b = self.new_postman(), self.new_postman({'b': '1'})
+        sent = []
+
+        class Resp:
+            def __init__(self, cookies):
+                self.cookies = cookies
+
+        def get(url, **kwargs):
+            sent.append((url, kwargs.get('cookies', None)))
+            # 只有a登录，服务器给a设置AVS
+            return Resp({'AVS': 'a'} if url == 'login' else {})
+
+        a.session.get = get
+        a.get('login')
+        a.get('album')
+        b.get('album')
+
+        self.assertEqual(a.meta_data['cookies'], {'AVS': 'a'})
+        self.assertEqual(sent, [('login', None), ('album', {'AVS': 'a'}), ('album', {'b': '1'})])
+        # 共享会话本身不保存cookies
+        self.assertEqual(len(a.session.cookies), 0)
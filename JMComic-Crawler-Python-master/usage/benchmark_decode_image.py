@@ -0,0 +1,94 @@
+"""
+图片解密的性能对比
+
+- loop:  原来的实现，逐段 crop + paste 到初始化过的新图片，每一段单独计算坐标
+- tool:  JmImageTool.decode_image，按 decode_segments 逐段 crop + paste 到未初始化的新图片
+- bytes: tobytes 后按行重排字节，再 frombytes 生成图片
+- numpy: 转为数组后按行重排（需要安装numpy，未安装时跳过）
+
+运行: python usage/benchmark_decode_image.py [宽] [高] [重复次数]
+
+num=0 表示不需要解密的图片，只做编码，作为基准。每项耗时都包含JPEG编码
+"""
+import math
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from jmcomic import JmImageTool
+
+
+def decode_by_loop(num, img_src):
+    w, h = img_src.size
+    img_decode = Image.new("RGB", (w, h))
+    over = h % num
+    for i in range(num):
+        move = math.floor(h / num)
+        y_src = h - (move * (i + 1)) - over
+        y_dst = move * i
+
+        if i == 0:
+            move += over
+        else:
+            y_dst += over
+
+        img_decode.paste(img_src.crop((0, y_src, w, y_src + move)), (0, y_dst, w, y_dst + move))
+    return img_decode
+
+
+def decode_by_bytes(num, img_src):
+    w, h = img_src.size
+    stride = w * 3
+    view = memoryview(img_src.convert('RGB').tobytes())
+    data = b''.join(view[y * stride:(y + n) * stride] for y, n in JmImageTool.decode_segments(h, num))
+    return Image.frombytes('RGB', (w, h), data)
+
+
+def decode_by_numpy(num, img_src):
+    import numpy
+    arr = numpy.asarray(img_src.convert('RGB'))
+    return Image.fromarray(numpy.concatenate([arr[y:y + n] for y, n in JmImageTool.decode_segments(arr.shape[0], num)]))
+
+
+def bench(decode, num, img_src, repeat):
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        img = img_src if num == 0 else decode(num, img_src)
+        img.save(BytesIO(), 'JPEG')
+    return (time.perf_counter() - begin) / repeat * 1000
+
+
+def main():
+    w = int(sys.argv[1]) if len(sys.argv) > 1 else 720
+    h = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    impls = {
+        'loop': decode_by_loop,
+        'tool': JmImageTool.decode_image,
+        'bytes': decode_by_bytes,
+    }
+    try:
+        import numpy
+        impls['numpy'] = decode_by_numpy
+    except ImportError:
+        print('未安装numpy，跳过numpy实现')
+
+    img_src = Image.effect_noise((w, h), 64).convert('RGB')
+    print(f'图片: {w}x{h}, 每项重复{repeat}次, 单位: 毫秒/张')
+    print(f'{"num":>4}' + ''.join(f'{name:>10}' for name in impls))
+
+    for num in [0] + list(range(2, 21, 2)):
+        if num != 0:
+            # 所有实现的结果必须与原实现逐像素相同
+            expected = decode_by_loop(num, img_src).tobytes()
+            for name, decode in impls.items():
+                assert decode(num, img_src).tobytes() == expected, (name, num)
+
+        print(f'{num:>4}' + ''.join(f'{bench(decode, num, img_src, repeat):>10.2f}' for decode in impls.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,22 @@
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import json
 import urllib.parse
 import os
+import re
 import sys
 import threading
 from urllib.parse import urlparse
 import mimetypes
+import email.utils
+import shutil
+import zipfile
 import uuid
+import heapq
+import itertools
+import sqlite3
+import time
 from datetime import datetime
+from functools import lru_cache, partial
 
 # 添加项目路径到Python路径
 project_path = os.path.dirname(os.path.abspath(__file__))
@@ -19,10 +28,988 @@ download_dir = os.path.join(project_path, 'downloads')
 if not os.path.exists(download_dir):
     os.makedirs(download_dir)
 
+# 调度配置，可通过环境变量覆盖
+# 同时下载的本子数（工作线程数）
+MAX_DOWNLOAD_WORKERS = int(os.getenv('JM_MAX_DOWNLOAD_WORKERS', '2'))
+# 所有正在下载的本子共享的图片并发上限
+MAX_IMAGE_CONCURRENCY = int(os.getenv('JM_MAX_IMAGE_CONCURRENCY', '30'))
+# 每个本子同时下载的章节数
+PHOTO_CONCURRENCY = int(os.getenv('JM_PHOTO_CONCURRENCY', '2'))
+# 每个章节的图片线程数。下载器为每个章节各建一组图片线程，一个本子共 章节数×图片线程数 个，
+# 超出全局图片并发上限的线程只会阻塞在信号量上，所以按章节数均分上限
+IMAGE_CONCURRENCY_PER_PHOTO = max(MAX_IMAGE_CONCURRENCY // max(PHOTO_CONCURRENCY, 1), 1)
+
+# HTTP服务配置
+# 同时处理的连接数上限
+MAX_CONNECTIONS = int(os.getenv('JM_MAX_CONNECTIONS', '64'))
+# keep-alive连接的空闲超时，单位秒
+KEEP_ALIVE_TIMEOUT = int(os.getenv('JM_KEEP_ALIVE_TIMEOUT', '15'))
+
+# 打包下载时每次读取文件的块大小
+ZIP_STREAM_CHUNK_SIZE = 256 * 1024
+
+# 下载目录索引配置
+# 全量重新扫描下载目录的间隔，单位秒，用于发现下载器之外对目录的改动
+DOWNLOAD_INDEX_RESCAN_INTERVAL = int(os.getenv('JM_DOWNLOAD_INDEX_RESCAN', '600'))
+# 统计图片数时认为是图片的文件后缀
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+# 下载中的图片先写入 图片路径.part，完成后才重命名，目录列表、统计和打包下载都跳过这些文件
+PART_SUFFIX = '.part'
+
+# 进度推送配置
+# SSE连接在进度没有变化时发送心跳的间隔，单位秒
+PROGRESS_HEARTBEAT_SECONDS = 15
+# 长轮询最长等待时间，单位秒
+PROGRESS_LONG_POLL_MAX_SECONDS = 30
+
+# 任务存储配置
+# 任务数据库文件
+TASK_DB_PATH = os.getenv('JM_TASK_DB', os.path.join(project_path, 'tasks.db'))
+# 已结束（完成/失败）的任务保留时长，单位秒，默认7天
+TASK_TTL_SECONDS = int(os.getenv('JM_TASK_TTL', str(7 * 24 * 3600)))
+# 清理过期任务的间隔，单位秒
+TASK_PRUNE_INTERVAL = int(os.getenv('JM_TASK_PRUNE_INTERVAL', '3600'))
+# 下载日志文件夹（见jmcomic的download.journal配置），重启后恢复的任务只下载没完成的图片，
+# 不放在下载目录里，避免出现在下载列表中
+JOURNAL_DIR = os.getenv('JM_JOURNAL_DIR', os.path.join(project_path, 'journal'))
+
+# 未结束的任务状态，进程重启后需要重新排队
+UNFINISHED_STATUS = ('queued', 'downloading', 'paused')
+
+
+class TaskStore:
+    """
+    基于SQLite的下载任务存储，进程重启后任务不丢失
+
+    所有方法都是线程安全的，返回的任务都是dict的副本
+    """
+
+    COLUMNS = ('task_id', 'comic_id', 'album_id', 'status', 'timestamp', 'updated_at', 'message', 'path', 'priority')
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    comic_id TEXT NOT NULL,
+                    album_id TEXT,
+                    status TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    message TEXT,
+                    path TEXT,
+                    priority INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, updated_at)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_timestamp ON tasks (timestamp)')
+
+    def create(self, task):
+        task = dict(task, updated_at=time.time())
+        columns = [c for c in self.COLUMNS if c in task]
+        with self.lock, self.conn:
+            self.conn.execute(
+                f'INSERT INTO tasks ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                [task[c] for c in columns],
+            )
+
+    def update(self, task_id, **fields):
+        fields['updated_at'] = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                f'UPDATE tasks SET {", ".join(f"{k} = ?" for k in fields)} WHERE task_id = ?',
+                [*fields.values(), task_id],
+            )
+
+    def get(self, task_id):
+        with self.lock:
+            row = self.conn.execute('SELECT * FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def query(self, status=None, page=1, page_size=50):
+        """
+        按创建时间倒序分页查询，返回 (总数, 当前页的任务列表)，page_size为None时返回全部
+        """
+        where, params = '', []
+        if status:
+            where, params = 'WHERE status = ?', [status]
+
+        limit, page_params = '', []
+        if page_size is not None:
+            limit, page_params = 'LIMIT ? OFFSET ?', [page_size, (page - 1) * page_size]
+
+        with self.lock:
+            total = self.conn.execute(f'SELECT COUNT(*) FROM tasks {where}', params).fetchone()[0]
+            rows = self.conn.execute(
+                f'SELECT * FROM tasks {where} ORDER BY timestamp DESC {limit}',
+                [*params, *page_params],
+            ).fetchall()
+        return total, [dict(row) for row in rows]
+
+    def unfinished(self):
+        """
+        未结束的任务，按创建时间正序
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                f'SELECT * FROM tasks WHERE status IN ({", ".join("?" * len(UNFINISHED_STATUS))}) '
+                f'ORDER BY timestamp',
+                UNFINISHED_STATUS,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune(self, ttl_seconds):
+        """
+        删除结束时间早于ttl_seconds之前的已结束任务，返回删除的条数
+        """
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                f'DELETE FROM tasks WHERE status NOT IN ({", ".join("?" * len(UNFINISHED_STATUS))}) '
+                f'AND updated_at < ?',
+                [*UNFINISHED_STATUS, time.time() - ttl_seconds],
+            )
+        return cursor.rowcount
+
+
 # 存储下载任务信息
-download_tasks = {}
+task_store = TaskStore(TASK_DB_PATH)
+
+# 正在排队或下载中的本子: album_id -> task_id，用于合并重复提交
+inflight_albums = {}
+inflight_lock = threading.Lock()
+
+
+class DownloadScheduler:
+    """
+    全局下载调度器
+
+    固定数量的工作线程从优先级队列中取任务执行，priority越小越先执行，同优先级先进先出。
+    所有本子的图片下载共享同一个信号量，保证全局图片并发不超过上限。
+    """
+
+    def __init__(self, max_workers, max_image_concurrency, runner=None):
+        self.max_workers = max_workers
+        # 执行任务的函数 runner(comic_id, task_id)，为None时使用start_download
+        self.runner = runner
+        self.image_semaphore = threading.BoundedSemaphore(max_image_concurrency)
+        # 堆元素: (priority, seq, task_id, comic_id)
+        self.pending = []
+        # 排队中的任务的位置: task_id -> 位置（从1开始）
+        self.positions = {}
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.workers = []
+
+    def ensure_started(self):
+        with self.cond:
+            if self.workers:
+                return
+            for i in range(self.max_workers):
+                worker = threading.Thread(target=self.worker_loop, name=f'download-worker-{i}')
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+
+    def submit(self, task_id, comic_id, priority=0):
+        """
+        任务入队，返回排队位置（从1开始）
+        """
+        self.ensure_started()
+        with self.cond:
+            heapq.heappush(self.pending, (priority, next(self.seq), task_id, comic_id))
+            self.update_queue_positions()
+            self.cond.notify()
+            return self.positions[task_id]
+
+    def update_queue_positions(self):
+        """
+        刷新所有排队任务的位置，调用方需持有self.cond
+        """
+        old_positions = self.positions
+        self.positions = {
+            task_id: position
+            for position, (_, _, task_id, _) in enumerate(sorted(self.pending), 1)
+        }
+
+        # 排队位置变化也推送给订阅进度的客户端
+        for task_id in old_positions.keys() | self.positions.keys():
+            if old_positions.get(task_id) != self.positions.get(task_id):
+                notify_progress(task_id)
+
+    def cancel(self, task_id):
+        """
+        把排队中的任务移出队列，任务不在排队中（已开始或已结束）返回False
+        """
+        with self.cond:
+            for i, item in enumerate(self.pending):
+                if item[2] == task_id:
+                    self.pending.pop(i)
+                    heapq.heapify(self.pending)
+                    self.update_queue_positions()
+                    return True
+        return False
+
+    def queue_position(self, task_id):
+        """
+        任务的排队位置，不在排队中返回0
+        """
+        return self.positions.get(task_id, 0)
+
+    def worker_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                _, _, task_id, comic_id = heapq.heappop(self.pending)
+                self.update_queue_positions()
+
+            try:
+                (self.runner or start_download)(comic_id, task_id)
+            except Exception as e:
+                # start_download自己会处理异常，这里只是保证工作线程不退出
+                print(f"工作线程执行任务 {task_id} 时出错: {str(e)}")
+
+
+scheduler = DownloadScheduler(MAX_DOWNLOAD_WORKERS, MAX_IMAGE_CONCURRENCY)
+
+
+class TaskProgress:
+    """
+    单个任务的实时进度，由下载器回调更新，SSE/长轮询连接等待它的变化
+
+    每次变化version加一，等待方记住上次看到的version即可知道是否有新进度
+    """
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.cond = threading.Condition()
+        self.version = 0
+        self.finished = False
+        self.started_at = None
+        self.album_page_count = 0
+        # 已获取详情的章节: photo_id -> 图片数
+        self.photo_image_counts = {}
+        self.images_total = 0
+        self.images_done = 0
+        self.images_failed = 0
+        self.bytes_done = 0
+        self.current_photo = None
+
+    def changed(self):
+        """
+        通知等待方进度有变化，调用方需持有self.cond
+        """
+        self.version += 1
+        self.cond.notify_all()
+
+    def touch(self):
+        with self.cond:
+            self.changed()
+
+    def start_album(self, album):
+        with self.cond:
+            self.started_at = time.time()
+            self.album_page_count = album.page_count or 0
+            self.images_total = self.album_page_count
+            self.changed()
+
+    def start_photo(self, photo):
+        with self.cond:
+            # 本子的总页数可能不准，以已知章节的图片数之和校正
+            self.photo_image_counts[photo.photo_id] = len(photo)
+            self.images_total = max(self.album_page_count, sum(self.photo_image_counts.values()))
+            self.current_photo = {'id': photo.photo_id, 'index': photo.index, 'name': photo.name}
+            self.changed()
+
+    def image_done(self, size=0):
+        with self.cond:
+            self.images_done += 1
+            self.bytes_done += size
+            self.changed()
+
+    def image_failed(self):
+        with self.cond:
+            self.images_failed += 1
+            self.changed()
+
+    def finish(self):
+        with self.cond:
+            self.finished = True
+            self.changed()
+
+    def snapshot(self):
+        with self.cond:
+            elapsed = time.time() - self.started_at if self.started_at else 0
+            remaining = max(self.images_total - self.images_done - self.images_failed, 0)
+            eta = None
+            if self.images_done and elapsed:
+                eta = round(elapsed / self.images_done * remaining, 1)
+
+            return {
+                'version': self.version,
+                'images_total': self.images_total,
+                'images_done': self.images_done,
+                'images_failed': self.images_failed,
+                'bytes_done': self.bytes_done,
+                'current_photo': self.current_photo,
+                'elapsed_seconds': round(elapsed, 1),
+                'bytes_per_second': round(self.bytes_done / elapsed) if elapsed else 0,
+                'images_per_second': round(self.images_done / elapsed, 2) if elapsed else 0,
+                'eta_seconds': eta,
+            }
+
+    def wait(self, version, timeout):
+        """
+        等待version之后的新进度，超时返回False
+        """
+        with self.cond:
+            return self.cond.wait_for(lambda: self.version != version or self.finished, timeout)
+
+
+# 未结束任务的进度: task_id -> TaskProgress，任务结束后移除
+task_progress = {}
+# 下载中任务的取消/暂停令牌: task_id -> JmCancelToken，任务结束后移除
+task_cancel_tokens = {}
+# 服务重启前已暂停的任务，不排队，等到显式恢复时再排队: task_id -> (album_id, priority)
+paused_tasks = {}
+task_progress_lock = threading.Lock()
+
+
+def register_progress(task_id):
+    with task_progress_lock:
+        progress = task_progress[task_id] = TaskProgress(task_id)
+    return progress
+
+
+def notify_progress(task_id):
+    """
+    任务状态或排队位置变化时，唤醒等待该任务进度的连接
+    """
+    progress = task_progress.get(task_id)
+    if progress is not None:
+        progress.touch()
+
+
+class DownloadIndex:
+    """
+    下载目录的内存索引
+
+    - 目录列表按目录的mtime缓存，目录未变化时不重新读取
+    - 顶层条目（本子目录）的大小、图片数、修改时间，由下载器回调增量更新，并定期全量扫描校正
+    """
+
+    SORT_KEYS = ('name', 'mtime', 'size', 'image_count')
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.lock = threading.Lock()
+        # 目录绝对路径 -> (mtime_ns, [(name, is_dir)])
+        self.listing_cache = {}
+        # 顶层条目名 -> 条目信息
+        self.entries = {}
+        self.root_mtime_ns = None
+
+    def list_dir(self, dir_path):
+        """
+        返回目录下的 [(name, is_dir)]，按名称排序
+        """
+        dir_path = os.path.abspath(dir_path)
+        mtime_ns = os.stat(dir_path).st_mtime_ns
+        cached = self.listing_cache.get(dir_path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+
+        with os.scandir(dir_path) as it:
+            items = sorted((entry.name, entry.is_dir()) for entry in it if not entry.name.endswith(PART_SUFFIX))
+        self.listing_cache[dir_path] = (mtime_ns, items)
+        return items
+
+    def scan_entry(self, name):
+        """
+        扫描一个顶层条目，统计大小、图片数和最后修改时间
+        """
+        path = os.path.join(self.root, name)
+        stat = os.stat(path)
+        entry = {'name': name, 'type': 'file', 'path': name,
+                 'size': stat.st_size, 'image_count': 0, 'mtime': stat.st_mtime}
+
+        if not os.path.isdir(path):
+            entry['image_count'] = int(name.lower().endswith(IMAGE_SUFFIXES))
+            return entry
+
+        entry.update(type='folder', size=0)
+        stack = [path]
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for item in it:
+                    if item.is_dir():
+                        stack.append(item.path)
+                        continue
+                    if item.name.endswith(PART_SUFFIX):
+                        continue
+                    item_stat = item.stat()
+                    entry['size'] += item_stat.st_size
+                    entry['mtime'] = max(entry['mtime'], item_stat.st_mtime)
+                    if item.name.lower().endswith(IMAGE_SUFFIXES):
+                        entry['image_count'] += 1
+        return entry
+
+    def refresh(self, force=False):
+        """
+        下载目录本身有变化时（增删了条目），只扫描新增的条目；force为True时全量重新扫描
+        """
+        mtime_ns = os.stat(self.root).st_mtime_ns
+        if not force and mtime_ns == self.root_mtime_ns:
+            return
+
+        if force:
+            self.listing_cache.clear()
+
+        names = [name for name, _ in self.list_dir(self.root)]
+        with self.lock:
+            known = dict(self.entries)
+
+        entries = {}
+        for name in names:
+            if not force and name in known:
+                entries[name] = known[name]
+                continue
+            try:
+                entries[name] = self.scan_entry(name)
+            except FileNotFoundError:
+                # 扫描期间被删除了
+                continue
+
+        with self.lock:
+            self.entries = entries
+            self.root_mtime_ns = mtime_ns
+
+    def relative_name(self, path):
+        """
+        返回path所在的顶层条目名，不在下载目录下时返回None
+        """
+        relpath = os.path.relpath(os.path.abspath(path), self.root)
+        if relpath == '.' or relpath.startswith('..'):
+            return None
+        return relpath.replace('\\', '/').split('/', 1)[0]
+
+    def record_image(self, img_save_path, size, replaced=False):
+        """
+        下载器保存了一张图片，增量更新所在条目
+        """
+        name = self.relative_name(img_save_path)
+        if name is None:
+            return
+
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                entry = self.entries[name] = {'name': name, 'type': 'folder', 'path': name,
+                                              'size': 0, 'image_count': 0, 'mtime': 0}
+            if not replaced:
+                entry['size'] += size
+                entry['image_count'] += 1
+            entry['mtime'] = time.time()
+
+    def record_album(self, album_root):
+        """
+        本子下载完成，重新扫描本子目录，校正增量统计的误差
+        """
+        name = self.relative_name(album_root)
+        if name is None or not os.path.exists(album_root):
+            return
+
+        entry = self.scan_entry(name)
+        with self.lock:
+            self.entries[name] = entry
+
+    def query(self, sort='name', order='asc', page=1, page_size=None):
+        """
+        返回 (total, 条目列表)，page_size为None时返回全部
+        """
+        self.refresh()
+        with self.lock:
+            entries = [dict(entry) for entry in self.entries.values()]
+
+        entries.sort(key=lambda e: (e[sort], e['name']), reverse=(order == 'desc'))
+        if page_size is None:
+            return len(entries), entries
+
+        start = (page - 1) * page_size
+        return len(entries), entries[start:start + page_size]
+
+
+download_index = DownloadIndex(download_dir)
+
+
+@lru_cache(maxsize=None)
+def app_downloader_class():
+    """
+    延迟导入jmcomic，返回受全局图片并发限制的下载器类
+    """
+    from jmcomic import JmDownloader
+
+    class AppDownloader(JmDownloader):
+
+        def __init__(self, option, progress=None, cancel_token=None):
+            super().__init__(option, cancel_token)
+            # 任务进度，不为None时在下载回调中更新
+            self.progress = progress
+
+        def download_by_image_detail(self, image):
+            # 暂停时在获取信号量之前等待，不占用全局图片并发
+            self.wait_if_paused()
+
+            # after_image中记录实际下载的大小
+            image.downloaded_size = 0
+            with scheduler.image_semaphore:
+                try:
+                    super().download_by_image_detail(image)
+                except BaseException:
+                    cancelled = self.cancel_token is not None and self.cancel_token.is_cancelled
+                    if self.progress is not None and not cancelled:
+                        self.progress.image_failed()
+                    raise
+
+            if self.progress is not None:
+                # 跳过的（已存在的）图片也算完成，大小记为0
+                self.progress.image_done(image.downloaded_size)
+
+        def before_album(self, album):
+            super().before_album(album)
+            if self.progress is not None:
+                self.progress.start_album(album)
+
+        def before_photo(self, photo):
+            super().before_photo(photo)
+            if self.progress is not None:
+                self.progress.start_photo(photo)
+
+        def after_image(self, image, img_save_path):
+            super().after_image(image, img_save_path)
+            image.downloaded_size = os.path.getsize(img_save_path)
+            download_index.record_image(img_save_path, image.downloaded_size, replaced=image.exists)
+
+        def after_album(self, album):
+            super().after_album(album)
+            download_index.record_album(self.option.dir_rule.decide_album_root_dir(album))
+
+    return AppDownloader
+
+
+def build_download_option():
+    """
+    创建下载用的JmOption
+    """
+    import jmcomic
+
+    return jmcomic.JmOption.construct({
+        # 每个本子一个目录，章节在本子目录下按序号存放，便于按本子打包下载
+        'dir_rule': {'rule': 'Bd_Aid_Pindex', 'base_dir': download_dir},
+        'download': {
+            'threading': {
+                # 单个本子的图片线程总数（章节数×图片线程数）不超过全局图片并发上限
+                'image': IMAGE_CONCURRENCY_PER_PHOTO,
+                'photo': PHOTO_CONCURRENCY,
+            },
+            # 进程重启后恢复的任务只下载没完成的图片，已下载的图片按大小校验后跳过
+            'journal': {'enable': True, 'dir': JOURNAL_DIR},
+        },
+        'client': {
+            'retry_times': 3,
+            'postman': {'meta_data': {'timeout': 30}},  # 增加超时时间
+        },
+    })
+
+
+def normalize_album_id(comic_id):
+    """
+    把用户输入（JM123、链接等）规范化为本子id，无法解析时抛出ValueError
+
+    没有安装JMComic库（模拟下载模式）时，只取输入中的数字
+    """
+    try:
+        from jmcomic import JmcomicText, JmcomicException
+    except ImportError:
+        match = re.search(r'\d+', str(comic_id))
+        if match is None:
+            raise ValueError(f'无法识别的漫画ID: {comic_id}')
+        return match.group()
+
+    try:
+        return JmcomicText.parse_to_jm_id(comic_id)
+    except JmcomicException:
+        raise ValueError(f'无法识别的漫画ID: {comic_id}')
+
+
+def submit_download(comic_id, priority=0):
+    """
+    提交下载任务，返回 (task_id, created)
+
+    同一个本子同时只会有一个下载任务，重复提交会关联到已有任务，此时created为False
+    """
+    album_id = normalize_album_id(comic_id)
+
+    with inflight_lock:
+        task_id = inflight_albums.get(album_id)
+        if task_id is not None:
+            return task_id, False
+
+        # 创建任务ID
+        task_id = str(uuid.uuid4())
+
+        # 记录任务信息
+        task_store.create({
+            'task_id': task_id,
+            'comic_id': comic_id,
+            'album_id': album_id,
+            'status': 'queued',
+            'timestamp': datetime.now().isoformat(),
+            'message': '排队等待下载...',
+            'priority': priority,
+        })
+        inflight_albums[album_id] = task_id
+        register_progress(task_id)
+
+    # 交给调度器排队执行
+    scheduler.submit(task_id, album_id, priority)
+    return task_id, True
+
+
+def get_task(task_id):
+    """
+    获取任务信息，附带排队位置，任务不存在返回None
+    """
+    task = task_store.get(task_id)
+    if task is not None:
+        task['queue_position'] = scheduler.queue_position(task_id)
+    return task
+
+
+def get_task_with_progress(task_id):
+    """
+    获取任务信息，附带实时进度（任务已结束时progress为None）
+    """
+    progress = task_progress.get(task_id)
+    task = get_task(task_id)
+    if task is not None:
+        task['progress'] = progress.snapshot() if progress is not None else None
+    return task
+
+
+def recover_unfinished_tasks():
+    """
+    进程重启后，把上次未结束（排队中/下载中）的任务重新排队，已暂停的任务保持暂停，恢复后才排队
+
+    下载时会跳过磁盘上已存在的图片（download.cache），相当于从中断处继续下载
+    """
+    for task in task_store.unfinished():
+        task_id, album_id = task['task_id'], task['album_id'] or task['comic_id']
+        with inflight_lock:
+            if album_id in inflight_albums:
+                # 同一个本子有多个未结束任务（不应出现），只保留一个
+                task_store.update(task_id, status='failed', message='重复的任务，已合并')
+                continue
+            inflight_albums[album_id] = task_id
+
+        if task['status'] == 'paused':
+            with task_progress_lock:
+                paused_tasks[task_id] = (album_id, task['priority'])
+            task_store.update(task_id, message='已暂停（服务重启前暂停，恢复后继续下载）')
+            register_progress(task_id)
+            print(f"恢复已暂停的任务: {task_id} (漫画 {album_id})")
+            continue
+
+        task_store.update(task_id, status='queued', message='服务重启，重新排队（已下载的图片会跳过）...')
+        register_progress(task_id)
+        scheduler.submit(task_id, album_id, task['priority'])
+        print(f"恢复未完成的任务: {task_id} (漫画 {album_id})")
+
+
+def prune_tasks_forever():
+    """
+    定期清理过期的已结束任务
+    """
+    while True:
+        try:
+            count = task_store.prune(TASK_TTL_SECONDS)
+            if count:
+                print(f"清理了 {count} 个过期任务")
+        except Exception as e:
+            print(f"清理过期任务时出错: {str(e)}")
+        time.sleep(TASK_PRUNE_INTERVAL)
+
+
+def rescan_downloads_forever():
+    """
+    定期全量扫描下载目录，发现下载器之外的改动（手动删除、复制进来的文件等）
+    """
+    while True:
+        try:
+            download_index.refresh(force=True)
+        except Exception as e:
+            print(f"扫描下载目录时出错: {str(e)}")
+        time.sleep(DOWNLOAD_INDEX_RESCAN_INTERVAL)
+
+
+def start_task_maintenance():
+    """
+    启动时调用：恢复未完成的任务，并启动过期任务清理、下载目录扫描线程
+    """
+    recover_unfinished_tasks()
+    for target, name in [(prune_tasks_forever, 'task-prune'), (rescan_downloads_forever, 'download-rescan')]:
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+
+
+def start_download(comic_id, task_id):
+    """
+    在工作线程中执行下载任务
+    """
+    progress = task_progress.get(task_id)
+    cancel_token = None
+    try:
+        # 更新任务状态
+        task_store.update(task_id, status='downloading', message='正在下载漫画...')
+        notify_progress(task_id)
+
+        # 导入JMComic
+        import jmcomic
+
+        cancel_token = jmcomic.JmCancelToken()
+        with task_progress_lock:
+            task_cancel_tokens[task_id] = cancel_token
+
+        # 执行下载
+        option = build_download_option()
+        downloader = partial(app_downloader_class(), progress=progress, cancel_token=cancel_token)
+        album, _ = jmcomic.download_album(comic_id, option, downloader)
+
+        # 更新任务状态，path为本子目录相对下载目录的路径
+        album_root = option.dir_rule.decide_album_root_dir(album)
+        task_store.update(task_id,
+                          status='completed',
+                          message=f'漫画 {comic_id} 下载完成',
+                          path=os.path.relpath(album_root, download_dir).replace('\\', '/'),
+                          )
+
+        print(f"漫画 {comic_id} 下载完成")
+    except Exception as e:
+        # 更新任务状态
+        if cancel_token is not None and cancel_token.is_cancelled:
+            task_store.update(task_id, status='cancelled', message='任务已取消（已下载的图片会保留）')
+            print(f"漫画 {comic_id} 的下载已取消")
+            return
+        task_store.update(task_id, status='failed', message=f'下载失败: {str(e)}')
+        print(f"下载漫画 {comic_id} 时出错: {str(e)}")
+    finally:
+        finish_task(comic_id, task_id)
+
+
+def finish_task(comic_id, task_id):
+    """
+    任务结束（最终状态已写入task_store）后的清理
+    """
+    # 之后再提交同一个本子会创建新任务
+    with inflight_lock:
+        if inflight_albums.get(comic_id) == task_id:
+            inflight_albums.pop(comic_id)
+
+    # 通知订阅方后移除进度
+    with task_progress_lock:
+        progress = task_progress.pop(task_id, None)
+        task_cancel_tokens.pop(task_id, None)
+    if progress is not None:
+        progress.finish()
+
+
+def cancel_task(task_id):
+    """
+    取消任务，返回是否取消成功（已结束的任务无法取消）
+
+    排队中的任务直接移出队列；下载中的任务通过令牌通知下载器，
+    正在下载的图片完成后停止，由start_download把状态改为cancelled
+    """
+    with task_progress_lock:
+        paused = paused_tasks.pop(task_id, None)
+    if paused is not None:
+        task_store.update(task_id, status='cancelled', message='任务已取消')
+        finish_task(paused[0], task_id)
+        return True
+
+    if scheduler.cancel(task_id):
+        task = task_store.get(task_id)
+        task_store.update(task_id, status='cancelled', message='任务已取消')
+        finish_task(task['album_id'] or task['comic_id'], task_id)
+        return True
+
+    cancel_token = task_cancel_tokens.get(task_id)
+    if cancel_token is None:
+        return False
+
+    cancel_token.cancel()
+    task_store.update(task_id, message='正在取消...')
+    notify_progress(task_id)
+    return True
+
+
+def pause_task(task_id):
+    """
+    暂停下载中的任务，返回是否暂停成功
+
+    正在下载的图片会下载完，之后的章节和图片等待恢复，暂停期间不占用全局图片并发，但仍占用一个工作线程
+    """
+    cancel_token = task_cancel_tokens.get(task_id)
+    if cancel_token is None or cancel_token.is_cancelled or cancel_token.is_paused:
+        return False
+
+    cancel_token.pause()
+    task_store.update(task_id, status='paused', message='已暂停')
+    notify_progress(task_id)
+    return True
+
+
+def resume_task(task_id):
+    """
+    恢复暂停的任务，返回是否恢复成功
+    """
+    with task_progress_lock:
+        paused = paused_tasks.pop(task_id, None)
+    if paused is not None:
+        # 服务重启前暂停的任务，重新排队
+        album_id, priority = paused
+        task_store.update(task_id, status='queued', message='排队等待下载（已下载的图片会跳过）...')
+        scheduler.submit(task_id, album_id, priority)
+        notify_progress(task_id)
+        return True
+
+    cancel_token = task_cancel_tokens.get(task_id)
+    if cancel_token is None or not cancel_token.is_paused:
+        return False
+
+    task_store.update(task_id, status='downloading', message='正在下载漫画...')
+    cancel_token.resume()
+    notify_progress(task_id)
+    return True
+
+
+def parse_byte_range(range_header, file_size):
+    """
+    解析单段的Range请求头，返回 (start, end)，end包含在内
+
+    格式无法识别或是多段Range时返回None，按完整文件响应；
+    范围无法满足时抛出ValueError，应响应416
+    """
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+
+    first, sep, last = spec.strip().partition('-')
+    first, last = first.strip(), last.strip()
+    if not sep or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+
+    if not first:
+        # bytes=-n，表示最后n个字节
+        suffix_length = int(last)
+        if suffix_length == 0 or file_size == 0:
+            raise ValueError(range_header)
+        return max(file_size - suffix_length, 0), file_size - 1
+
+    start = int(first)
+    end = int(last) if last else file_size - 1
+    if last and end < start:
+        return None
+    if start >= file_size:
+        raise ValueError(range_header)
+    return start, min(end, file_size - 1)
+
+
+def content_disposition(filename):
+    """
+    生成附件下载的Content-Disposition，非ASCII文件名使用RFC 5987编码
+    """
+    fallback = filename.encode('ascii', 'replace').decode('ascii').replace('"', '_')
+    return f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{urllib.parse.quote(filename)}'
+
+
+class HttpStreamWriter:
+    """
+    给zipfile使用的只写流，直接把数据写入HTTP响应
+    """
+
+    def __init__(self, wfile, chunked):
+        self.wfile = wfile
+        self.chunked = chunked
+
+    def write(self, data):
+        if not data:
+            return 0
+
+        if self.chunked:
+            self.wfile.write(b'%X\r\n' % len(data))
+            self.wfile.write(data)
+            self.wfile.write(b'\r\n')
+        else:
+            self.wfile.write(data)
+        return len(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def close(self):
+        if self.chunked:
+            # 结束chunked编码
+            self.wfile.write(b'0\r\n\r\n')
+            self.chunked = False
+
+
+class JMComicHTTPServer(ThreadingHTTPServer):
+    """
+    每个连接一个线程的HTTP服务器，同时处理的连接数超过上限时直接返回503
+    """
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class, max_connections=MAX_CONNECTIONS):
+        super().__init__(server_address, handler_class)
+        self.connection_slots = threading.BoundedSemaphore(max_connections)
+
+    def process_request(self, request, client_address):
+        if not self.connection_slots.acquire(blocking=False):
+            try:
+                request.sendall(b'HTTP/1.1 503 Service Unavailable\r\n'
+                                b'Content-Length: 0\r\n'
+                                b'Retry-After: 1\r\n'
+                                b'Connection: close\r\n\r\n')
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            self.connection_slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.connection_slots.release()
+
 
 class JMComicHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 默认keep-alive，要求每个响应都带上Content-Length
+    protocol_version = 'HTTP/1.1'
+    # keep-alive连接的空闲超时，也是慢客户端单次读写的超时
+    timeout = KEEP_ALIVE_TIMEOUT
+
     def do_GET(self):
         # 解析请求路径
         parsed_path = urlparse(self.path)
@@ -42,10 +1029,22 @@ class JMComicHandler(BaseHTTPRequestHandler):
             self.show_downloads()
         elif path.startswith('/download/'):
             # 提供下载文件服务
-            self.serve_download_file(path[len('/download/'):])
+            self.serve_download_file(urllib.parse.unquote(path[len('/download/'):]))
         elif path == '/tasks':
             # 显示下载任务
             self.show_tasks()
+        elif path == '/api/downloads':
+            # 获取下载列表
+            self.get_downloads_list(parsed_path.query)
+        elif path == '/api/tasks':
+            # 获取任务列表
+            self.get_tasks_list(parsed_path.query)
+        elif path.startswith('/api/tasks/') and path.endswith('/events'):
+            # 任务进度推送（SSE）
+            self.stream_task_events(path[len('/api/tasks/'):-len('/events')])
+        elif path.startswith('/api/tasks/'):
+            # 单个任务的信息和进度，支持长轮询
+            self.get_task_detail(path[len('/api/tasks/'):], parsed_path.query)
         elif path == '/USER_GUIDE.md':
             # 提供用户指南
             self.serve_file('USER_GUIDE.md', 'text/markdown')
@@ -55,8 +1054,15 @@ class JMComicHandler(BaseHTTPRequestHandler):
         else:
             self.send_error(404)
 
+    def do_HEAD(self):
+        # 与GET相同的处理，send_body/send_download_file不会发送响应体
+        self.do_GET()
+
     def do_POST(self):
-        if self.path == '/api/download':
+        parsed_path = urlparse(self.path)
+        path = parsed_path.path
+
+        if path == '/api/download':
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
             data = urllib.parse.parse_qs(post_data.decode('utf-8'))
@@ -67,40 +1073,47 @@ class JMComicHandler(BaseHTTPRequestHandler):
                 self.send_error(400, 'Missing comic_id')
                 return
             
-            # 创建任务ID
-            task_id = str(uuid.uuid4())
-            
-            # 记录任务信息
-            download_tasks[task_id] = {
-                'comic_id': comic_id,
-                'status': 'started',
-                'timestamp': datetime.now().isoformat(),
-                'message': '开始下载...'
-            }
+            try:
+                priority = int(data.get('priority', ['0'])[0])
+            except ValueError:
+                self.send_error(400, 'Invalid priority')
+                return
+
+            try:
+                task_id, created = submit_download(comic_id, priority)
+            except ValueError as e:
+                self.send_error(400, 'Invalid comic_id', str(e))
+                return
             
-            # 异步执行下载任务
-            thread = threading.Thread(target=self.start_download, args=(comic_id, task_id))
-            thread.daemon = True
-            thread.start()
+            task = get_task(task_id)
+            queue_position = task['queue_position']
+            if created and queue_position:
+                message = f"漫画 {comic_id} 已加入下载队列（第{queue_position}位），请稍后查看下载目录"
+            elif created:
+                message = f"开始下载漫画 {comic_id}，请稍后查看下载目录"
+            else:
+                message = f"漫画 {task['album_id']} 已在下载中，已关联到现有任务"
             
             # 立即返回响应
-            self.send_response(202)  # Accepted
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
             response = {
                 "status": "accepted",
                 "task_id": task_id,
-                "message": f"开始下载漫画 {comic_id}，请稍后查看下载目录"
+                "deduplicated": not created,
+                "task_status": task['status'],
+                "queue_position": queue_position,
+                "message": message
             }
-            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        elif self.path == '/api/downloads':
+            self.send_json(response, 202)  # Accepted
+        elif path == '/api/downloads':
             # 获取下载列表
-            self.get_downloads_list()
-        elif self.path == '/api/tasks':
+            self.get_downloads_list(parsed_path.query)
+        elif path == '/api/tasks':
             # 获取任务列表
-            self.get_tasks_list()
+            self.get_tasks_list(parsed_path.query)
+        elif path.startswith('/api/tasks/') and path.count('/') == 4:
+            # 取消/暂停/恢复任务: /api/tasks/<task_id>/<action>
+            task_id, action = path[len('/api/tasks/'):].split('/')
+            self.control_task(task_id, action)
         else:
             self.send_error(404)
 
@@ -110,53 +1123,53 @@ class JMComicHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
-    def start_download(self, comic_id, task_id):
+    def send_body(self, body, content_type, status=200, cors=False, headers=None):
         """
-        在后台执行下载任务
+        发送完整的响应，带上Content-Length，使连接可以keep-alive复用
         """
-        try:
-            # 更新任务状态
-            download_tasks[task_id]['status'] = 'downloading'
-            download_tasks[task_id]['message'] = '正在下载漫画...'
-            
-            # 导入JMComic
-            import jmcomic
-            
-            # 创建配置
-            option = jmcomic.JmOption.default()
-            option.download_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'downloads')
-            
-            # 设置客户端配置
-            option.retry_times = 3
-            option.timeout = 30  # 增加超时时间
-            
-            # 执行下载
-            jmcomic.download_album(comic_id, option)
-            
-            # 更新任务状态
-            download_tasks[task_id]['status'] = 'completed'
-            download_tasks[task_id]['message'] = f'漫画 {comic_id} 下载完成'
-            download_tasks[task_id]['path'] = os.path.join('downloads', comic_id)
-            
-            print(f"漫画 {comic_id} 下载完成")
-        except Exception as e:
-            # 更新任务状态
-            download_tasks[task_id]['status'] = 'failed'
-            download_tasks[task_id]['message'] = f'下载失败: {str(e)}'
-            print(f"下载漫画 {comic_id} 时出错: {str(e)}")
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if cors:
+            self.send_header('Access-Control-Allow-Origin', '*')
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_json(self, data, status=200):
+        self.send_body(json.dumps(data, ensure_ascii=False).encode('utf-8'), 'application/json', status, cors=True)
+
+    def send_error(self, code, message=None, explain=None):
+        # 状态行只能是latin-1编码，中文的错误信息放到响应体中
+        if message is not None and not message.isascii():
+            message, explain = None, message if explain is None else f'{message}: {explain}'
+        super().send_error(code, message, explain)
+
+    def handle_one_request(self):
+        self.request_start = time.perf_counter()
+        self.response_code = None
+        super().handle_one_request()
+
+        # 请求处理完后记录耗时
+        if self.response_code is not None:
+            elapsed = (time.perf_counter() - self.request_start) * 1000
+            self.log_message('"%s" %s %.1fms', self.requestline, self.response_code, elapsed)
+
+    def log_request(self, code='-', size='-'):
+        # 此时响应体还没发送，只记录状态码，由handle_one_request统一打印
+        self.response_code = getattr(code, 'value', code)
 
     def serve_file(self, filename, content_type):
         try:
             with open(filename, 'r', encoding='utf-8') as file:
                 content = file.read()
             
-            self.send_response(200)
-            self.send_header('Content-type', content_type)
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(content.encode('utf-8'))
+            self.send_body(content.encode('utf-8'), content_type, cors=True)
         except FileNotFoundError:
             self.send_error(404)
 
@@ -166,8 +1179,7 @@ class JMComicHandler(BaseHTTPRequestHandler):
         """
         try:
             # 获取下载目录中的文件和文件夹
-            items = os.listdir(download_dir)
-            items.sort()
+            _, items = download_index.query()
             
             # 生成HTML页面
             html = '''
@@ -197,12 +1209,15 @@ class JMComicHandler(BaseHTTPRequestHandler):
                 html += '<p>暂无下载内容</p>'
             else:
                 html += '<ul>'
-                for item in items:
-                    item_path = os.path.join(download_dir, item)
-                    if os.path.isdir(item_path):
-                        html += f'<li class="folder">📁 <a href="/download/{item}/">{item}/</a></li>'
+                for entry in items:
+                    item = entry['name']
+                    size_mb = entry['size'] / 1024 / 1024
+                    if entry['type'] == 'folder':
+                        html += (f'<li class="folder">📁 <a href="/download/{item}/">{item}/</a>'
+                                 f' ({entry["image_count"]}张图片, {size_mb:.1f} MB,'
+                                 f' <a href="/download/{item}.zip">打包下载</a>)</li>')
                     else:
-                        html += f'<li class="file">📄 <a href="/download/{item}">{item}</a></li>'
+                        html += f'<li class="file">📄 <a href="/download/{item}">{item}</a> ({size_mb:.1f} MB)</li>'
                 html += '</ul>'
             
             html += '''
@@ -210,10 +1225,7 @@ class JMComicHandler(BaseHTTPRequestHandler):
 </html>
 '''
             
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(html.encode('utf-8'))
+            self.send_body(html.encode('utf-8'), 'text/html')
         except Exception as e:
             self.send_error(500, f"无法列出下载目录: {str(e)}")
 
@@ -235,10 +1247,13 @@ class JMComicHandler(BaseHTTPRequestHandler):
         table { width: 100%; border-collapse: collapse; margin-top: 20px; }
         th, td { padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }
         th { background-color: #f2f2f2; }
+        .status-queued { color: #6c757d; }
         .status-started { color: #007bff; }
         .status-downloading { color: #ffc107; }
         .status-completed { color: #28a745; }
         .status-failed { color: #dc3545; }
+        .status-paused { color: #17a2b8; }
+        .status-cancelled { color: #6c757d; text-decoration: line-through; }
         .back-link { margin-bottom: 20px; display: inline-block; }
     </style>
 </head>
@@ -247,7 +1262,10 @@ class JMComicHandler(BaseHTTPRequestHandler):
     <a href="/" class="back-link">← 返回下载器</a>
 '''
             
-            if not download_tasks:
+            # 按时间倒序排列任务，只显示最近的任务
+            total, tasks = task_store.query(page_size=200)
+
+            if not tasks:
                 html += '<p>暂无下载任务</p>'
             else:
                 html += '''
@@ -256,33 +1274,32 @@ class JMComicHandler(BaseHTTPRequestHandler):
         <th>漫画ID</th>
         <th>状态</th>
         <th>时间</th>
+        <th>排队位置</th>
         <th>消息</th>
     </tr>
 '''
-                # 按时间倒序排列任务
-                sorted_tasks = sorted(download_tasks.items(), key=lambda x: x[1]['timestamp'], reverse=True)
-                
-                for task_id, task_info in sorted_tasks:
+                for task_info in tasks:
+                    task_info['queue_position'] = scheduler.queue_position(task_info['task_id'])
                     status_class = f"status-{task_info['status']}"
                     html += f'''
     <tr>
         <td>{task_info['comic_id']}</td>
         <td class="{status_class}">{task_info['status']}</td>
         <td>{task_info['timestamp'][:19].replace('T', ' ')}</td>
+        <td>{task_info.get('queue_position') or '-'}</td>
         <td>{task_info['message']}</td>
     </tr>
 '''
                 html += '</table>'
+                if total > len(tasks):
+                    html += f'<p>共 {total} 个任务，仅显示最近的 {len(tasks)} 个</p>'
             
             html += '''
 </body>
 </html>
 '''
             
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(html.encode('utf-8'))
+            self.send_body(html.encode('utf-8'), 'text/html')
         except Exception as e:
             self.send_error(500, f"无法显示任务列表: {str(e)}")
 
@@ -301,14 +1318,17 @@ class JMComicHandler(BaseHTTPRequestHandler):
             
             # 检查文件是否存在
             if not os.path.exists(full_path):
-                self.send_error(404, "文件不存在")
+                # <目录>.zip 表示把该目录打包下载
+                if full_path.endswith('.zip') and os.path.isdir(full_path[:-len('.zip')]):
+                    self.send_zip_stream(full_path[:-len('.zip')])
+                else:
+                    self.send_error(404, "文件不存在")
                 return
             
             # 如果是目录，显示目录内容
             if os.path.isdir(full_path):
                 # 获取目录中的文件和文件夹
-                items = os.listdir(full_path)
-                items.sort()
+                items = download_index.list_dir(full_path)
                 
                 # 生成HTML页面
                 html = f'''
@@ -342,10 +1362,9 @@ class JMComicHandler(BaseHTTPRequestHandler):
                     if file_path != "":
                         html += '<li class="folder">📁 <a href="../">../</a></li>'
                     
-                    for item in items:
-                        item_full_path = os.path.join(full_path, item)
+                    for item, is_dir in items:
                         relative_path = os.path.join(file_path, item).replace('\\', '/')
-                        if os.path.isdir(item_full_path):
+                        if is_dir:
                             html += f'<li class="folder">📁 <a href="/download/{relative_path}/">{item}/</a></li>'
                         else:
                             html += f'<li class="file">📄 <a href="/download/{relative_path}">{item}</a></li>'
@@ -356,78 +1375,337 @@ class JMComicHandler(BaseHTTPRequestHandler):
 </html>
 '''
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html')
-                self.end_headers()
-                self.wfile.write(html.encode('utf-8'))
+                self.send_body(html.encode('utf-8'), 'text/html')
             else:
                 # 提供文件下载
-                # 确定文件的MIME类型
-                mime_type, _ = mimetypes.guess_type(full_path)
-                if mime_type is None:
-                    mime_type = 'application/octet-stream'
-                
-                # 读取并发送文件
-                with open(full_path, 'rb') as file:
-                    content = file.read()
-                
-                self.send_response(200)
-                self.send_header('Content-type', mime_type)
-                self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(full_path)}"')
-                self.end_headers()
-                self.wfile.write(content)
+                self.send_download_file(full_path)
                 
         except Exception as e:
             self.send_error(500, f"无法提供文件: {str(e)}")
 
-    def get_downloads_list(self):
+    def send_download_file(self, full_path):
+        """
+        流式发送文件，支持Range断点续传，以及ETag/Last-Modified缓存校验
+        """
+        # 确定文件的MIME类型
+        mime_type, _ = mimetypes.guess_type(full_path)
+        if mime_type is None:
+            mime_type = 'application/octet-stream'
+
+        with open(full_path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+            validators = {
+                'ETag': etag,
+                'Last-Modified': email.utils.formatdate(stat.st_mtime, usegmt=True),
+            }
+
+            if self.is_not_modified(etag, stat.st_mtime):
+                self.send_response(304)
+                for key, value in validators.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                return
+
+            status, start, length = 200, 0, stat.st_size
+            range_header = self.headers.get('Range')
+            if range_header and self.is_if_range_matched(validators):
+                try:
+                    byte_range = parse_byte_range(range_header, stat.st_size)
+                except ValueError:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{stat.st_size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                if byte_range is not None:
+                    start, end = byte_range
+                    status, length = 206, end - start + 1
+
+            self.send_response(status)
+            self.send_header('Content-type', mime_type)
+            self.send_header('Content-Length', str(length))
+            self.send_header('Content-Disposition', content_disposition(os.path.basename(full_path)))
+            self.send_header('Accept-Ranges', 'bytes')
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{start + length - 1}/{stat.st_size}')
+            for key, value in validators.items():
+                self.send_header(key, value)
+            self.end_headers()
+
+            if self.command != 'HEAD' and length > 0:
+                # 由内核直接把文件内容写入socket，不经过用户态内存
+                self.connection.sendfile(file, start, length)
+
+    def send_zip_stream(self, dir_path):
+        """
+        把目录边打包边发送，使用不压缩的zip格式，不生成临时文件，内存占用固定
+        """
+        dir_path = os.path.normpath(dir_path)
+        dir_name = os.path.basename(dir_path)
+
+        # 打包开始前先确定文件列表
+        files = []
+        for root, dirs, filenames in os.walk(dir_path):
+            dirs.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(PART_SUFFIX):
+                    # 下载中的图片
+                    continue
+                filepath = os.path.join(root, filename)
+                arcname = os.path.join(dir_name, os.path.relpath(filepath, dir_path)).replace('\\', '/')
+                files.append((filepath, arcname))
+
+        # 打包后的总大小无法预知，HTTP/1.1使用chunked编码，HTTP/1.0在发送完后关闭连接
+        chunked = self.request_version != 'HTTP/1.0'
+        self.send_response(200)
+        self.send_header('Content-type', 'application/zip')
+        self.send_header('Content-Disposition', content_disposition(f'{dir_name}.zip'))
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+
+        if self.command == 'HEAD':
+            return
+
+        writer = HttpStreamWriter(self.wfile, chunked)
+        try:
+            # writer不支持seek，zipfile会在每个文件数据之后写入数据描述符
+            with zipfile.ZipFile(writer, 'w', zipfile.ZIP_STORED) as zf:
+                for filepath, arcname in files:
+                    try:
+                        zinfo = zipfile.ZipInfo.from_file(filepath, arcname)
+                        src = open(filepath, 'rb')
+                    except FileNotFoundError:
+                        # 列出文件后被删除了，跳过
+                        continue
+
+                    with src, zf.open(zinfo, 'w') as dest:
+                        shutil.copyfileobj(src, dest, ZIP_STREAM_CHUNK_SIZE)
+            writer.close()
+        except Exception as e:
+            # 响应头已经发出，无法再返回错误页面，只能断开连接让客户端感知到下载不完整
+            self.close_connection = True
+            self.log_error('打包下载 %s 中断: %s', dir_path, e)
+
+    def is_not_modified(self, etag, mtime):
+        """
+        根据If-None-Match/If-Modified-Since判断客户端缓存是否仍然有效
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # If-None-Match存在时忽略If-Modified-Since
+            candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return '*' in candidates or etag in candidates
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is None:
+            return False
+
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+
+        return since.tzinfo is not None and int(mtime) <= since.timestamp()
+
+    def is_if_range_matched(self, validators):
+        """
+        If-Range与当前文件不一致时，说明文件已变化，应返回完整文件
+        """
+        if_range = self.headers.get('If-Range')
+        if if_range is None:
+            return True
+
+        if_range = if_range.strip()
+        if if_range.startswith('"'):
+            return if_range == validators['ETag']
+        return if_range == validators['Last-Modified']
+
+    def get_downloads_list(self, query=''):
         """
         获取下载列表（API接口）
+
+        查询参数: sort（name/mtime/size/image_count）、order（asc/desc）、page（从1开始）、page_size（最大200）
+        传入page或page_size时返回分页结果 {total, page, page_size, downloads}，
+        都不传时与旧版本相同，返回全部条目的列表
         """
+        params = urllib.parse.parse_qs(query)
+        sort = params.get('sort', ['name'])[0]
+        order = params.get('order', ['asc'])[0]
+        if sort not in DownloadIndex.SORT_KEYS or order not in ('asc', 'desc'):
+            self.send_error(400, 'Invalid sort or order')
+            return
         try:
-            items = os.listdir(download_dir)
-            items.sort()
-            
-            downloads = []
-            for item in items:
-                item_path = os.path.join(download_dir, item)
-                if os.path.isdir(item_path):
-                    downloads.append({
-                        'name': item,
-                        'type': 'folder',
-                        'path': item
-                    })
-                else:
-                    downloads.append({
-                        'name': item,
-                        'type': 'file',
-                        'path': item
-                    })
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(downloads, ensure_ascii=False).encode('utf-8'))
+            page = max(1, int(params.get('page', ['1'])[0]))
+            page_size = min(200, max(1, int(params.get('page_size', ['50'])[0])))
+        except ValueError:
+            self.send_error(400, 'Invalid page or page_size')
+            return
+
+        try:
+            if 'page' not in params and 'page_size' not in params:
+                _, downloads = download_index.query(sort, order)
+                self.send_json(downloads)
+                return
+
+            total, downloads = download_index.query(sort, order, page, page_size)
+            self.send_json({
+                'total': total,
+                'page': page,
+                'page_size': page_size,
+                'downloads': downloads,
+            })
         except Exception as e:
             self.send_error(500, f"无法获取下载列表: {str(e)}")
 
-    def get_tasks_list(self):
+    def control_task(self, task_id, action):
+        """
+        取消/暂停/恢复任务（API接口），任务当前状态不支持该操作时返回409
+        """
+        actions = {'cancel': cancel_task, 'pause': pause_task, 'resume': resume_task}
+        if action not in actions:
+            self.send_error(404)
+            return
+
+        if task_store.get(task_id) is None:
+            self.send_error(404, 'Task not found')
+            return
+
+        success = actions[action](task_id)
+        task = get_task(task_id)
+        self.send_json({'success': success, 'task': task}, 200 if success else 409)
+
+    def get_task_detail(self, task_id, query=''):
+        """
+        获取单个任务的信息和进度（API接口）
+
+        查询参数: since（上次拿到的progress.version，传入时进行长轮询，等到进度变化再返回）、timeout（最长等待秒数）
+        """
+        params = urllib.parse.parse_qs(query)
+        try:
+            since = params.get('since', [None])[0]
+            since = int(since) if since is not None else None
+            timeout = min(PROGRESS_LONG_POLL_MAX_SECONDS, max(0.0, float(params.get('timeout', ['25'])[0])))
+        except ValueError:
+            self.send_error(400, 'Invalid since or timeout')
+            return
+
+        progress = task_progress.get(task_id)
+        # HEAD请求只需要响应头，不等待
+        if since is not None and progress is not None and self.command != 'HEAD':
+            progress.wait(since, timeout)
+
+        task = get_task_with_progress(task_id)
+        if task is None:
+            self.send_error(404, 'Task not found')
+            return
+        self.send_json(task)
+
+    def stream_task_events(self, task_id):
+        """
+        通过Server-Sent Events推送任务进度，任务结束时发送done事件并关闭连接
+        """
+        if get_task(task_id) is None:
+            self.send_error(404, 'Task not found')
+            return
+
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        # 事件流没有长度，发送完毕后关闭连接
+        self.send_header('Connection', 'close')
+        self.close_connection = True
+        self.end_headers()
+
+        if self.command == 'HEAD':
+            # 只发送响应头，不推送事件
+            return
+
+        last_version = None
+        try:
+            while True:
+                progress = task_progress.get(task_id)
+                if progress is not None and last_version is not None:
+                    progress.wait(last_version, PROGRESS_HEARTBEAT_SECONDS)
+
+                task = get_task_with_progress(task_id)
+                if task is None:
+                    # 任务已被清理
+                    return
+
+                finished = task['status'] not in UNFINISHED_STATUS
+                version = task['progress']['version'] if task['progress'] is not None else None
+                if finished:
+                    self.write_event('done', task)
+                    return
+
+                if version is None:
+                    # 不应出现：未结束的任务没有进度对象，退化为定时推送
+                    time.sleep(PROGRESS_HEARTBEAT_SECONDS)
+                    self.write_event('progress', task)
+                elif version != last_version:
+                    self.write_event('progress', task)
+                else:
+                    # 心跳，防止中间代理断开空闲连接
+                    self.wfile.write(b': heartbeat\n\n')
+                last_version = version
+        except OSError:
+            # 客户端断开
+            return
+
+    def write_event(self, event, data):
+        payload = json.dumps(data, ensure_ascii=False)
+        self.wfile.write(f'event: {event}\ndata: {payload}\n\n'.encode('utf-8'))
+
+    def get_tasks_list(self, query=''):
         """
         获取任务列表（API接口）
+
+        查询参数: status（按状态过滤）、page（从1开始）、page_size（最大200）
+        传入page或page_size时返回分页结果 {total, page, page_size, tasks}，
+        都不传时与旧版本相同，返回全部任务 {task_id: 任务}
         """
+        params = urllib.parse.parse_qs(query)
+        status = params.get('status', [None])[0]
+        paged = 'page' in params or 'page_size' in params
         try:
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(download_tasks, ensure_ascii=False).encode('utf-8'))
+            page = max(1, int(params.get('page', ['1'])[0]))
+            page_size = min(200, max(1, int(params.get('page_size', ['50'])[0])))
+        except ValueError:
+            self.send_error(400, 'Invalid page or page_size')
+            return
+
+        try:
+            total, tasks = task_store.query(status, page, page_size if paged else None)
+            for task in tasks:
+                task['queue_position'] = scheduler.queue_position(task['task_id'])
+
+            if not paged:
+                # 旧版本的格式，按创建顺序
+                self.send_json({task['task_id']: task for task in reversed(tasks)})
+                return
+
+            response = {
+                'total': total,
+                'page': page,
+                'page_size': page_size,
+                'tasks': tasks,
+            }
+
+            self.send_json(response)
         except Exception as e:
             self.send_error(500, f"无法获取任务列表: {str(e)}")
 
 def run_server(host='0.0.0.0', port=8000):
     server_address = (host, port)
-    httpd = HTTPServer(server_address, JMComicHandler)
+    httpd = JMComicHTTPServer(server_address, JMComicHandler)
+    start_task_maintenance()
     print(f'JMComic 下载器服务器启动在 http://{host}:{port}')
     print('注意：所有用户共享同一个下载目录')
     httpd.serve_forever()
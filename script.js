@@ -69,7 +69,11 @@ document.addEventListener('DOMContentLoaded', function() {
             return response.json();
         })
         .then(data => {
-            if (data.status === 'accepted') {
+            if (data.status === 'accepted' && data.task_id && window.EventSource) {
+                // 订阅任务进度，由服务器推送
+                status.textContent = data.message;
+                watchTask(data.task_id);
+            } else if (data.status === 'accepted') {
                 // 更新进度
                 status.textContent = '下载请求已接受，请稍后查看下载结果';
                 progress.style.width = '100%';
@@ -100,6 +104,64 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    function watchTask(taskId) {
+        const source = new EventSource(`/api/tasks/${encodeURIComponent(taskId)}/events`);
+
+        source.addEventListener('progress', function(event) {
+            const task = JSON.parse(event.data);
+            const p = task.progress;
+            if (task.status === 'queued') {
+                progress.style.width = '0%';
+                status.textContent = `排队中（第${task.queue_position}位）...`;
+                return;
+            }
+            if (!p || !p.images_total) {
+                status.textContent = task.message;
+                return;
+            }
+
+            const percent = Math.floor(p.images_done / p.images_total * 100);
+            progress.style.width = percent + '%';
+
+            let text = `已下载 ${p.images_done}/${p.images_total} 张`;
+            if (p.current_photo) {
+                text = `第${p.current_photo.index}章 · ` + text;
+            }
+            text += ` · ${formatBytes(p.bytes_per_second)}/s`;
+            if (p.eta_seconds !== null) {
+                text += ` · 剩余约 ${Math.ceil(p.eta_seconds)} 秒`;
+            }
+            status.textContent = text;
+        });
+
+        source.addEventListener('done', function(event) {
+            source.close();
+            const task = JSON.parse(event.data);
+            if (task.status === 'completed') {
+                progress.style.width = '100%';
+                progressSection.style.display = 'none';
+                resultMessage.textContent = task.message;
+                resultSection.style.display = 'block';
+            } else {
+                showError(task.message);
+            }
+        });
+
+        source.onerror = function() {
+            // 连接断开后EventSource会自动重连，任务不存在时停止
+            if (source.readyState === EventSource.CLOSED) {
+                status.textContent = '无法获取下载进度，请稍后在任务列表中查看';
+            }
+        };
+    }
+
+    function formatBytes(bytes) {
+        if (bytes >= 1024 * 1024) {
+            return (bytes / 1024 / 1024).toFixed(1) + ' MB';
+        }
+        return (bytes / 1024).toFixed(1) + ' KB';
+    }
+
     function showError(message) {
         hideAllSections();
         errorMessage.textContent = message;
@@ -1,4 +1,4 @@
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler
 import json
 import urllib.parse
 import os
@@ -10,128 +10,165 @@ project_path = os.path.dirname(os.path.abspath(__file__))
 jmcomic_path = os.path.join(project_path, 'JMComic-Crawler-Python-master', 'src')
 sys.path.insert(0, jmcomic_path)
 
+# 使用与app.py不同的任务数据库：两个服务同时运行时，启动时只恢复自己的未完成任务，不会重复下载同一个本子
+os.environ.setdefault('JM_TASK_DB', os.path.join(project_path, 'server_tasks.db'))
+
+# 与app.py共用任务队列和下载逻辑
+from app import (
+    JMComicHTTPServer,
+    UNFINISHED_STATUS,
+    cancel_task,
+    download_dir,
+    finish_task,
+    get_task_with_progress,
+    scheduler,
+    start_task_maintenance,
+    submit_download,
+    task_store,
+)
+
+
 class JMComicHandler(BaseHTTPRequestHandler):
     def do_GET(self):
-        if self.path == '/':
+        path = urllib.parse.urlparse(self.path).path
+
+        if path == '/':
             self.serve_file('index.html', 'text/html')
-        elif self.path == '/style.css':
+        elif path == '/style.css':
             self.serve_file('style.css', 'text/css')
-        elif self.path == '/script.js':
+        elif path == '/script.js':
             self.serve_file('script.js', 'application/javascript')
+        elif path.startswith('/jobs/') and path.endswith('/result'):
+            self.get_job_result(path[len('/jobs/'):-len('/result')])
+        elif path.startswith('/jobs/'):
+            self.get_job_status(path[len('/jobs/'):])
         else:
             self.send_error(404)
 
     def do_POST(self):
-        if self.path == '/download':
+        path = urllib.parse.urlparse(self.path).path
+
+        if path == '/download':
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
             data = urllib.parse.parse_qs(post_data.decode('utf-8'))
-            
+
             comic_id = data.get('comic_id', [''])[0]
-            
+
             if not comic_id:
                 self.send_error(400, 'Missing comic_id')
                 return
-            
-            # 执行下载
+
+            # 提交到下载队列，立即返回任务ID，不等待下载完成
             try:
-                # 尝试导入JMComic
-                try:
-                    import jmcomic
-                    jmcomic_available = True
-                except ImportError:
-                    jmcomic_available = False
-                
-                if jmcomic_available:
-                    # 使用真实的JMComic库下载
-                    result = self.download_with_jmcomic(comic_id)
-                else:
-                    # 模拟下载
-                    result = self.simulate_download(comic_id)
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                
-                self.wfile.write(json.dumps(result, ensure_ascii=False).encode('utf-8'))
-            except Exception as e:
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                
-                error_response = {
-                    'status': 'error',
-                    'message': str(e)
-                }
-                self.wfile.write(json.dumps(error_response, ensure_ascii=False).encode('utf-8'))
+                job_id, created = submit_download(comic_id)
+            except ValueError as e:
+                self.send_json({'status': 'error', 'message': str(e)}, 400)
+                return
+
+            self.send_json({
+                'status': 'accepted',
+                'job_id': job_id,
+                'deduplicated': not created,
+                'message': f'漫画 {comic_id} 已加入下载队列',
+                'status_url': f'/jobs/{job_id}',
+                'result_url': f'/jobs/{job_id}/result',
+            }, 202)
+        elif path.startswith('/jobs/') and path.endswith('/cancel'):
+            self.cancel_job(path[len('/jobs/'):-len('/cancel')])
         else:
             self.send_error(404)
 
-    def download_with_jmcomic(self, comic_id):
+    def get_job_status(self, job_id):
         """
-        使用真实的JMComic库下载
+        查询任务状态和实时进度
         """
-        try:
-            import jmcomic
-            
-            # 创建默认配置
-            option = jmcomic.JmOption.default()
-            
-            # 设置下载目录
-            download_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'downloads')
-            option.download_dir = download_dir
-            
-            # 设置客户端配置以提高稳定性
-            # 增加重试次数
-            option.retry_times = 3
-            # 设置超时时间
-            option.timeout = 10
-            
-            # 实际下载漫画
-            album = jmcomic.download_album(comic_id, option)
-            
-            return {
-                "status": "success",
-                "message": f"漫画 {comic_id} 下载完成",
-                "path": os.path.join(download_dir, str(comic_id))
-            }
-        except Exception as e:
-            # 提供更详细的错误信息
-            error_msg = str(e)
-            if "timeout" in error_msg.lower() or "connect" in error_msg.lower():
-                error_msg += "。请检查网络连接或尝试使用代理。"
-            elif "404" in error_msg:
-                error_msg += "。请检查漫画ID是否正确。"
-            else:
-                error_msg += "。这可能是由于网络问题或网站反爬机制导致的。"
-            
-            return {
-                "status": "error",
-                "message": f"下载失败: {error_msg}"
-            }
-
-    def simulate_download(self, comic_id):
+        job = get_task_with_progress(job_id)
+        if job is None:
+            self.send_json({'status': 'error', 'message': '任务不存在'}, 404)
+            return
+        self.send_json(job)
+
+    def get_job_result(self, job_id):
+        """
+        查询任务结果，任务未结束时返回202
         """
-        模拟下载过程
+        job = task_store.get(job_id)
+        if job is None:
+            self.send_json({'status': 'error', 'message': '任务不存在'}, 404)
+        elif job['status'] in UNFINISHED_STATUS:
+            self.send_json({'status': job['status'], 'message': job['message']}, 202)
+        elif job['status'] == 'completed':
+            self.send_json({
+                'status': 'success',
+                'message': job['message'],
+                'path': os.path.join(download_dir, job['path'] or ''),
+            })
+        else:
+            self.send_json({'status': 'error', 'message': explain_error(job['message'])})
+
+    def cancel_job(self, job_id):
         """
-        import time
-        import json
-        import os
-        
-        # 创建下载目录
-        download_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'downloads')
-        if not os.path.exists(download_dir):
-            os.makedirs(download_dir)
-        
+        取消任务，下载中的任务会在正在下载的图片完成后停止
+        """
+        job = task_store.get(job_id)
+        if job is None:
+            self.send_json({'status': 'error', 'message': '任务不存在'}, 404)
+        elif cancel_task(job_id):
+            self.send_json({'status': 'cancelled', 'message': '任务已取消'})
+        else:
+            self.send_json({'status': 'error', 'message': f'任务状态为 {job["status"]}，无法取消'}, 409)
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_file(self, filename, content_type):
+        try:
+            with open(filename, 'r', encoding='utf-8') as file:
+                content = file.read()
+
+            self.send_response(200)
+            self.send_header('Content-type', content_type)
+            self.end_headers()
+            self.wfile.write(content.encode('utf-8'))
+        except FileNotFoundError:
+            self.send_error(404)
+
+
+def explain_error(error_msg):
+    """
+    给下载失败的信息加上排查提示
+    """
+    if "timeout" in error_msg.lower() or "connect" in error_msg.lower():
+        error_msg += "。请检查网络连接或尝试使用代理。"
+    elif "404" in error_msg:
+        error_msg += "。请检查漫画ID是否正确。"
+    else:
+        error_msg += "。这可能是由于网络问题或网站反爬机制导致的。"
+    return error_msg
+
+
+def simulate_download(comic_id, task_id):
+    """
+    模拟下载过程，在没有安装JMComic库时代替真实下载
+    """
+    try:
+        task_store.update(task_id, status='downloading', message='正在下载漫画（模拟）...')
+
         # 创建漫画目录
         comic_dir = os.path.join(download_dir, comic_id)
         if not os.path.exists(comic_dir):
             os.makedirs(comic_dir)
-        
+
         # 模拟下载时间
         time.sleep(2)
-        
+
         # 创建模拟数据
         comic_info = {
             "id": comic_id,
@@ -143,36 +180,33 @@ class JMComicHandler(BaseHTTPRequestHandler):
                 {"id": f"{comic_id}_002", "title": "第二章"}
             ]
         }
-        
+
         # 保存漫画信息
         info_file = os.path.join(comic_dir, "info.json")
         with open(info_file, 'w', encoding='utf-8') as f:
             json.dump(comic_info, f, ensure_ascii=False, indent=2)
-        
-        return {
-            "status": "success",
-            "message": f"漫画 {comic_id} 下载完成（模拟）",
-            "path": comic_dir
-        }
 
-    def serve_file(self, filename, content_type):
-        try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                content = file.read()
-            
-            self.send_response(200)
-            self.send_header('Content-type', content_type)
-            self.end_headers()
-            self.wfile.write(content.encode('utf-8'))
-        except FileNotFoundError:
-            self.send_error(404)
+        task_store.update(task_id, status='completed', message=f'漫画 {comic_id} 下载完成（模拟）', path=comic_id)
+    except Exception as e:
+        task_store.update(task_id, status='failed', message=f'下载失败: {str(e)}')
+    finally:
+        finish_task(comic_id, task_id)
+
 
 def run_server():
+    # 尝试导入JMComic，不可用时使用模拟下载
+    try:
+        import jmcomic
+    except ImportError:
+        scheduler.runner = simulate_download
+        print('未找到JMComic库，将使用模拟下载')
+
     server_address = ('', 8000)
-    httpd = HTTPServer(server_address, JMComicHandler)
+    httpd = JMComicHTTPServer(server_address, JMComicHandler)
+    start_task_maintenance()
     print('JMComic 下载器服务器启动在 http://localhost:8000')
     print('如果遇到网络问题，请查看 README.md 中的网络问题解决方案部分')
     httpd.serve_forever()
 
 if __name__ == '__main__':
-    run_server()
\ No newline at end of file
+    run_server()